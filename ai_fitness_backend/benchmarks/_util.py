@@ -0,0 +1,13 @@
+"""Helpers shared by the benchmark scripts."""
+
+import time
+
+
+def time_call(fn, repeats):
+    """Return the best wall-clock time of fn over repeats runs"""
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
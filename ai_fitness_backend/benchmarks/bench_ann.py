@@ -0,0 +1,67 @@
+"""Benchmark the IVF approximate index against exact retrieval.
+
+Builds an IVF index over synthetic clustered embeddings for each corpus size
+and reports build time, recall@k against the exact path and query latency.
+
+Usage: python benchmarks/bench_ann.py --sizes 100000 1000000 --nprobe 16
+"""
+
+import argparse
+import time
+import numpy as np
+
+from ai_fitness_backend.ann import IVFIndex
+from ai_fitness_backend.index import normalize_embeddings, select_top_k
+
+
+def clustered_embeddings(rng, size, dim, clusters=2000):
+    """Random embeddings grouped around topic centres, like real document embeddings"""
+    centres = rng.standard_normal((clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, clusters, size)
+    noise = rng.standard_normal((size, dim), dtype=np.float32) * 0.6
+    return normalize_embeddings(centres[labels] + noise)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=7)
+    parser.add_argument("--nprobe", type=int, default=16)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(
+        f"{'documents':>10} {'build (s)':>10} {'recall@k':>9} "
+        f"{'exact (ms)':>11} {'ivf (ms)':>9}"
+    )
+    for size in args.sizes:
+        embeddings = clustered_embeddings(rng, size, args.dim)
+        queries = embeddings[rng.choice(size, args.queries, replace=False)]
+
+        start = time.perf_counter()
+        index = IVFIndex.build(embeddings, np.arange(size), nprobe=args.nprobe)
+        build_time = time.perf_counter() - start
+
+        hits = 0
+        exact_time = ivf_time = 0.0
+        for query in queries:
+            start = time.perf_counter()
+            exact = select_top_k(embeddings @ query, args.top_k)
+            exact_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            approximate, _ = index.search(query, args.top_k)
+            ivf_time += time.perf_counter() - start
+
+            hits += len(np.intersect1d(exact, approximate))
+
+        print(
+            f"{size:>10} {build_time:>10.1f} {hits / (len(queries) * args.top_k):>9.3f} "
+            f"{exact_time / len(queries) * 1000:>11.2f} {ivf_time / len(queries) * 1000:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
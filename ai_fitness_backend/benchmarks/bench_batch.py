@@ -0,0 +1,60 @@
+"""Benchmark batched retrieval against one query at a time.
+
+Scores a batch of query embeddings against a synthetic corpus either with one
+matrix-vector product per query, as separate /api/search requests do, or with
+the single matrix-matrix product used by /api/query/batch, and reports the
+queries answered per second.
+
+Usage: python benchmarks/bench_batch.py --sizes 10000 100000 --batch-sizes 1 16 64
+"""
+
+import argparse
+import numpy as np
+
+from ai_fitness_backend.index import normalize_embeddings, select_top_k
+
+from _util import time_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 16, 64])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=7)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(
+        f"{'documents':>10} {'batch':>6} {'single (q/s)':>13} {'batched (q/s)':>14} {'speedup':>8} {'same':>5}"
+    )
+    for size in args.sizes:
+        embeddings = normalize_embeddings(
+            rng.standard_normal((size, args.dim), dtype=np.float32)
+        )
+        for batch_size in args.batch_sizes:
+            queries = normalize_embeddings(
+                rng.standard_normal((batch_size, args.dim), dtype=np.float32)
+            )
+
+            def single():
+                return [
+                    select_top_k(embeddings @ query, args.top_k) for query in queries
+                ]
+
+            def batched():
+                scores = queries @ embeddings.T
+                return [select_top_k(row, args.top_k) for row in scores]
+
+            single_time = time_call(single, args.repeats)
+            batched_time = time_call(batched, args.repeats)
+            same = all(np.array_equal(a, b) for a, b in zip(single(), batched()))
+            print(
+                f"{size:>10} {batch_size:>6} {batch_size / single_time:>13.0f} "
+                f"{batch_size / batched_time:>14.0f} {single_time / batched_time:>7.1f}x {str(same):>5}"
+            )
+
+
+if __name__ == "__main__":
+    main()
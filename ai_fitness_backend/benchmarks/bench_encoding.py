@@ -0,0 +1,63 @@
+"""Benchmark encoding documents with the embedding model.
+
+Compares one model.encode() call over the whole corpus with the default batch
+size, as the processor used to do, against encode_documents with length-sorted
+blocks, a configurable batch size and an optional pool of encoding processes.
+Documents mimic the generated ones: a mix of short measurement documents and
+long nutrition and exercise days.
+
+Usage: python benchmarks/bench_encoding.py --documents 5000 --batch-sizes 32 64 128 --workers 1 4
+"""
+
+import argparse
+import time
+import numpy as np
+
+from ai_fitness_backend.embeddings import encode_documents, get_embedding_model
+
+
+def make_texts(count, rng):
+    """Documents of varied length, shuffled like a real corpus"""
+    meals = ["Breakfast", "Lunch", "Dinner", "Snacks"]
+    texts = []
+    for i in range(count):
+        if i % 3 == 0:
+            texts.append(f"Date: 2024-01-{i % 28 + 1:02d}. Weight measurement: 81.2.")
+        else:
+            parts = [
+                f"{meal}: {rng.integers(100, 900)} calories, {rng.integers(5, 60)}g protein."
+                for meal in meals[: rng.integers(1, 5)]
+            ]
+            texts.append(f"Date: 2024-01-{i % 28 + 1:02d}. " + " ".join(parts * 3))
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--documents", type=int, default=5_000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1])
+    args = parser.parse_args()
+
+    model = get_embedding_model()
+    texts = make_texts(args.documents, np.random.default_rng(0))
+
+    start = time.perf_counter()
+    model.encode(texts)
+    baseline = time.perf_counter() - start
+    print(f"single encode() call: {baseline:.2f}s")
+
+    print(f"{'batch':>6} {'workers':>8} {'time (s)':>9} {'speedup':>8}")
+    for workers in args.workers:
+        for batch_size in args.batch_sizes:
+            start = time.perf_counter()
+            for _ in encode_documents(texts, model, batch_size, workers):
+                pass
+            elapsed = time.perf_counter() - start
+            print(
+                f"{batch_size:>6} {workers:>8} {elapsed:>9.2f} {baseline / elapsed:>7.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
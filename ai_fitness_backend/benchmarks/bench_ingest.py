@@ -0,0 +1,95 @@
+"""Benchmark writing documents and embeddings to the database.
+
+Compares the previous ORM path (one add() per document, a commit for the ids,
+then one add() per embedding) with the bulk insert path used by
+store_documents_in_db. Runs against DATABASE_URL, so point it at a scratch
+database: every run clears the documents and embeddings tables.
+
+Usage: DATABASE_URL=postgresql://... python benchmarks/bench_ingest.py --sizes 1000 10000
+"""
+
+import argparse
+import time
+import numpy as np
+
+from ai_fitness_backend.database import (
+    Document,
+    Embedding,
+    SessionLocal,
+    create_tables,
+    insert_documents,
+    insert_embeddings,
+)
+from ai_fitness_backend.lexical import delete_document_terms
+
+
+def clear(db):
+    db.query(Embedding).delete()
+    delete_document_terms(db)
+    db.query(Document).delete()
+    db.commit()
+
+
+def orm_path(db, documents, embeddings):
+    """The per-object ORM writes store_documents_in_db used before"""
+    db_documents = []
+    for doc in documents:
+        db_doc = Document(**doc)
+        db.add(db_doc)
+        db_documents.append(db_doc)
+    db.commit()
+
+    for doc, embedding in zip(db_documents, embeddings):
+        db.add(Embedding(document_id=doc.id, embedding=embedding.tobytes()))
+    db.commit()
+
+
+def bulk_path(db, documents, embeddings):
+    """The bulk insert path"""
+    document_ids = insert_documents(db, documents)
+    insert_embeddings(db, document_ids, embeddings)
+    db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000])
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args()
+
+    create_tables()
+    rng = np.random.default_rng(0)
+
+    print(f"{'documents':>10} {'orm (s)':>9} {'bulk (s)':>9} {'speedup':>8}")
+    for size in args.sizes:
+        documents = [
+            {
+                "text": f"Date: 2024-01-01. Document {i}. " * 20,
+                "type": "nutrition",
+                "date": "2024-01-01",
+                "content_hash": f"{i:064x}",
+            }
+            for i in range(size)
+        ]
+        embeddings = rng.standard_normal((size, args.dim), dtype=np.float32)
+
+        timings = []
+        for path in (orm_path, bulk_path):
+            db = SessionLocal()
+            try:
+                clear(db)
+                start = time.perf_counter()
+                path(db, documents, embeddings)
+                timings.append(time.perf_counter() - start)
+                clear(db)
+            finally:
+                db.close()
+
+        orm_time, bulk_time = timings
+        print(
+            f"{size:>10} {orm_time:>9.2f} {bulk_time:>9.2f} {orm_time / bulk_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
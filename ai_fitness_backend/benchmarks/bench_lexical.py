@@ -0,0 +1,78 @@
+"""Benchmark BM25 lookups and hybrid scoring against corpora of increasing size.
+
+Builds synthetic day documents, then times an exact-date query through the
+inverted index alone and through the fused dense plus lexical scoring used by
+retrieve_relevant_documents, and checks that the fused ranking puts the
+matching day first.
+
+Usage: python benchmarks/bench_lexical.py --sizes 10000 100000
+"""
+
+import argparse
+import time
+from datetime import date, timedelta
+import numpy as np
+
+from ai_fitness_backend.index import normalize_embeddings, select_top_k
+from ai_fitness_backend.lexical import LexicalIndex, fuse_scores
+
+from _util import time_call
+
+MEALS = ["Breakfast", "Lunch", "Dinner", "Snacks"]
+
+
+def make_texts(size, rng):
+    """One nutrition-style document per day, starting 2000-01-01"""
+    start = date(2000, 1, 1)
+    calories = rng.integers(100, 900, size=(size, len(MEALS)))
+    return [
+        f"Date: {(start + timedelta(days=i)).isoformat()}. Nutrition summary: "
+        + " ".join(f"{meal}: Calories {c}." for meal, c in zip(MEALS, calories[i]))
+        for i in range(size)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=7)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(
+        f"{'documents':>10} {'build (s)':>10} {'bm25 (ms)':>10} {'hybrid (ms)':>12} {'date hit':>9}"
+    )
+    for size in args.sizes:
+        texts = make_texts(size, rng)
+        embeddings = normalize_embeddings(
+            rng.standard_normal((size, args.dim), dtype=np.float32)
+        )
+        query_embedding = normalize_embeddings(
+            rng.standard_normal(args.dim).astype(np.float32)
+        )
+        target = size // 2
+        query = f"what did I eat on {texts[target][6:16]}"
+
+        start = time.perf_counter()
+        index = LexicalIndex.from_texts(texts)
+        build_time = time.perf_counter() - start
+
+        def lexical():
+            return index.search(query)
+
+        def hybrid():
+            scores = fuse_scores(embeddings @ query_embedding, *index.search(query))
+            return select_top_k(scores, args.top_k)
+
+        lexical_time = time_call(lexical, args.repeats)
+        hybrid_time = time_call(hybrid, args.repeats)
+        print(
+            f"{size:>10} {build_time:>10.2f} {lexical_time * 1000:>10.2f} "
+            f"{hybrid_time * 1000:>12.2f} {str(hybrid()[0] == target):>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Benchmark top-k retrieval against corpora of increasing size.
+
+Compares the previous path (sklearn cosine_similarity plus a full argsort)
+with the pre-normalized float32 matrix, a single dot product and argpartition.
+
+Usage: python benchmarks/bench_retrieval.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import numpy as np
+
+from ai_fitness_backend.index import normalize_embeddings, select_top_k
+
+from _util import time_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--top-k", type=int, default=7)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        from sklearn.metrics.pairwise import cosine_similarity
+    except ImportError:
+        cosine_similarity = None
+        print("scikit-learn not installed, skipping the previous path")
+
+    rng = np.random.default_rng(0)
+    query = rng.standard_normal(args.dim).astype(np.float32)
+    normalized_query = normalize_embeddings(query)
+
+    print(
+        f"{'documents':>10} {'previous (ms)':>14} {'current (ms)':>13} {'speedup':>8}"
+    )
+    for size in args.sizes:
+        embeddings = rng.standard_normal((size, args.dim), dtype=np.float32)
+        normalized = normalize_embeddings(embeddings)
+
+        def current():
+            return select_top_k(normalized @ normalized_query, args.top_k)
+
+        current_time = time_call(current, args.repeats)
+
+        if cosine_similarity is not None:
+
+            def previous():
+                similarities = cosine_similarity([query], embeddings)[0]
+                return np.argsort(similarities)[-args.top_k :][::-1]
+
+            assert set(previous()) == set(current())
+            previous_time = time_call(previous, args.repeats)
+            print(
+                f"{size:>10} {previous_time * 1000:>14.2f} {current_time * 1000:>13.2f} "
+                f"{previous_time / current_time:>7.1f}x"
+            )
+        else:
+            print(f"{size:>10} {'-':>14} {current_time * 1000:>13.2f} {'-':>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+import io
+import os
+import time
+import logging
+import numpy as np
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from .database import AnnIndex
+from .users import DEFAULT_USER_ID
+
+# Set up logging
+logger = logging.getLogger("ai_fitness_api.ann")
+
+# Load environment variables
+load_dotenv()
+
+# Approximate nearest-neighbour configuration
+RETRIEVAL_INDEX_BACKEND = os.getenv("RETRIEVAL_INDEX_BACKEND", "exact").lower()
+ANN_MIN_DOCUMENTS = int(os.getenv("ANN_MIN_DOCUMENTS", "10000"))
+ANN_NLIST = int(os.getenv("ANN_NLIST", "0"))  # 0 picks sqrt(N) lists
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "16"))
+# Share of the corpus that incremental ingests may add or re-embed after the
+# centroids were trained before the index is retrained from scratch
+ANN_RETRAIN_FRACTION = float(os.getenv("ANN_RETRAIN_FRACTION", "0.2"))
+
+# Rows scored per step when assigning vectors to centroids, to bound memory
+ASSIGN_CHUNK_SIZE = 65536
+
+
+def _assign(embeddings, centroids):
+    """Return the index of the closest centroid for every row"""
+    assignments = np.empty(len(embeddings), dtype=np.int32)
+    for start in range(0, len(embeddings), ASSIGN_CHUNK_SIZE):
+        chunk = embeddings[start : start + ASSIGN_CHUNK_SIZE]
+        assignments[start : start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """Inverted file index: vectors are bucketed by their nearest k-means centroid"""
+
+    def __init__(
+        self,
+        centroids,
+        list_offsets,
+        list_members,
+        document_ids,
+        nprobe,
+        trained_count=None,
+        assigned_count=0,
+    ):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_members = list_members
+        self.document_ids = document_ids
+        self.nprobe = nprobe
+        # Rows the centroids were trained over, and rows assigned to them since
+        self.trained_count = (
+            len(document_ids) if trained_count is None else trained_count
+        )
+        self.assigned_count = assigned_count
+        self.embeddings = None
+        self.recall = None
+
+    @classmethod
+    def build(cls, embeddings, document_ids, nlist=None, nprobe=None, iterations=10):
+        """Train spherical k-means centroids on normalized embeddings and bucket every row"""
+        start_time = time.time()
+        count = len(embeddings)
+        nlist = min(count, nlist or ANN_NLIST or max(1, int(np.sqrt(count))))
+        rng = np.random.default_rng(0)
+
+        # Train on a sample, which is plenty to place the centroids
+        sample_size = min(count, nlist * 64)
+        sample = embeddings[rng.choice(count, sample_size, replace=False)]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignments = _assign(sample, centroids)
+            sizes = np.bincount(assignments, minlength=nlist)
+            starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+            order = np.argsort(assignments, kind="stable")
+            sums = np.zeros_like(centroids)
+            nonempty = sizes > 0
+            sums[nonempty] = np.add.reduceat(sample[order], starts[nonempty], axis=0)
+
+            # Re-seed empty lists from random sample points
+            empty = ~nonempty
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = (sums / norms).astype(np.float32)
+
+        assignments = _assign(embeddings, centroids)
+        list_members = np.argsort(assignments, kind="stable").astype(np.int64)
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=nlist), out=list_offsets[1:])
+
+        index = cls(
+            centroids,
+            list_offsets,
+            list_members,
+            np.asarray(document_ids, dtype=np.int64),
+            nprobe or ANN_NPROBE,
+        )
+        index.embeddings = embeddings
+        logger.info(
+            f"Built IVF index with {nlist} lists over {count} embeddings in {time.time() - start_time:.2f} seconds"
+        )
+        return index
+
+    @property
+    def needs_retraining(self):
+        """Whether so much of the corpus was assigned since training that the centroids may no longer fit it"""
+        return self.assigned_count > ANN_RETRAIN_FRACTION * self.trained_count
+
+    def updated(self, document_ids, changed_ids, changed_embeddings):
+        """Return an index over ``document_ids`` that reuses these centroids
+
+        Documents already in this index keep their lists; the sorted ``changed_ids``,
+        new or re-embedded documents, are assigned to their closest centroid.
+        ``document_ids`` must be sorted, as they are when loaded by id.
+        """
+        document_ids = np.asarray(document_ids, dtype=np.int64)
+        changed_ids = np.asarray(changed_ids, dtype=np.int64)
+        nlist = len(self.centroids)
+
+        previous = np.empty(len(self.document_ids), dtype=np.int64)
+        previous[self.list_members] = np.repeat(
+            np.arange(nlist), np.diff(self.list_offsets)
+        )
+        kept = ~np.isin(document_ids, changed_ids)
+        slots = np.searchsorted(self.document_ids, document_ids[kept])
+        if len(slots) and (
+            slots.max() >= len(self.document_ids)
+            or not np.array_equal(self.document_ids[slots], document_ids[kept])
+        ):
+            raise ValueError("Unchanged documents are missing from the index")
+
+        assignments = np.empty(len(document_ids), dtype=np.int64)
+        assignments[kept] = previous[slots]
+        if len(changed_ids):
+            assignments[np.searchsorted(document_ids, changed_ids)] = _assign(
+                changed_embeddings, self.centroids
+            )
+
+        list_offsets = np.zeros(nlist + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=nlist), out=list_offsets[1:])
+        return IVFIndex(
+            self.centroids,
+            list_offsets,
+            np.argsort(assignments, kind="stable").astype(np.int64),
+            document_ids,
+            self.nprobe,
+            self.trained_count,
+            self.assigned_count + len(changed_ids),
+        )
+
+    def search(self, query_embedding, top_k=5):
+        """Return (indices, scores) of the top_k rows among the nprobe closest lists"""
+        centroid_scores = self.centroids @ query_embedding
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(centroid_scores, -nprobe)[-nprobe:]
+
+        candidates = np.concatenate(
+            [
+                self.list_members[self.list_offsets[p] : self.list_offsets[p + 1]]
+                for p in probes
+            ]
+        )
+        scores = self.embeddings[candidates] @ query_embedding
+
+        if top_k < len(scores):
+            top = np.argpartition(scores, -top_k)[-top_k:]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(scores[top])[::-1]]
+        return candidates[top], scores[top]
+
+    def measure_recall(self, top_k=10, sample_size=200):
+        """Mean recall@top_k of the IVF search against the exact search, using corpus rows as queries"""
+        rng = np.random.default_rng(1)
+        count = len(self.embeddings)
+        top_k = min(top_k, count)
+        queries = rng.choice(count, min(count, sample_size), replace=False)
+
+        hits = 0
+        for row in queries:
+            query_embedding = self.embeddings[row]
+            exact_scores = self.embeddings @ query_embedding
+            exact = np.argpartition(exact_scores, -top_k)[-top_k:]
+            approximate, _ = self.search(query_embedding, top_k)
+            hits += len(np.intersect1d(exact, approximate))
+
+        self.recall = hits / (len(queries) * top_k)
+        return self.recall
+
+    def to_bytes(self):
+        """Serialize the index structure (not the embeddings) to bytes"""
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            centroids=self.centroids,
+            list_offsets=self.list_offsets,
+            list_members=self.list_members,
+            document_ids=self.document_ids,
+            nprobe=np.array(self.nprobe),
+            trained_count=np.array(self.trained_count),
+            assigned_count=np.array(self.assigned_count),
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Deserialize an index created by to_bytes"""
+        arrays = np.load(io.BytesIO(data))
+        # Indexes persisted before incremental updates count as freshly trained
+        counts = {
+            name: int(arrays[name])
+            for name in ("trained_count", "assigned_count")
+            if name in arrays.files
+        }
+        return cls(
+            arrays["centroids"],
+            arrays["list_offsets"],
+            arrays["list_members"],
+            arrays["document_ids"],
+            int(arrays["nprobe"]),
+            **counts,
+        )
+
+
+def ann_enabled(document_count):
+    """Whether the configured backend calls for an ANN index over this many documents"""
+    return RETRIEVAL_INDEX_BACKEND == "ivf" and document_count >= ANN_MIN_DOCUMENTS
+
+
+def clear_ann_index(db: Session, user_id=DEFAULT_USER_ID):
+    """Remove a user's persisted ANN index"""
+    db.query(AnnIndex).filter(AnnIndex.user_id == user_id).delete()
+
+
+def build_ann_index(db: Session, document_ids, embeddings, user_id=DEFAULT_USER_ID):
+    """Build the configured ANN index for a user's corpus and persist it, replacing any previous one"""
+    clear_ann_index(db, user_id)
+    if not ann_enabled(len(document_ids)):
+        logger.info("ANN index disabled for this corpus, using exact retrieval")
+        return None
+
+    logger.info(f"Building IVF index for {len(document_ids)} documents")
+    try:
+        index = IVFIndex.build(embeddings, document_ids)
+        recall = index.measure_recall()
+        logger.info(f"IVF index recall@10 against exact retrieval: {recall:.3f}")
+        db.add(
+            AnnIndex(
+                user_id=user_id,
+                backend="ivf",
+                document_count=len(document_ids),
+                recall=recall,
+                data=index.to_bytes(),
+            )
+        )
+    except Exception as e:
+        logger.error(f"Error building ANN index: {str(e)}")
+        raise
+
+    return index
+
+
+def update_ann_index(
+    db: Session, document_ids, changed_ids, changed_embeddings, user_id=DEFAULT_USER_ID
+):
+    """Update a user's persisted ANN index after an incremental ingest, without retraining
+
+    New and changed documents are assigned to the existing centroids. Returns the
+    updated index, or None if there is no index to update or its centroids are
+    due for retraining, in which case the caller rebuilds it.
+    """
+    row = (
+        db.query(AnnIndex)
+        .filter(AnnIndex.user_id == user_id)
+        .order_by(AnnIndex.id.desc())
+        .first()
+    )
+    if row is None or row.backend != "ivf":
+        return None
+
+    try:
+        index = IVFIndex.from_bytes(row.data).updated(
+            document_ids, changed_ids, changed_embeddings
+        )
+    except ValueError as e:
+        logger.warning(f"Persisted IVF index cannot be updated: {str(e)}")
+        return None
+    if index.needs_retraining:
+        logger.info(
+            f"{index.assigned_count} documents assigned since the IVF index was trained over {index.trained_count}, retraining"
+        )
+        return None
+
+    index.recall = row.recall
+    clear_ann_index(db, user_id)
+    db.add(
+        AnnIndex(
+            user_id=user_id,
+            backend="ivf",
+            document_count=len(document_ids),
+            # Measured when the centroids were trained
+            recall=row.recall,
+            data=index.to_bytes(),
+        )
+    )
+    logger.info(
+        f"Assigned {len(changed_ids)} documents to the existing IVF index of {len(document_ids)}"
+    )
+    return index
+
+
+def load_ann_index(db: Session, document_ids, embeddings, user_id=DEFAULT_USER_ID):
+    """Load a user's persisted ANN index for these documents, rebuilding it if it is missing or stale"""
+    if not ann_enabled(len(document_ids)):
+        return None
+
+    row = (
+        db.query(AnnIndex)
+        .filter(AnnIndex.user_id == user_id)
+        .order_by(AnnIndex.id.desc())
+        .first()
+    )
+    if row is not None and row.backend == "ivf":
+        index = IVFIndex.from_bytes(row.data)
+        if np.array_equal(index.document_ids, document_ids):
+            index.embeddings = embeddings
+            index.recall = row.recall
+            logger.info(f"Loaded persisted IVF index (recall@10 {row.recall:.3f})")
+            return index
+
+    logger.warning("Persisted IVF index missing or stale, rebuilding in memory")
+    index = IVFIndex.build(embeddings, document_ids)
+    logger.info(
+        f"IVF index recall@10 against exact retrieval: {index.measure_recall():.3f}"
+    )
+    return index
@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+from dotenv import load_dotenv
+
+from .database import CachedAnswer, SessionLocal
+from .users import DEFAULT_USER_ID
+
+# Set up logging
+logger = logging.getLogger("ai_fitness_api.answer_cache")
+
+# Load environment variables
+load_dotenv()
+
+# Answer cache configuration
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1000"))  # 0 disables
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "86400"))
+# Cosine similarity above which a different phrasing reuses a cached answer;
+# above 1 disables the semantic tier
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_PERSIST = os.getenv("ANSWER_CACHE_PERSIST", "false").lower() == "true"
+
+
+def context_key(
+    model, system_role, top_k, corpus_version, filters, user_id=DEFAULT_USER_ID
+):
+    """Hash everything besides the query text that shapes an answer
+
+    ``filters`` holds the explicit date/type filters, any relative window parsed
+    from the query and the dates and numbers it names, so "last week" and "last
+    month", or "on 2024-01-05" and "on 2024-01-06", never share answers.
+    The user is part of the key so users never see each other's answers.
+    """
+    key = json.dumps(
+        [user_id, model, system_role, top_k, corpus_version, filters], default=str
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+class CacheEntry:
+    """A cached answer and the query embedding used for semantic matches"""
+
+    def __init__(self, context, query, embedding, answer, created):
+        self.context = context
+        self.query = query
+        self.embedding = embedding
+        self.answer = answer
+        self.created = created
+
+
+class AnswerCache:
+    """Two-tier LRU cache of LLM answers with a TTL
+
+    The exact tier matches the query text within a context key; the semantic tier
+    returns the answer of the most similar cached query with the same context key
+    if its embedding is close enough. Entries can be persisted to the database so
+    they survive restarts.
+    """
+
+    def __init__(
+        self,
+        max_size=ANSWER_CACHE_SIZE,
+        ttl=ANSWER_CACHE_TTL_SECONDS,
+        similarity=ANSWER_CACHE_SIMILARITY,
+        persist=ANSWER_CACHE_PERSIST,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity = similarity
+        self.persist = persist
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        # (context, query) -> CacheEntry, least recently used first
+        self._entries = OrderedDict()
+        # (user, corpus version) pairs whose persisted answers were loaded
+        self._loaded_versions = set()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        """Whether answers are cached at all"""
+        return self.max_size > 0
+
+    def get(self, context, query, embedding, corpus_version, user_id=DEFAULT_USER_ID):
+        """Return a cached answer for the query, or None"""
+        if not self.enabled:
+            return None
+        self._load_persisted(corpus_version, user_id)
+
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get((context, query))
+            if entry is not None and not self._expired(entry, now):
+                self._entries.move_to_end((context, query))
+                self.exact_hits += 1
+                logger.info(f"Exact answer cache hit for: {query[:50]}")
+                return entry.answer
+
+            entry = self._closest(context, embedding, now)
+            if entry is not None:
+                self._entries.move_to_end((entry.context, entry.query))
+                self.semantic_hits += 1
+                logger.info(
+                    f"Semantic answer cache hit for: {query[:50]} (cached: {entry.query[:50]})"
+                )
+                return entry.answer
+
+            self.misses += 1
+            return None
+
+    def put(
+        self, context, query, embedding, answer, corpus_version, user_id=DEFAULT_USER_ID
+    ):
+        """Cache an answer, persisting it if enabled"""
+        if not self.enabled:
+            return
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            self._add(CacheEntry(context, query, embedding, answer, time.time()))
+
+        if self.persist and corpus_version is not None:
+            db = SessionLocal()
+            try:
+                db.add(
+                    CachedAnswer(
+                        user_id=user_id,
+                        corpus_version=corpus_version,
+                        context_key=context,
+                        query=query,
+                        query_embedding=embedding.tobytes(),
+                        answer=answer,
+                    )
+                )
+                db.commit()
+            except Exception as e:
+                logger.warning(f"Error persisting cached answer: {str(e)}")
+                db.rollback()
+            finally:
+                db.close()
+
+    def stats(self):
+        """Return the cache size and hit/miss counters"""
+        with self._lock:
+            total = self.exact_hits + self.semantic_hits + self.misses
+            hits = self.exact_hits + self.semantic_hits
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+            }
+
+    def _expired(self, entry, now):
+        """Whether an entry has outlived the TTL"""
+        return now - entry.created > self.ttl
+
+    def _add(self, entry):
+        """Insert an entry, evicting expired and then least recently used entries"""
+        self._entries[(entry.context, entry.query)] = entry
+        self._entries.move_to_end((entry.context, entry.query))
+        if len(self._entries) > self.max_size:
+            now = time.time()
+            for key in [k for k, e in self._entries.items() if self._expired(e, now)]:
+                del self._entries[key]
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _closest(self, context, embedding, now):
+        """Return the live entry with this context most similar to the query, if close enough"""
+        if embedding is None or self.similarity > 1:
+            return None
+        candidates = [
+            entry
+            for entry in self._entries.values()
+            if entry.context == context and not self._expired(entry, now)
+        ]
+        if not candidates:
+            return None
+
+        # Embeddings are normalized, so the dot product is the cosine similarity
+        scores = np.stack([entry.embedding for entry in candidates]) @ embedding
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        return candidates[best]
+
+    def _load_persisted(self, corpus_version, user_id=DEFAULT_USER_ID):
+        """Load a user's persisted answers for a corpus version the first time it is seen"""
+        if not self.persist or corpus_version is None:
+            return
+        with self._lock:
+            if (user_id, corpus_version) in self._loaded_versions:
+                return
+            self._loaded_versions.add((user_id, corpus_version))
+
+        cutoff = datetime.utcfromtimestamp(time.time() - self.ttl)
+        db = SessionLocal()
+        try:
+            # Answers for the user's other corpus versions or past their TTL are
+            # never served again
+            db.query(CachedAnswer).filter(
+                CachedAnswer.user_id == user_id,
+                (CachedAnswer.corpus_version != corpus_version)
+                | (CachedAnswer.created_at < cutoff),
+            ).delete(synchronize_session=False)
+            db.commit()
+            rows = (
+                db.query(CachedAnswer)
+                .filter(
+                    CachedAnswer.user_id == user_id,
+                    CachedAnswer.corpus_version == corpus_version,
+                )
+                .order_by(CachedAnswer.created_at.desc())
+                .limit(self.max_size)
+                .all()
+            )
+        except Exception as e:
+            logger.warning(f"Error loading persisted answers: {str(e)}")
+            db.rollback()
+            return
+        finally:
+            db.close()
+
+        epoch = datetime(1970, 1, 1)
+        with self._lock:
+            # Oldest first, so the newest answers end up most recently used
+            for row in reversed(rows):
+                if (row.context_key, row.query) in self._entries:
+                    continue
+                self._add(
+                    CacheEntry(
+                        row.context_key,
+                        row.query,
+                        np.frombuffer(row.query_embedding, dtype=np.float32),
+                        row.answer,
+                        (row.created_at - epoch).total_seconds(),
+                    )
+                )
+        logger.info(
+            f"Loaded {len(rows)} persisted answers of user {user_id} into the answer cache"
+        )
+
+
+# Process-wide answer cache
+answer_cache = AnswerCache()
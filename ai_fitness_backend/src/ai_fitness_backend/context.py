@@ -0,0 +1,303 @@
+import os
+import re
+import math
+import logging
+import threading
+from datetime import date
+from dotenv import load_dotenv
+
+# Set up logging
+logger = logging.getLogger("ai_fitness_api.context")
+
+# Load environment variables
+load_dotenv()
+
+# Prompt tokens available for retrieved documents
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1536"))
+# Characters per token assumed when the model's tokenizer cannot be loaded
+CHARS_PER_TOKEN = 4
+
+CONTEXT_HEADER = "Based on the following fitness and nutrition data:\n\n"
+
+# Day documents that can be merged into one table, keyed by document type: the
+# table title, its columns and a pattern pulling the day's totals out of the text.
+# Rows keep the totals and drop the per-meal and per-activity breakdowns that the
+# totals already summarize.
+TABLE_FORMATS = {
+    "nutrition": (
+        "Nutrition by day",
+        ["Calories", "Protein (g)", "Carbs (g)", "Fat (g)"],
+        re.compile(
+            r"Total calories: (\S+), Protein: (\S+?)g, Carbs: (\S+?)g, Fat: (\S+?)g\."
+        ),
+    ),
+    "exercise": (
+        "Exercise by day",
+        ["Calories burned", "Minutes", "Steps"],
+        re.compile(
+            r"Burned (\S+) calories, Exercised for (\S+) minutes, Steps: (\S+?)\.(?:\s|$)"
+        ),
+    ),
+    "measurement": (
+        "Weight by day",
+        ["Weight (kg)"],
+        re.compile(r"Weight (\S+) kg\."),
+    ),
+}
+
+# LLMs whose tokenizers may be loaded, comma-separated; token counts for any other
+# model are estimated, so a request naming an arbitrary model never triggers a
+# download
+TOKENIZER_MODELS = [
+    name.strip()
+    for name in os.getenv(
+        "TOKENIZER_MODELS", "mistralai/Mistral-7B-Instruct-v0.2"
+    ).split(",")
+    if name.strip()
+]
+
+# Process-wide tokenizer registry, keyed by model name and bounded by
+# TOKENIZER_MODELS; None marks a model whose tokenizer could not be loaded
+_tokenizers = {}
+# Model name -> event set once its tokenizer has been loaded or has failed to
+_tokenizers_loading = {}
+_tokenizers_lock = threading.Lock()
+
+
+def get_tokenizer(model):
+    """Return the tokenizer of an LLM, or None if it is not configured or cannot be loaded"""
+    if model in _tokenizers:
+        return _tokenizers[model]
+    if model not in TOKENIZER_MODELS:
+        return None
+
+    with _tokenizers_lock:
+        if model in _tokenizers:
+            return _tokenizers[model]
+        loading = _tokenizers_loading.get(model)
+        if loading is None:
+            loading = _tokenizers_loading[model] = threading.Event()
+            loader = True
+        else:
+            loader = False
+
+    # Load outside the lock so other models' lookups are not held up; concurrent
+    # requests for the same model wait for the first one's load
+    if not loader:
+        loading.wait()
+        return _tokenizers.get(model)
+
+    try:
+        from transformers import AutoTokenizer
+
+        logger.info(f"Loading tokenizer for {model}")
+        tokenizer = AutoTokenizer.from_pretrained(model)
+    except Exception as e:
+        logger.warning(
+            f"Could not load tokenizer for {model}, estimating token counts: {str(e)}"
+        )
+        tokenizer = None
+
+    with _tokenizers_lock:
+        _tokenizers[model] = tokenizer
+        del _tokenizers_loading[model]
+    loading.set()
+    return tokenizer
+
+
+def count_tokens(text, model=None):
+    """Count the tokens of a text with the model's tokenizer, or estimate them"""
+    tokenizer = get_tokenizer(model) if model else None
+    if tokenizer is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(tokenizer.encode(text, add_special_tokens=False))
+
+
+class ContextStats:
+    """Running totals of the prompt tokens used by contexts and saved by compacting them"""
+
+    def __init__(self):
+        self.contexts = 0
+        self.tokens = 0
+        self.full_tokens = 0
+        self.compacted = 0
+        self._lock = threading.Lock()
+
+    def record(self, stats):
+        """Add the stats of one built context"""
+        with self._lock:
+            self.contexts += 1
+            self.tokens += stats["tokens"]
+            self.full_tokens += stats["full_tokens"]
+            self.compacted += stats["compacted"]
+
+    def stats(self):
+        """Return the totals and the share of prompt tokens saved"""
+        with self._lock:
+            saved = self.full_tokens - self.tokens
+            return {
+                "contexts": self.contexts,
+                "compacted": self.compacted,
+                "tokens": self.tokens,
+                "full_tokens": self.full_tokens,
+                "tokens_saved": saved,
+                "saved_rate": saved / self.full_tokens if self.full_tokens else 0.0,
+            }
+
+
+# Process-wide context token totals
+context_stats = ContextStats()
+
+
+def format_documents(relevant_docs):
+    """Format retrieved documents as a numbered context block, one document per item"""
+    context = CONTEXT_HEADER
+    for i, doc in enumerate(relevant_docs):
+        context += f"{i+1}. {doc['document']['text']}\n"
+    return context
+
+
+def _parse_day(value):
+    """Return the date of a YYYY-MM-DD document date, or None"""
+    try:
+        return date.fromisoformat(value[:10]) if len(value) == 10 else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _table_row(doc):
+    """Return (day, values) for a document that can become a table row, or None"""
+    table = TABLE_FORMATS.get(doc["type"])
+    day = _parse_day(doc["date"])
+    if table is None or day is None:
+        return None
+    match = table[2].search(doc["text"])
+    return (day, match.groups()) if match else None
+
+
+def _unique_documents(relevant_docs):
+    """Drop retrieved documents whose text repeats an earlier one, keeping the order"""
+    seen = set()
+    unique = []
+    for doc in relevant_docs:
+        # Compare whitespace-insensitively; the same day can be indexed twice
+        key = " ".join(doc["document"]["text"].split())
+        if key not in seen:
+            seen.add(key)
+            unique.append(doc)
+    return unique
+
+
+def _blocks(relevant_docs):
+    """Group retrieved documents into context blocks, most relevant first
+
+    Each block is (relevance, type, entries) where entries is a list of
+    ((day, values), text) for a table of adjacent days, or (relevance, None, text)
+    for a single document.
+    """
+    rows_by_type = {}
+    singles = []
+    for doc in relevant_docs:
+        text = doc["document"]["text"]
+        row = _table_row(doc["document"])
+        if row is None:
+            singles.append((doc["score"], None, text))
+        else:
+            rows_by_type.setdefault(doc["document"]["type"], []).append(
+                (row, doc["score"], text)
+            )
+
+    blocks = list(singles)
+    for doc_type, entries in rows_by_type.items():
+        entries.sort(key=lambda entry: entry[0][0])
+        # Split the days into runs of consecutive dates
+        run = [entries[0]]
+        for entry in entries[1:]:
+            if (entry[0][0] - run[-1][0][0]).days == 1:
+                run.append(entry)
+                continue
+            blocks.append(_run_block(doc_type, run))
+            run = [entry]
+        blocks.append(_run_block(doc_type, run))
+
+    blocks.sort(key=lambda block: block[0], reverse=True)
+    return blocks
+
+
+def _run_block(doc_type, run):
+    """Return the block for a run of adjacent days; a lone day keeps its full text"""
+    relevance = max(score for _, score, _ in run)
+    if len(run) == 1:
+        return relevance, None, run[0][2]
+    return relevance, doc_type, [(row, text) for row, _, text in run]
+
+
+def _format_table(doc_type, rows):
+    """Format day rows as a compact pipe-separated table"""
+    title, columns, _ = TABLE_FORMATS[doc_type]
+    lines = [f"{title} (Date | {' | '.join(columns)}):"]
+    lines += [f"{day.isoformat()} | {' | '.join(values)}" for day, values in rows]
+    return "\n".join(lines)
+
+
+def build_context(relevant_docs, model=None, budget=None):
+    """Assemble retrieved documents into a context block that fits a token budget
+
+    Documents repeating an earlier one's text are dropped; near-duplicates are
+    kept. If the remaining documents fit ``budget`` tokens, counted with
+    ``model``'s tokenizer, they are used as they are. Otherwise runs of adjacent
+    days of the same type are merged into compact tables and blocks
+    are added most relevant first while they fit; a table that does not fit keeps
+    as many of its latest days as do, down to the full text of the latest day.
+    Returns the context and a dict with its token count and the tokens saved
+    against the full documents, which are also added to ``context_stats``.
+    """
+    budget = budget or CONTEXT_TOKEN_BUDGET
+    documents = _unique_documents(relevant_docs)
+    used = count_tokens(CONTEXT_HEADER, model)
+    items = [doc["document"]["text"] for doc in documents]
+
+    compacted = count_tokens(format_documents(documents), model) > budget
+    if compacted:
+        items = []
+        for _, doc_type, content in _blocks(documents):
+            if doc_type is None:
+                cost = count_tokens(f"{len(items) + 1}. {content}\n", model)
+                if used + cost <= budget:
+                    items.append(content)
+                    used += cost
+                continue
+
+            # Drop the table's earliest days until it fits; a lone day left over
+            # keeps its full document
+            entries = list(content)
+            while entries:
+                if len(entries) == 1:
+                    text = entries[0][1]
+                else:
+                    text = _format_table(doc_type, [row for row, _ in entries])
+                cost = count_tokens(f"{len(items) + 1}. {text}\n", model)
+                if used + cost <= budget:
+                    items.append(text)
+                    used += cost
+                    break
+                entries.pop(0)
+
+    context = CONTEXT_HEADER + "".join(
+        f"{i + 1}. {item}\n" for i, item in enumerate(items)
+    )
+    tokens = count_tokens(context, model)
+    full_tokens = count_tokens(format_documents(relevant_docs), model)
+    stats = {
+        "documents": len(relevant_docs),
+        "tokens": tokens,
+        "full_tokens": full_tokens,
+        "tokens_saved": full_tokens - tokens,
+        "compacted": compacted,
+    }
+    context_stats.record(stats)
+    logger.info(
+        f"Context uses {tokens} tokens for {len(relevant_docs)} documents "
+        f"(budget {budget}), saving {full_tokens - tokens} prompt tokens"
+    )
+    return context, stats
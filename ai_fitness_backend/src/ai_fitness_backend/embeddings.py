@@ -0,0 +1,201 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from dotenv import load_dotenv
+
+# Set up logging
+logger = logging.getLogger("ai_fitness_api.embeddings")
+
+# Load environment variables
+load_dotenv()
+
+# Embedding model configuration
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2")
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE") or None
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+
+# Document encoding configuration
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# Processes used to encode documents; 1 encodes in-process, 0 uses every core
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", "1")) or os.cpu_count() or 1
+# Texts encoded per block; each block is handed to storage before the next starts
+EMBEDDING_BLOCK_SIZE = int(os.getenv("EMBEDDING_BLOCK_SIZE", "4096"))
+
+# Process-wide model registry, keyed by (model name, device)
+_models = {}
+_models_lock = threading.Lock()
+
+
+def get_embedding_model(model_name=None, device=None):
+    """Return the shared SentenceTransformer model, loading it once per process"""
+    model_name = model_name or EMBEDDING_MODEL_NAME
+    device = device or EMBEDDING_DEVICE
+    key = (model_name, device)
+
+    model = _models.get(key)
+    if model is not None:
+        return model
+
+    with _models_lock:
+        # Another thread may have loaded the model while we waited for the lock
+        model = _models.get(key)
+        if model is not None:
+            return model
+
+        logger.info(
+            f"Loading SentenceTransformer model {model_name} on device {device or 'auto'}"
+        )
+        start_time = time.time()
+        try:
+            # Imported here so that importing the app does not load torch
+            from sentence_transformers import SentenceTransformer
+
+            model = SentenceTransformer(model_name, device=device)
+            logger.info(
+                f"SentenceTransformer model loaded in {time.time() - start_time:.2f} seconds"
+            )
+        except Exception as e:
+            logger.error(f"Error loading SentenceTransformer model: {str(e)}")
+            raise
+
+        _models[key] = model
+        return model
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU cache of normalized query embeddings, keyed by (model name, query)"""
+
+    def __init__(self, max_size=QUERY_EMBEDDING_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, model_name, query):
+        """Return the cached embedding or None, counting the hit or miss"""
+        key = (model_name, query)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return embedding
+
+    def put(self, model_name, query, embedding):
+        """Store an embedding, evicting the least recently used entries"""
+        if self.max_size <= 0:
+            return
+        # Cached arrays are shared between requests, so guard against mutation
+        embedding.setflags(write=False)
+        with self._lock:
+            self._entries[(model_name, query)] = embedding
+            self._entries.move_to_end((model_name, query))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """Return the cache size and hit/miss counters"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+# Process-wide query embedding cache
+query_embedding_cache = QueryEmbeddingCache()
+
+
+def encode_query(query, model_name=None, device=None):
+    """Return the L2-normalized embedding of a query, skipping the model on cache hits"""
+    model_name = model_name or EMBEDDING_MODEL_NAME
+
+    embedding = query_embedding_cache.get(model_name, query)
+    if embedding is not None:
+        logger.debug(f"Query embedding cache hit for: {query[:50]}")
+        return embedding
+
+    model = get_embedding_model(model_name, device)
+    embedding = model.encode([query], normalize_embeddings=True)[0].astype(
+        np.float32, copy=False
+    )
+    query_embedding_cache.put(model_name, query, embedding)
+    return embedding
+
+
+def encode_queries(queries, model_name=None, device=None):
+    """Return the L2-normalized embeddings of many queries as one matrix
+
+    Cached queries are skipped and the rest are encoded in a single model call.
+    """
+    model_name = model_name or EMBEDDING_MODEL_NAME
+
+    embeddings = [query_embedding_cache.get(model_name, query) for query in queries]
+    missing = list(dict.fromkeys(q for q, e in zip(queries, embeddings) if e is None))
+    if missing:
+        logger.info(
+            f"Encoding {len(missing)} of {len(queries)} queries ({len(queries) - len(missing)} cached)"
+        )
+        model = get_embedding_model(model_name, device)
+        encoded = model.encode(missing, normalize_embeddings=True).astype(
+            np.float32, copy=False
+        )
+        encoded_by_query = dict(zip(missing, encoded))
+        for query, embedding in encoded_by_query.items():
+            query_embedding_cache.put(model_name, query, embedding)
+        embeddings = [
+            encoded_by_query[q] if e is None else e for q, e in zip(queries, embeddings)
+        ]
+    return np.stack(embeddings)
+
+
+def encode_documents(texts, model=None, batch_size=None, workers=None):
+    """Encode texts in blocks, yielding (positions, embeddings) for each block
+
+    Texts are encoded shortest first, so each batch holds texts of similar length
+    and little work is spent on padding. ``positions`` are the indices of the
+    block's texts in ``texts``. With more than one worker, blocks are spread over
+    a pool of encoding processes.
+    """
+    model = model or get_embedding_model()
+    batch_size = batch_size or EMBEDDING_BATCH_SIZE
+    workers = min(workers or EMBEDDING_WORKERS, max(1, len(texts) // batch_size))
+
+    order = np.argsort([len(text) for text in texts], kind="stable")
+    logger.info(
+        f"Encoding {len(texts)} texts in batches of {batch_size} with {workers} workers"
+    )
+    start_time = time.time()
+
+    pool = None
+    if workers > 1:
+        pool = model.start_multi_process_pool([EMBEDDING_DEVICE or "cpu"] * workers)
+    try:
+        for start in range(0, len(order), EMBEDDING_BLOCK_SIZE):
+            positions = order[start : start + EMBEDDING_BLOCK_SIZE]
+            block = [texts[i] for i in positions]
+            if pool is not None:
+                embeddings = model.encode_multi_process(
+                    block, pool, batch_size=batch_size
+                )
+            else:
+                embeddings = model.encode(block, batch_size=batch_size)
+            yield positions, np.asarray(embeddings, dtype=np.float32)
+    except Exception as e:
+        logger.error(f"Error encoding documents: {str(e)}")
+        raise
+    finally:
+        if pool is not None:
+            model.stop_multi_process_pool(pool)
+
+    logger.info(f"Encoded {len(texts)} texts in {time.time() - start_time:.2f} seconds")
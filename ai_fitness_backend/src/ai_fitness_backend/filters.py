@@ -0,0 +1,115 @@
+import re
+import logging
+from datetime import timedelta
+
+# Set up logging
+logger = logging.getLogger("ai_fitness_api.filters")
+
+NUMBER_WORDS = {
+    "one": 1,
+    "two": 2,
+    "three": 3,
+    "four": 4,
+    "five": 5,
+    "six": 6,
+    "seven": 7,
+    "eight": 8,
+    "nine": 9,
+    "ten": 10,
+    "eleven": 11,
+    "twelve": 12,
+}
+
+UNIT_DAYS = {"day": 1, "week": 7, "fortnight": 14, "month": 30, "year": 365}
+
+# "last 30 days", "past two weeks", "over the last month", "in the past year"
+RELATIVE_WINDOW_PATTERN = re.compile(
+    r"\b(?:last|past|previous)\s+(?:(\d+|"
+    + "|".join(NUMBER_WORDS)
+    + r")\s+)?(day|week|fortnight|month|year)s?\b",
+    re.IGNORECASE,
+)
+THIS_PERIOD_PATTERN = re.compile(r"\bthis\s+(week|month|year)\b", re.IGNORECASE)
+
+MONTH_NAMES = [
+    "january",
+    "february",
+    "march",
+    "april",
+    "may",
+    "june",
+    "july",
+    "august",
+    "september",
+    "october",
+    "november",
+    "december",
+]
+WEEKDAY_NAMES = [
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+]
+
+# Dates, numbers and named numbers, months or weekdays in a query
+LITERAL_PATTERN = re.compile(
+    r"\d{4}-\d{1,2}-\d{1,2}|\d{1,2}/\d{1,2}(?:/\d{2,4})?|\d+(?:[.,]\d+)*|\b(?:"
+    + "|".join(list(NUMBER_WORDS) + MONTH_NAMES + WEEKDAY_NAMES)
+    + r")\b",
+    re.IGNORECASE,
+)
+
+
+def parse_relative_window(query, anchor):
+    """Parse a relative time window like "last 30 days" out of a query
+
+    Windows are anchored at ``anchor``, normally the latest date in the corpus, since
+    uploaded exports usually end some time before the question is asked. Returns
+    (date_from, date_to), or (None, None) if the query names no window.
+    """
+    if anchor is None:
+        return None, None
+
+    match = RELATIVE_WINDOW_PATTERN.search(query)
+    if match:
+        amount, unit = match.groups()
+        if amount is None:
+            count = 1
+        elif amount.isdigit():
+            count = int(amount)
+        else:
+            count = NUMBER_WORDS[amount.lower()]
+        days = count * UNIT_DAYS[unit.lower()]
+        logger.info(f"Parsed relative window '{match.group(0)}' as {days} days")
+        return anchor - timedelta(days=days - 1), anchor
+
+    match = THIS_PERIOD_PATTERN.search(query)
+    if match:
+        unit = match.group(1).lower()
+        if unit == "week":
+            date_from = anchor - timedelta(days=anchor.weekday())
+        elif unit == "month":
+            date_from = anchor.replace(day=1)
+        else:
+            date_from = anchor.replace(month=1, day=1)
+        logger.info(f"Parsed relative window '{match.group(0)}' from {date_from}")
+        return date_from, anchor
+
+    return None, None
+
+
+def query_literals(query):
+    """Return the dates and numbers a query names, normalized and in order
+
+    Queries that differ only in one of these ask about different data, however
+    close their embeddings are.
+    """
+    literals = []
+    for match in LITERAL_PATTERN.finditer(query):
+        value = match.group(0).lower().replace(",", "")
+        literals.append(str(NUMBER_WORDS.get(value, value)))
+    return literals
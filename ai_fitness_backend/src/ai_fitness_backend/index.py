@@ -0,0 +1,359 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, NamedTuple, Optional
+import numpy as np
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from .ann import load_ann_index
+from .database import CorpusGeneration, Document, Embedding
+from .lexical import load_lexical_index
+from .users import DEFAULT_USER_ID
+
+# Set up logging
+logger = logging.getLogger("ai_fitness_api.index")
+
+# Load environment variables
+load_dotenv()
+
+# Memory budget of the resident retrieval indices; least recently used users'
+# indices are evicted beyond it
+RETRIEVAL_INDEX_POOL_MB = int(os.getenv("RETRIEVAL_INDEX_POOL_MB", "1024"))
+
+
+def current_generation(db: Session, user_id=DEFAULT_USER_ID):
+    """Return the stored corpus generation of a user, shared by every worker process"""
+    generation = (
+        db.query(CorpusGeneration.generation)
+        .filter(CorpusGeneration.user_id == user_id)
+        .scalar()
+    )
+    return generation or 0
+
+
+def bump_generation(db: Session, user_id=DEFAULT_USER_ID):
+    """Mark a user's stored corpus as changed so every worker's resident index reloads it
+
+    The bump is part of the caller's transaction, so it is committed together
+    with the document changes.
+    """
+    bumped = (
+        db.query(CorpusGeneration)
+        .filter(CorpusGeneration.user_id == user_id)
+        .update(
+            {CorpusGeneration.generation: CorpusGeneration.generation + 1},
+            synchronize_session=False,
+        )
+    )
+    if not bumped:
+        db.add(CorpusGeneration(user_id=user_id, generation=1))
+        db.flush()
+    logger.info(f"Corpus generation of user {user_id} bumped")
+
+
+def corpus_version(texts):
+    """Return a fingerprint of the corpus that is stable across restarts"""
+    digest = hashlib.sha256()
+    for text in texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def normalize_embeddings(embeddings):
+    """Return the embeddings as L2-normalized float32 rows"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    # Leave all-zero rows as zeros instead of dividing by zero
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+
+def embeddings_from_bytes(blobs):
+    """Convert stored embedding bytes to a normalized matrix in a single pass"""
+    blobs = list(blobs)
+    return normalize_embeddings(
+        np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(blobs), -1)
+    )
+
+
+def select_top_k(scores, top_k):
+    """Return the indices of the top_k highest scores, best first"""
+    if top_k <= 0 or len(scores) == 0:
+        return np.empty(0, dtype=np.intp)
+    if top_k >= len(scores):
+        return np.argsort(scores)[::-1]
+
+    # Partition out the top_k candidates in O(N), then sort only those
+    candidates = np.argpartition(scores, -top_k)[-top_k:]
+    return candidates[np.argsort(scores[candidates])[::-1]]
+
+
+class DocumentMetadata:
+    """Sorted date array and per-type bitmaps used to prefilter documents before scoring"""
+
+    def __init__(self, documents):
+        # Day of each document; period summaries ("all") have no date
+        self.dates = np.array(
+            [_parse_day(doc["date"]) for doc in documents], dtype="datetime64[D]"
+        )
+        dated = np.flatnonzero(~np.isnat(self.dates))
+        self.date_order = dated[np.argsort(self.dates[dated], kind="stable")]
+        self.sorted_dates = self.dates[self.date_order]
+
+        self.type_masks = {}
+        for i, doc in enumerate(documents):
+            mask = self.type_masks.get(doc["type"])
+            if mask is None:
+                mask = self.type_masks[doc["type"]] = np.zeros(len(documents), bool)
+            mask[i] = True
+
+    @property
+    def latest_date(self):
+        """The most recent document date, or None for an undated corpus"""
+        if len(self.sorted_dates) == 0:
+            return None
+        return self.sorted_dates[-1].astype(object)
+
+    def candidates(self, date_from=None, date_to=None, types=None):
+        """Return the sorted indices of documents matching the filters, or None if unfiltered"""
+        if date_from is None and date_to is None and not types:
+            return None
+
+        mask = np.ones(len(self.dates), bool)
+        if date_from is not None or date_to is not None:
+            # Binary search the sorted dates for the window
+            start = 0
+            end = len(self.sorted_dates)
+            if date_from is not None:
+                start = np.searchsorted(
+                    self.sorted_dates, np.datetime64(date_from, "D"), side="left"
+                )
+            if date_to is not None:
+                end = np.searchsorted(
+                    self.sorted_dates, np.datetime64(date_to, "D"), side="right"
+                )
+            mask = np.zeros(len(self.dates), bool)
+            mask[self.date_order[start:end]] = True
+
+        if types:
+            type_mask = np.zeros(len(self.dates), bool)
+            for doc_type in types:
+                if doc_type in self.type_masks:
+                    type_mask |= self.type_masks[doc_type]
+            mask &= type_mask
+
+        return np.flatnonzero(mask)
+
+
+def _parse_day(date):
+    """Return the YYYY-MM-DD part of a document date, or NaT if it has none"""
+    day = date[:10] if date else ""
+    if len(day) == 10 and day[4] == "-" and day[7] == "-":
+        return day
+    return "NaT"
+
+
+class IndexSnapshot(NamedTuple):
+    """One loaded state of a user's corpus, published to readers as a whole
+
+    Every field is computed before the snapshot is created and none is changed
+    afterwards, so a reader holding a snapshot never sees documents from one load
+    mixed with embeddings from another.
+    """
+
+    documents: tuple = ()
+    # L2-normalized float32 rows, so a dot product is the cosine similarity
+    embeddings: Optional[np.ndarray] = None
+    # Optional approximate nearest-neighbour index over the embeddings
+    ann: Any = None
+    # Optional BM25 inverted index over the document texts
+    lexical: Any = None
+    metadata: DocumentMetadata = DocumentMetadata([])
+    generation: Optional[int] = None
+    # Fingerprint of the loaded documents, for caches that outlive the process
+    version: Optional[str] = None
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the snapshot, used to bound the pool"""
+        total = sum(len(doc["text"]) + 100 for doc in self.documents)
+        if self.embeddings is not None:
+            total += self.embeddings.nbytes
+        if self.ann is not None:
+            total += self.ann.centroids.nbytes + self.ann.list_members.nbytes
+        if self.lexical is not None:
+            total += (
+                self.lexical.postings.nbytes
+                + self.lexical.frequencies.nbytes
+                + 100 * len(self.lexical.vocabulary)
+            )
+        return total
+
+
+class RetrievalIndex:
+    """A user's documents and their embedding matrix, kept in memory between requests
+
+    The loaded state lives in ``snapshot``, which a reload replaces with a single
+    assignment; readers take it once per request and use only that snapshot.
+    """
+
+    def __init__(self, user_id=DEFAULT_USER_ID):
+        self.user_id = user_id
+        self.snapshot = IndexSnapshot()
+        self._lock = threading.Lock()
+
+    def is_stale(self, db: Session):
+        """Whether the stored corpus has changed since the index was loaded"""
+        return self.snapshot.generation != current_generation(db, self.user_id)
+
+    def refresh(self, db: Session):
+        """Return the current snapshot, reloading it from the database if the stored corpus generation changed"""
+        snapshot = self.snapshot
+        if snapshot.generation == current_generation(db, self.user_id):
+            logger.debug(
+                f"Retrieval index of user {self.user_id} is current (generation {snapshot.generation})"
+            )
+            return snapshot
+
+        with self._lock:
+            # Another request may have reloaded the index while we waited
+            if self.is_stale(db):
+                self.load(db)
+            return self.snapshot
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the index, used to bound the pool"""
+        return self.snapshot.nbytes
+
+    def load(self, db: Session):
+        """Load the user's documents and embeddings from the database into a new snapshot"""
+        logger.info(f"Loading retrieval index of user {self.user_id} from database")
+        start_time = time.time()
+
+        # Read the generation first so a concurrent rebuild triggers another reload
+        generation = current_generation(db, self.user_id)
+
+        try:
+            rows = (
+                db.query(
+                    Document.id,
+                    Document.text,
+                    Document.type,
+                    Document.date,
+                    Embedding.embedding,
+                )
+                .join(Embedding, Embedding.document_id == Document.id)
+                .filter(Document.user_id == self.user_id)
+                .order_by(Document.id)
+                .all()
+            )
+        except Exception as e:
+            logger.error(f"Error loading retrieval index from database: {str(e)}")
+            raise
+
+        documents = tuple(
+            {"text": text, "type": type_, "date": date}
+            for _, text, type_, date, _ in rows
+        )
+
+        if rows:
+            embeddings = embeddings_from_bytes(row.embedding for row in rows)
+            # Shared by every reader of the snapshot, so it must not change under them
+            embeddings.flags.writeable = False
+            document_ids = [row.id for row in rows]
+            ann = load_ann_index(db, document_ids, embeddings, self.user_id)
+            lexical = load_lexical_index(
+                db, document_ids, [doc["text"] for doc in documents], self.user_id
+            )
+        else:
+            logger.warning(f"No embeddings found in database for user {self.user_id}")
+            embeddings = None
+            ann = None
+            lexical = None
+
+        # Publish the new state in one assignment
+        self.snapshot = IndexSnapshot(
+            documents=documents,
+            embeddings=embeddings,
+            ann=ann,
+            lexical=lexical,
+            metadata=DocumentMetadata(documents),
+            generation=generation,
+            version=corpus_version(doc["text"] for doc in documents),
+        )
+        logger.info(
+            f"Loaded {len(documents)} documents into retrieval index of user {self.user_id} (generation {generation}) in {time.time() - start_time:.2f} seconds"
+        )
+        return self.snapshot
+
+
+class RetrievalIndexPool:
+    """Resident retrieval indices of recently active users, bounded by memory
+
+    Indices are kept in least recently used order; once their combined size
+    exceeds the budget, the least recently used ones are evicted and reloaded
+    from the database on that user's next request.
+    """
+
+    def __init__(self, budget_mb=None):
+        self.budget = (budget_mb or RETRIEVAL_INDEX_POOL_MB) * 1024 * 1024
+        self._indices = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id=DEFAULT_USER_ID):
+        """Return a user's index, creating an empty one if it is not resident"""
+        with self._lock:
+            index = self._indices.get(user_id)
+            if index is None:
+                index = self._indices[user_id] = RetrievalIndex(user_id)
+            self._indices.move_to_end(user_id)
+            return index
+
+    def refresh(self, db: Session, user_id=DEFAULT_USER_ID):
+        """Return a snapshot of a user's index, reloaded if stale, evicting others to stay in budget"""
+        snapshot = self.get(user_id).refresh(db)
+        self.evict(keep=user_id)
+        return snapshot
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the resident indices"""
+        with self._lock:
+            return sum(index.nbytes for index in self._indices.values())
+
+    def evict(self, keep=None):
+        """Drop least recently used indices until the pool fits its budget"""
+        with self._lock:
+            sizes = {user_id: index.nbytes for user_id, index in self._indices.items()}
+            total = sum(sizes.values())
+            for user_id in list(self._indices):
+                if total <= self.budget:
+                    break
+                if user_id == keep:
+                    continue
+                del self._indices[user_id]
+                total -= sizes[user_id]
+                logger.info(
+                    f"Evicted retrieval index of user {user_id} ({sizes[user_id] / 1e6:.1f} MB), pool now {total / 1e6:.1f} MB"
+                )
+
+    def __contains__(self, user_id):
+        return user_id in self._indices
+
+    def __len__(self):
+        return len(self._indices)
+
+
+# Process-wide pool of retrieval indices
+_pool = RetrievalIndexPool()
+
+
+def get_index_pool():
+    """Return the process-wide retrieval index pool"""
+    return _pool
@@ -0,0 +1,212 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from dotenv import load_dotenv
+
+from .database import SessionLocal
+from .users import DEFAULT_USER_ID, user_data_dir
+
+# Set up logging
+logger = logging.getLogger("ai_fitness_api.ingest")
+
+# Load environment variables
+load_dotenv()
+
+# Seconds to wait after the latest upload before rebuilding, so that a burst of
+# uploads is processed by a single rebuild
+INGEST_DEBOUNCE_SECONDS = float(os.getenv("INGEST_DEBOUNCE_SECONDS", "2"))
+# Finished jobs kept for status lookups
+INGEST_JOB_HISTORY = int(os.getenv("INGEST_JOB_HISTORY", "100"))
+
+
+class IngestJob:
+    """An upload waiting for, or covered by, a rebuild of the stored documents"""
+
+    def __init__(self, files, user_id=DEFAULT_USER_ID):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.files = list(files)
+        self.status = "queued"
+        self.error = None
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        # Monotonic submission time, used for debouncing
+        self.submitted = time.monotonic()
+
+    def to_dict(self):
+        """Return the job's status fields for the API"""
+        return {
+            "job_id": self.id,
+            "user_id": self.user_id,
+            "status": self.status,
+            "files": self.files,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+def rebuild_documents(data_dir="data", user_id=DEFAULT_USER_ID):
+    """Reload every export of a user and store the changed documents, using a dedicated session"""
+    logger.info(f"Starting rebuild of stored documents for user {user_id}")
+    start_time = time.time()
+
+    # Imported here so that importing the app does not load pandas
+    from .processor import FitnessDataProcessor
+
+    db = SessionLocal()
+    try:
+        processor = FitnessDataProcessor(data_dir=data_dir, db=db, user_id=user_id)
+
+        logger.info("Loading data from files")
+        processor.load_data()
+
+        logger.info("Creating documents")
+        processor.create_documents()
+
+        logger.info("Creating daily rollups")
+        processor.create_daily_rollups()
+
+        logger.info("Loading embeddings")
+        processor.create_embeddings()
+
+        logger.info(f"Rebuild completed in {time.time() - start_time:.2f} seconds")
+    finally:
+        db.close()
+
+
+class IngestWorker:
+    """Single background thread that runs queued uploads' rebuilds one at a time
+
+    Jobs submitted while a rebuild is pending share that rebuild, one per user
+    with pending uploads. Jobs submitted while a rebuild is running are queued for
+    the next one, since the running rebuild may already have read the data files.
+    """
+
+    def __init__(self, data_dir="data", debounce=INGEST_DEBOUNCE_SECONDS):
+        self.data_dir = data_dir
+        self.debounce = debounce
+        self.jobs = OrderedDict()
+        self._pending = []
+        self._stopping = False
+        self._thread = None
+        self._condition = threading.Condition()
+
+    def start(self):
+        """Start the worker thread if it is not already running"""
+        with self._condition:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(
+                target=self._run, name="ingest-worker", daemon=True
+            )
+            self._thread.start()
+            logger.info("Ingest worker started")
+
+    def stop(self, timeout=None):
+        """Stop the worker after any running rebuild finishes"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            logger.info("Ingest worker stopped")
+
+    def submit(self, files, user_id=DEFAULT_USER_ID):
+        """Queue a rebuild of a user's documents for uploaded files and return its job"""
+        self.start()
+        job = IngestJob(files, user_id)
+        with self._condition:
+            self.jobs[job.id] = job
+            self._pending.append(job)
+            self._forget_finished_jobs()
+            self._condition.notify_all()
+        logger.info(f"Queued ingest job {job.id} ({len(self._pending)} pending)")
+        return job
+
+    def get_job(self, job_id):
+        """Return the job with this id, or None if it is unknown or was forgotten"""
+        with self._condition:
+            return self.jobs.get(job_id)
+
+    def _forget_finished_jobs(self):
+        """Drop the oldest finished jobs beyond the history limit"""
+        finished = [
+            job_id
+            for job_id, job in self.jobs.items()
+            if job.status in ("completed", "failed")
+        ]
+        for job_id in finished[: max(0, len(finished) - INGEST_JOB_HISTORY)]:
+            del self.jobs[job_id]
+
+    def _next_batch(self):
+        """Wait for pending jobs and a quiet period, then claim every pending job"""
+        with self._condition:
+            while not self._pending and not self._stopping:
+                self._condition.wait()
+
+            # Debounce: wait until no upload has arrived for the debounce period
+            while not self._stopping:
+                remaining = (
+                    self._pending[-1].submitted + self.debounce - time.monotonic()
+                )
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+
+            if self._stopping:
+                return []
+
+            batch, self._pending = self._pending, []
+            started_at = datetime.utcnow()
+            for job in batch:
+                job.status = "running"
+                job.started_at = started_at
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if not batch:
+                return
+
+            jobs_by_user = OrderedDict()
+            for job in batch:
+                jobs_by_user.setdefault(job.user_id, []).append(job)
+
+            for user_id, jobs in jobs_by_user.items():
+                logger.info(
+                    f"Running one rebuild for {len(jobs)} ingest jobs of user {user_id}"
+                )
+                status, error = "completed", None
+                try:
+                    rebuild_documents(user_data_dir(user_id, self.data_dir), user_id)
+                except Exception as e:
+                    logger.error(
+                        f"Error processing uploaded data: {str(e)}", exc_info=True
+                    )
+                    status, error = "failed", str(e)
+
+                with self._condition:
+                    finished_at = datetime.utcnow()
+                    for job in jobs:
+                        job.status = status
+                        job.error = error
+                        job.finished_at = finished_at
+
+
+# Process-wide ingest worker
+_worker = IngestWorker()
+
+
+def get_ingest_worker():
+    """Return the process-wide ingest worker"""
+    return _worker
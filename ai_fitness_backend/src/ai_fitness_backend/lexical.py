@@ -0,0 +1,196 @@
+import os
+import re
+import time
+import logging
+from collections import Counter
+import numpy as np
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from .database import Document, DocumentTerm
+from .users import DEFAULT_USER_ID
+
+# Set up logging
+logger = logging.getLogger("ai_fitness_api.lexical")
+
+# Load environment variables
+load_dotenv()
+
+# Share of the fused retrieval score given to BM25; 0 disables lexical scoring
+RETRIEVAL_LEXICAL_WEIGHT = float(os.getenv("RETRIEVAL_LEXICAL_WEIGHT", "0.3"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# Dates stay whole so "2024-03-05" is a single term; everything else splits on
+# non-word characters
+TOKEN_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}|\w+")
+
+# Lexical hits merged into the candidates of an approximate nearest-neighbour search
+LEXICAL_POOL_SIZE = 100
+
+
+def tokenize(text):
+    """Split text into lowercase terms"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def lexical_enabled():
+    """Whether retrieval mixes BM25 scores into the dense scores"""
+    return RETRIEVAL_LEXICAL_WEIGHT > 0
+
+
+def store_document_terms(db: Session, document_ids, texts):
+    """Insert the term frequencies of each document, the persisted form of the inverted index"""
+    rows = [
+        {"document_id": document_id, "term": term, "frequency": frequency}
+        for document_id, text in zip(document_ids, texts)
+        for term, frequency in Counter(tokenize(text)).items()
+    ]
+    if rows:
+        db.execute(insert(DocumentTerm), rows)
+
+
+def delete_document_terms(db: Session, document_ids=None):
+    """Remove the stored terms of some documents (ids or an id subquery), or of every document"""
+    query = db.query(DocumentTerm)
+    if document_ids is not None:
+        query = query.filter(DocumentTerm.document_id.in_(document_ids))
+    query.delete(synchronize_session=False)
+
+
+class LexicalIndex:
+    """BM25 inverted index: for every term, the documents containing it and how often
+
+    Posting lists are stored back to back, with ``offsets[t]:offsets[t + 1]``
+    delimiting the postings of term id ``t``.
+    """
+
+    def __init__(self, vocabulary, offsets, postings, frequencies, lengths):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.postings = postings
+        self.frequencies = frequencies
+        self.lengths = lengths
+        self.k1 = BM25_K1
+        self.b = BM25_B
+        document_frequencies = np.diff(offsets)
+        count = len(lengths)
+        self.idf = np.log(
+            1 + (count - document_frequencies + 0.5) / (document_frequencies + 0.5)
+        )
+        self.average_length = float(lengths.mean()) if count else 0.0
+
+    @classmethod
+    def build(cls, document_terms):
+        """Build the index from one {term: frequency} dict per document, in corpus order"""
+        start_time = time.time()
+        vocabulary = {}
+        term_ids = []
+        positions = []
+        frequencies = []
+        lengths = np.zeros(len(document_terms), dtype=np.float32)
+        for position, terms in enumerate(document_terms):
+            for term, frequency in terms.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                positions.append(position)
+                frequencies.append(frequency)
+                lengths[position] += frequency
+
+        # Group the postings by term
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind="stable")
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)), out=offsets[1:])
+
+        index = cls(
+            vocabulary,
+            offsets,
+            np.asarray(positions, dtype=np.int64)[order],
+            np.asarray(frequencies, dtype=np.float32)[order],
+            lengths,
+        )
+        logger.info(
+            f"Built lexical index with {len(vocabulary)} terms over {len(document_terms)} documents in {time.time() - start_time:.2f} seconds"
+        )
+        return index
+
+    @classmethod
+    def from_texts(cls, texts):
+        """Tokenize texts and build the index over them"""
+        return cls.build([Counter(tokenize(text)) for text in texts])
+
+    def search(self, query):
+        """Return (positions, scores) of the documents containing any query term
+
+        Positions are sorted. Scores are BM25 scaled so that a document of average
+        length containing every query term once scores 1, and capped at 1, so they
+        can be mixed with cosine similarities.
+        """
+        term_ids = sorted(
+            {self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary}
+        )
+        if not term_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        positions = []
+        contributions = []
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            documents = self.postings[start:end]
+            frequencies = self.frequencies[start:end]
+            norms = self.k1 * (
+                1 - self.b + self.b * self.lengths[documents] / self.average_length
+            )
+            positions.append(documents)
+            contributions.append(
+                self.idf[term_id] * frequencies * (self.k1 + 1) / (frequencies + norms)
+            )
+
+        # Sum each document's contributions across the query terms
+        hits, inverse = np.unique(np.concatenate(positions), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(contributions))
+        # A single occurrence in a document of average length contributes the idf
+        scale = self.idf[term_ids].sum()
+        return hits, np.minimum(scores / scale, 1).astype(np.float32)
+
+
+def load_lexical_index(db: Session, document_ids, texts, user_id=DEFAULT_USER_ID):
+    """Load the stored inverted index for a user's documents, rebuilding it from the texts if incomplete"""
+    if not lexical_enabled():
+        return None
+
+    positions = {document_id: i for i, document_id in enumerate(document_ids)}
+    document_terms = [{} for _ in document_ids]
+    rows = (
+        db.query(DocumentTerm.document_id, DocumentTerm.term, DocumentTerm.frequency)
+        .join(Document, Document.id == DocumentTerm.document_id)
+        .filter(Document.user_id == user_id)
+        .all()
+    )
+    for document_id, term, frequency in rows:
+        position = positions.get(document_id)
+        if position is not None:
+            document_terms[position][term] = frequency
+
+    if any(not terms for terms in document_terms):
+        logger.warning("Stored document terms missing or stale, rebuilding in memory")
+        return LexicalIndex.from_texts(texts)
+    return LexicalIndex.build(document_terms)
+
+
+def fuse_scores(dense_scores, positions, lexical_scores, pool=None):
+    """Mix dense similarities with the lexical scores of the documents at ``positions``
+
+    ``dense_scores`` covers the whole corpus, or only the sorted corpus positions
+    in ``pool``; lexical hits outside the pool are ignored.
+    """
+    if pool is not None:
+        slots = np.searchsorted(pool, positions)
+        inside = slots < len(pool)
+        inside[inside] = pool[slots[inside]] == positions[inside]
+        positions, lexical_scores = slots[inside], lexical_scores[inside]
+
+    fused = (1 - RETRIEVAL_LEXICAL_WEIGHT) * dense_scores
+    fused[positions] += RETRIEVAL_LEXICAL_WEIGHT * lexical_scores
+    return fused
@@ -1,10 +1,26 @@
 import os
-import re
+import json
+import asyncio
+import functools
 import requests
+import httpx
 import time
 import logging
 from dotenv import load_dotenv
 
+from .answer_cache import answer_cache, context_key
+from .embeddings import encode_query
+from .filters import parse_relative_window, query_literals
+from .resilience import (
+    LLM_HEDGE_AFTER_SECONDS,
+    LLM_MAX_RETRIES,
+    LLM_RETRY_STATUS_CODES,
+    get_circuit_breaker,
+    retry_delay,
+    route_model,
+)
+from .sections import PROMPT_END, SectionParser, parse_response
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
@@ -15,15 +31,48 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 
-def get_llm_response(
-    prompt,
-    system_role="You are a helpful fitness and nutrition assistant.",
-    model="mistralai/Mistral-7B-Instruct-v0.2",
-):
-    """Get a response from a free LLM model via Hugging Face"""
-    logger.info(f"Starting LLM request using model: {model}")
-    start_time = time.time()
+# LLM client configuration
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "180"))
+# Connection pool limits for the async client; every request goes to the
+# inference API host, so these are effectively per-host limits
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "60"))
+
+# Shared async client, created on first use so it binds to the server's event loop
+_async_client = None
+
+
+def get_async_client():
+    """Return the shared async HTTP client, creating its connection pool on first use"""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        logger.info(
+            f"Creating async LLM client (max {LLM_MAX_CONNECTIONS} connections, "
+            f"{LLM_MAX_KEEPALIVE_CONNECTIONS} keep-alive)"
+        )
+        _async_client = httpx.AsyncClient(
+            timeout=LLM_TIMEOUT_SECONDS,
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONNECTIONS,
+                max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+        )
+    return _async_client
+
+
+async def close_async_client():
+    """Close the shared async HTTP client and its pooled connections"""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+        logger.info("Closed async LLM client")
 
+
+def _prepare_request(prompt, system_role, model):
+    """Return the URL, headers and JSON payload of an inference API request"""
     api_token = os.getenv("HUGGINGFACE_API_TOKEN")
     if not api_token:
         logger.error("No HUGGINGFACE_API_TOKEN found in environment variables")
@@ -36,194 +85,397 @@ def get_llm_response(
     logger.info(f"Prompt length: {len(full_prompt)} characters")
 
     model_url = f"https://api-inference.huggingface.co/models/{model}"
+    payload = {"inputs": full_prompt, "parameters": {"max_length": 1024}}
+    return model_url, headers, payload
+
+
+class LLMResponseError(Exception):
+    """A non-200 response from the inference API"""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"Error: {status_code} - {text}")
+        self.status_code = status_code
+        # Seconds a loading model still needs, as reported with 503 responses
+        self.estimated_time = None
+        try:
+            body = json.loads(text)
+            if isinstance(body, dict):
+                self.estimated_time = body.get("estimated_time")
+        except ValueError:
+            pass
+
+
+def _is_retryable(error):
+    """Whether a failed request is worth retrying against the same model"""
+    return (
+        isinstance(error, LLMResponseError)
+        and error.status_code in LLM_RETRY_STATUS_CODES
+    )
 
-    try:
-        logger.info(f"Sending request to {model_url}")
-        response = requests.post(
-            model_url,
-            headers=headers,
-            json={"inputs": full_prompt, "parameters": {"max_length": 1024}},
-            timeout=180,  # Add timeout to prevent hanging indefinitely
-        )
 
-        request_time = time.time() - start_time
-        logger.info(
-            f"Request completed in {request_time:.2f} seconds with status code: {response.status_code}"
-        )
+def _read_response(response, start_time):
+    """Return the structured text of an inference API response, raising on errors"""
+    request_time = time.time() - start_time
+    logger.info(
+        f"Request completed in {request_time:.2f} seconds with status code: {response.status_code}"
+    )
 
-        if response.status_code == 200:
-            try:
-                response_json = response.json()
-                logger.info("Successfully parsed JSON response")
-                logger.info(f"Response structure: {type(response_json)}")
-                logger.info(f"Response content: {response_json}")
-
-                if isinstance(response_json, list) and len(response_json) > 0:
-                    if "generated_text" in response_json[0]:
-                        generated_text = response_json[0]["generated_text"]
+    if response.status_code == 200:
+        try:
+            response_json = response.json()
+            logger.info("Successfully parsed JSON response")
+            logger.info(f"Response structure: {type(response_json)}")
+            logger.info(f"Response content: {response_json}")
+
+            if isinstance(response_json, list) and len(response_json) > 0:
+                if "generated_text" in response_json[0]:
+                    generated_text = response_json[0]["generated_text"]
+                    logger.info(
+                        f"Generated text length: {len(generated_text)} characters"
+                    )
+
+                    # Extract only the structured response part
+                    # First, try to find where the OBSERVATIONS section starts
+                    clean_response = extract_structured_response(generated_text)
+                    if clean_response:
                         logger.info(
-                            f"Generated text length: {len(generated_text)} characters"
+                            f"Extracted structured response of length: {len(clean_response)} characters"
                         )
-
-                        # Extract only the structured response part
-                        # First, try to find where the OBSERVATIONS section starts
-                        clean_response = extract_structured_response(generated_text)
-                        if clean_response:
-                            logger.info(
-                                f"Extracted structured response of length: {len(clean_response)} characters"
-                            )
-                            return clean_response
-                        else:
-                            # If we couldn't extract the structured format, return the full response
-                            logger.warning(
-                                "Could not extract structured response, returning full response"
-                            )
-                            return generated_text
+                        return clean_response
                     else:
-                        logger.error(
-                            f"Missing 'generated_text' in response: {response_json}"
-                        )
-                        raise Exception(
-                            f"Error: Unexpected response format - {response_json}"
+                        # If we couldn't extract the structured format, return the full response
+                        logger.warning(
+                            "Could not extract structured response, returning full response"
                         )
+                        return generated_text
                 else:
-                    logger.error(f"Unexpected response structure: {response_json}")
+                    logger.error(
+                        f"Missing 'generated_text' in response: {response_json}"
+                    )
                     raise Exception(
-                        f"Error: Unexpected response structure - {response_json}"
+                        f"Error: Unexpected response format - {response_json}"
                     )
-            except Exception as e:
-                logger.error(f"Error parsing JSON response: {e}")
-                logger.error(f"Raw response: {response.text}")
-                raise Exception(f"Error parsing response: {e}")
-        else:
-            logger.error(f"Error response: {response.status_code} - {response.text}")
-            raise Exception(f"Error: {response.status_code} - {response.text}")
+            else:
+                logger.error(f"Unexpected response structure: {response_json}")
+                raise Exception(
+                    f"Error: Unexpected response structure - {response_json}"
+                )
+        except Exception as e:
+            logger.error(f"Error parsing JSON response: {e}")
+            logger.error(f"Raw response: {response.text}")
+            raise Exception(f"Error parsing response: {e}")
+    else:
+        logger.error(f"Error response: {response.status_code} - {response.text}")
+        raise LLMResponseError(response.status_code, response.text)
+
+
+def _request_llm(prompt, system_role, model):
+    """Send a single request to a free LLM model via Hugging Face"""
+    logger.info(f"Starting LLM request using model: {model}")
+    start_time = time.time()
+
+    model_url, headers, payload = _prepare_request(prompt, system_role, model)
+
+    try:
+        logger.info(f"Sending request to {model_url}")
+        response = requests.post(
+            model_url,
+            headers=headers,
+            json=payload,
+            timeout=LLM_TIMEOUT_SECONDS,  # Add timeout to prevent hanging indefinitely
+        )
+        return _read_response(response, start_time)
 
     except requests.exceptions.Timeout:
-        logger.error("Request timed out after 180 seconds")
-        raise Exception("Error: Request to LLM timed out after 180 seconds")
+        logger.error(f"Request timed out after {LLM_TIMEOUT_SECONDS:g} seconds")
+        raise Exception(
+            f"Error: Request to LLM timed out after {LLM_TIMEOUT_SECONDS:g} seconds"
+        )
     except Exception as e:
         logger.error(f"Exception during LLM request: {str(e)}")
         raise
 
 
-def extract_structured_response(text):
-    """Extract just the structured response part from the LLM output, skipping the instruction repetition"""
-    # Find all occurrences of "OBSERVATIONS:" (case insensitive)
-    # Look for all occurrences of each section header
-    observations_matches = list(re.finditer(r"OBSERVATIONS:", text, re.IGNORECASE))
-    suggestions_matches = list(
-        re.finditer(r"DIETARY SUGGESTIONS:", text, re.IGNORECASE)
-    )
-    summary_matches = list(re.finditer(r"SUMMARY:", text, re.IGNORECASE))
-
-    # If we found multiple occurrences of OBSERVATIONS, use the second one
-    if len(observations_matches) > 1:
-        # Get the position of the second occurrence
-        start_index = observations_matches[1].start()
-        return text[start_index:]
-
-    # If we only found one occurrence of each section, we need to determine if it's the instruction or the content
-    # We'll check if the first occurrence is followed by bullet points or actual content
-
-    # Check if the first OBSERVATIONS is just repeating the instructions
-    if observations_matches and len(observations_matches) == 1:
-        obs_index = observations_matches[0].start()
-        # Get the text after OBSERVATIONS: until the next section
-        next_section_index = min(
-            (
-                m.start()
-                for m in suggestions_matches + summary_matches
-                if m.start() > obs_index
-            ),
-            default=len(text),
+async def _request_llm_async(prompt, system_role, model):
+    """Send a single request to the LLM without blocking the event loop, over pooled connections"""
+    logger.info(f"Starting async LLM request using model: {model}")
+    start_time = time.time()
+
+    model_url, headers, payload = _prepare_request(prompt, system_role, model)
+
+    try:
+        logger.info(f"Sending request to {model_url}")
+        response = await get_async_client().post(
+            model_url, headers=headers, json=payload
         )
-        obs_text = text[obs_index:next_section_index].strip()
-
-        # If this section contains bullet points with "List key observations" or similar instruction text
-        if "List key observations" in obs_text or "Include patterns" in obs_text:
-            # This is likely the instruction repetition, so look for content after all the instructions
-            # Find where the last instruction section ends
-            last_instruction_end = max(
-                summary_matches[0].start() + len("SUMMARY:") if summary_matches else 0,
-                (
-                    suggestions_matches[0].start() + len("DIETARY SUGGESTIONS:")
-                    if suggestions_matches
-                    else 0
-                ),
-                (
-                    observations_matches[0].start() + len("OBSERVATIONS:")
-                    if observations_matches
-                    else 0
-                ),
-            )
+        return _read_response(response, start_time)
 
-            # Find the next occurrence of any section header after the instructions
-            next_section_matches = list(
-                re.finditer(
-                    r"(OBSERVATIONS:|DIETARY SUGGESTIONS:|SUMMARY:)",
-                    text[last_instruction_end:],
-                    re.IGNORECASE,
-                )
-            )
+    except httpx.TimeoutException:
+        logger.error(f"Request timed out after {LLM_TIMEOUT_SECONDS:g} seconds")
+        raise Exception(
+            f"Error: Request to LLM timed out after {LLM_TIMEOUT_SECONDS:g} seconds"
+        )
+    except Exception as e:
+        logger.error(f"Exception during LLM request: {str(e)}")
+        raise
 
-            if next_section_matches:
-                # Return from this section onwards
-                start_index = last_instruction_end + next_section_matches[0].start()
-                return text[start_index:]
 
-    # If we couldn't find a clear second occurrence or determine the instruction repetition,
-    # fall back to the original logic
+async def _stream_llm(prompt, system_role, model):
+    """Yield chunks of generated text from one streaming request as the inference API sends them"""
+    logger.info(f"Starting streaming LLM request using model: {model}")
+    start_time = time.time()
 
-    # Look for the first real content section
-    for section_name in ["OBSERVATIONS:", "DIETARY SUGGESTIONS:", "SUMMARY:"]:
-        # Find all occurrences
-        matches = list(re.finditer(section_name, text, re.IGNORECASE))
+    model_url, headers, payload = _prepare_request(prompt, system_role, model)
+    payload["stream"] = True
+
+    try:
+        logger.info(f"Sending streaming request to {model_url}")
+        async with get_async_client().stream(
+            "POST", model_url, headers=headers, json=payload
+        ) as response:
+            if response.status_code != 200:
+                text = (await response.aread()).decode("utf-8", "replace")
+                logger.error(f"Error response: {response.status_code} - {text}")
+                raise LLMResponseError(response.status_code, text)
+
+            first_token = True
+            async for line in response.aiter_lines():
+                # The API streams server-sent events, one JSON object per data line
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:") :].strip()
+                if data == "[DONE]":
+                    break
+                event = json.loads(data)
+                if "error" in event:
+                    logger.error(f"Error in LLM stream: {event['error']}")
+                    raise Exception(f"Error: {event['error']}")
+
+                token = event.get("token") or {}
+                if token.get("special") or not token.get("text"):
+                    continue
+                if first_token:
+                    logger.info(
+                        f"First token received in {time.time() - start_time:.2f} seconds"
+                    )
+                    first_token = False
+                yield token["text"]
+
+        logger.info(f"Stream completed in {time.time() - start_time:.2f} seconds")
+
+    except httpx.TimeoutException:
+        logger.error(f"Request timed out after {LLM_TIMEOUT_SECONDS:g} seconds")
+        raise Exception(
+            f"Error: Request to LLM timed out after {LLM_TIMEOUT_SECONDS:g} seconds"
+        )
+    except Exception as e:
+        logger.error(f"Exception during streaming LLM request: {str(e)}")
+        raise
 
-        for match in matches:
-            start_idx = match.start()
-            # Get some text after this section header
-            sample_text = text[start_idx : start_idx + 200].lower()
 
-            # Check if this looks like instruction repetition
+def _with_retries(model, send):
+    """Call ``send`` for a model, retrying retryable errors with backoff
+
+    The outcome is recorded with the model's circuit breaker once retries are
+    over, so a 503 that clears up on retry does not count as a failure. Retries
+    stop if the breaker opens.
+    """
+    breaker = get_circuit_breaker(model)
+    attempt = 0
+    while True:
+        try:
+            result = send()
+            breaker.record_success()
+            return result
+        except Exception as e:
+            if (
+                not _is_retryable(e)
+                or attempt >= LLM_MAX_RETRIES
+                or not breaker.is_closed()
+            ):
+                breaker.record_failure()
+                raise
+            delay = retry_delay(attempt, e.estimated_time)
+            logger.warning(
+                f"{model} returned {e.status_code}, retrying in {delay:.1f} seconds"
+            )
+            time.sleep(delay)
+            attempt += 1
+
+
+async def _with_retries_async(model, send):
+    """Await ``send()`` for a model, retrying retryable errors with backoff"""
+    breaker = get_circuit_breaker(model)
+    attempt = 0
+    while True:
+        try:
+            result = await send()
+            breaker.record_success()
+            return result
+        except asyncio.CancelledError:
+            # Abandoned, e.g. because a hedged request answered first
+            breaker.record_cancelled()
+            raise
+        except Exception as e:
             if (
-                "list key observations" in sample_text
-                or "provide specific dietary" in sample_text
-                or "brief conclusion summarizing" in sample_text
+                not _is_retryable(e)
+                or attempt >= LLM_MAX_RETRIES
+                or not breaker.is_closed()
             ):
-                continue  # Skip this occurrence, it's likely the instruction
+                breaker.record_failure()
+                raise
+            delay = retry_delay(attempt, e.estimated_time)
+            logger.warning(
+                f"{model} returned {e.status_code}, retrying in {delay:.1f} seconds"
+            )
+            await asyncio.sleep(delay)
+            attempt += 1
 
-            # This looks like actual content
-            return text[start_idx:]
 
-    # If all else fails, return the original text
-    logger.warning(
-        "Could not extract clean structured response, returning full response"
-    )
-    return text
+def get_llm_response(
+    prompt,
+    system_role="You are a helpful fitness and nutrition assistant.",
+    model="mistralai/Mistral-7B-Instruct-v0.2",
+):
+    """Get a response from a free LLM model via Hugging Face
 
+    503s are retried with backoff, and the fallback model answers if the model
+    fails or its circuit is open.
+    """
+    primary, secondary = route_model(model)
+    try:
+        return _with_retries(
+            primary, lambda: _request_llm(prompt, system_role, primary)
+        )
+    except Exception as e:
+        if secondary is None:
+            raise
+        logger.warning(f"{primary} failed ({str(e)}), falling back to {secondary}")
+        return _with_retries(
+            secondary, lambda: _request_llm(prompt, system_role, secondary)
+        )
 
-def analyze_fitness_data(
-    processor,
-    query,
+
+async def get_llm_response_async(
+    prompt,
     system_role="You are a helpful fitness and nutrition assistant.",
-    top_k=7,
     model="mistralai/Mistral-7B-Instruct-v0.2",
 ):
-    """Analyze fitness data using RAG approach"""
-    logger.info(
-        f"Starting fitness data analysis for query: {query} using model: {model}"
-    )
+    """Get a response from the LLM without blocking the event loop, over pooled connections
+
+    503s are retried with backoff. If the model has not answered within the hedge
+    deadline, the fallback model is asked as well and the first answer wins; the
+    fallback also answers if the model fails or its circuit is open.
+    """
+    primary, secondary = route_model(model)
+
+    def request(target):
+        return asyncio.ensure_future(
+            _with_retries_async(
+                target, lambda: _request_llm_async(prompt, system_role, target)
+            )
+        )
+
+    pending = {request(primary)}
+    hedged = secondary is None
+    error = None
+    try:
+        while pending:
+            timeout = None
+            if not hedged and LLM_HEDGE_AFTER_SECONDS > 0:
+                timeout = LLM_HEDGE_AFTER_SECONDS
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+
+            if not hedged and (not done or not pending):
+                if done:
+                    logger.warning(
+                        f"{primary} failed ({str(error)}), falling back to {secondary}"
+                    )
+                else:
+                    logger.warning(
+                        f"{primary} has not answered within {LLM_HEDGE_AFTER_SECONDS:g} seconds, "
+                        f"hedging with {secondary}"
+                    )
+                pending.add(request(secondary))
+                hedged = True
+        raise error
+    finally:
+        # Cancel the slower request once one has answered
+        for task in pending:
+            task.cancel()
+
+
+async def stream_llm_response(
+    prompt,
+    system_role="You are a helpful fitness and nutrition assistant.",
+    model="mistralai/Mistral-7B-Instruct-v0.2",
+):
+    """Yield chunks of generated text from the LLM as the inference API streams them
+
+    Until the first chunk arrives, 503s are retried with backoff and failures fall
+    back to the fallback model; once text has been sent an error is raised as is.
+    """
+    primary, secondary = route_model(model)
+    candidates = [primary] if secondary is None else [primary, secondary]
+
+    for target in candidates:
+        breaker = get_circuit_breaker(target)
+        attempt = 0
+        while True:
+            started = False
+            try:
+                async for text in _stream_llm(prompt, system_role, target):
+                    started = True
+                    yield text
+                breaker.record_success()
+                return
+            except (asyncio.CancelledError, GeneratorExit):
+                breaker.record_cancelled()
+                raise
+            except Exception as e:
+                if (
+                    not started
+                    and _is_retryable(e)
+                    and attempt < LLM_MAX_RETRIES
+                    and breaker.is_closed()
+                ):
+                    delay = retry_delay(attempt, e.estimated_time)
+                    logger.warning(
+                        f"{target} returned {e.status_code}, retrying in {delay:.1f} seconds"
+                    )
+                    await asyncio.sleep(delay)
+                    attempt += 1
+                    continue
+                breaker.record_failure()
+                if started or target == candidates[-1]:
+                    raise
+                logger.warning(
+                    f"{target} failed ({str(e)}), falling back to {candidates[-1]}"
+                )
+                break
+
+
+def extract_structured_response(text):
+    """Extract just the structured response part from the LLM output, skipping the instruction repetition"""
+    parser = parse_response(text)
+    if parser.start is None:
+        logger.warning(
+            "Could not extract clean structured response, returning full response"
+        )
+        return text
+    if parser.echoed:
+        logger.info("Skipped instructions repeated by the model")
+    return parser.response
 
-    # Generate context from relevant documents
-    logger.info(f"Generating context with top_k={top_k}")
-    start_time = time.time()
-    context = processor.generate_context_from_query(query, top_k=top_k)
-    logger.info(
-        f"Context generation completed in {time.time() - start_time:.2f} seconds"
-    )
-    logger.info(f"Context length: {len(context)} characters")
 
+def format_prompt(context, query):
+    """Wrap retrieved context and the question in the structured output instructions"""
     # Create the full prompt with structured output instructions
     prompt = f"""
     {context}
@@ -247,11 +499,113 @@ def analyze_fitness_data(
     SUMMARY:
     A brief conclusion summarizing the key points and most important recommendations.
     
-    Make sure each section is clearly labeled and separated.
+    {PROMPT_END}
     """
 
     logger.info(f"Full prompt created with length: {len(prompt)} characters")
 
+    return prompt
+
+
+def build_prompt(
+    processor, query, top_k=7, date_from=None, date_to=None, types=None, model=None
+):
+    """Retrieve context for a query and wrap it in the structured output instructions"""
+    # Generate context from relevant documents
+    logger.info(f"Generating context with top_k={top_k}")
+    start_time = time.time()
+    context = processor.generate_context_from_query(
+        query,
+        top_k=top_k,
+        date_from=date_from,
+        date_to=date_to,
+        types=types,
+        model=model,
+    )
+    logger.info(
+        f"Context generation completed in {time.time() - start_time:.2f} seconds"
+    )
+    logger.info(f"Context length: {len(context)} characters")
+
+    return format_prompt(context, query)
+
+
+def _get_cached_answer(
+    processor, query, system_role, top_k, model, date_from, date_to, types
+):
+    """Look a query up in the answer cache, returning (answer or None, cache key)
+
+    The cache key is None when the answer cannot be cached, e.g. for documents
+    that were not loaded from the database.
+    """
+    if not answer_cache.enabled or processor.corpus_version is None:
+        return None, None
+
+    window = (None, None)
+    if date_from is None and date_to is None and processor.metadata is not None:
+        window = parse_relative_window(query, processor.metadata.latest_date)
+    # The dates and numbers the query names are part of the key, since a query that
+    # differs only in them is close in embedding space but asks about other data
+    filters = [
+        date_from,
+        date_to,
+        sorted(types) if types else None,
+        list(window),
+        query_literals(query),
+    ]
+    key = (
+        context_key(
+            model,
+            system_role,
+            top_k,
+            processor.corpus_version,
+            filters,
+            processor.user_id,
+        ),
+        encode_query(query),
+    )
+    answer = answer_cache.get(
+        key[0], query, key[1], processor.corpus_version, processor.user_id
+    )
+    return answer, key
+
+
+def _store_answer(processor, query, key, answer):
+    """Add an answer to the answer cache under a key from _get_cached_answer"""
+    if key is not None:
+        answer_cache.put(
+            key[0],
+            query,
+            key[1],
+            answer,
+            processor.corpus_version,
+            processor.user_id,
+        )
+
+
+def analyze_fitness_data(
+    processor,
+    query,
+    system_role="You are a helpful fitness and nutrition assistant.",
+    top_k=7,
+    model="mistralai/Mistral-7B-Instruct-v0.2",
+    date_from=None,
+    date_to=None,
+    types=None,
+):
+    """Analyze fitness data using RAG approach"""
+    logger.info(
+        f"Starting fitness data analysis for query: {query} using model: {model}"
+    )
+
+    cached, cache_key = _get_cached_answer(
+        processor, query, system_role, top_k, model, date_from, date_to, types
+    )
+    if cached is not None:
+        return cached
+
+    prompt = build_prompt(processor, query, top_k, date_from, date_to, types, model)
+
     # Get response from LLM
     logger.info("Calling LLM for response")
     start_time = time.time()
@@ -259,4 +613,147 @@ def analyze_fitness_data(
     logger.info(f"LLM response received in {time.time() - start_time:.2f} seconds")
     logger.info(f"Response length: {len(response)} characters")
 
+    _store_answer(processor, query, cache_key, response)
+    return response
+
+
+async def analyze_fitness_data_async(
+    processor,
+    query,
+    system_role="You are a helpful fitness and nutrition assistant.",
+    top_k=7,
+    model="mistralai/Mistral-7B-Instruct-v0.2",
+    date_from=None,
+    date_to=None,
+    types=None,
+):
+    """Analyze fitness data using RAG approach, awaiting the LLM instead of blocking on it"""
+    logger.info(
+        f"Starting async fitness data analysis for query: {query} using model: {model}"
+    )
+
+    # The cache and retrieval touch the database and the embedding model, so run
+    # them off the event loop
+    loop = asyncio.get_running_loop()
+    cached, cache_key = await loop.run_in_executor(
+        None,
+        functools.partial(
+            _get_cached_answer,
+            processor,
+            query,
+            system_role,
+            top_k,
+            model,
+            date_from,
+            date_to,
+            types,
+        ),
+    )
+    if cached is not None:
+        return cached
+
+    prompt = await loop.run_in_executor(
+        None,
+        functools.partial(
+            build_prompt, processor, query, top_k, date_from, date_to, types, model
+        ),
+    )
+
+    # Get response from LLM
+    logger.info("Calling LLM for response")
+    start_time = time.time()
+    response = await get_llm_response_async(prompt, system_role, model)
+    logger.info(f"LLM response received in {time.time() - start_time:.2f} seconds")
+    logger.info(f"Response length: {len(response)} characters")
+
+    await loop.run_in_executor(
+        None, _store_answer, processor, query, cache_key, response
+    )
     return response
+
+
+async def analyze_fitness_data_stream(
+    processor,
+    query,
+    system_role="You are a helpful fitness and nutrition assistant.",
+    top_k=7,
+    model="mistralai/Mistral-7B-Instruct-v0.2",
+    date_from=None,
+    date_to=None,
+    types=None,
+):
+    """Analyze fitness data using RAG approach, yielding (event, data) pairs as results arrive
+
+    Yields "documents" with the retrieved documents as soon as retrieval finishes,
+    "token" for each chunk of generated text, "section" for each completed
+    section and finally "done" with the full structured response.
+    """
+    logger.info(
+        f"Starting streaming fitness data analysis for query: {query} using model: {model}"
+    )
+
+    logger.info(f"Retrieving documents with top_k={top_k}")
+    start_time = time.time()
+    loop = asyncio.get_running_loop()
+    relevant_docs = await loop.run_in_executor(
+        None,
+        functools.partial(
+            processor.retrieve_relevant_documents,
+            query,
+            top_k,
+            date_from=date_from,
+            date_to=date_to,
+            types=types,
+        ),
+    )
+    logger.info(f"Retrieval completed in {time.time() - start_time:.2f} seconds")
+    yield "documents", relevant_docs
+
+    cached, cache_key = await loop.run_in_executor(
+        None,
+        functools.partial(
+            _get_cached_answer,
+            processor,
+            query,
+            system_role,
+            top_k,
+            model,
+            date_from,
+            date_to,
+            types,
+        ),
+    )
+    if cached is not None:
+        # Replay a cached answer as a single token
+        parser = SectionParser()
+        yield "token", {"text": cached}
+        for name, content in parser.feed(cached) + parser.close():
+            yield "section", {"name": name, "content": content}
+        yield "done", {"response": cached, "sections": parser.to_dict()}
+        return
+
+    # Counting tokens may load the model's tokenizer, so keep it off the event loop
+    context = await loop.run_in_executor(
+        None, processor.format_context, relevant_docs, model
+    )
+    prompt = format_prompt(context, query)
+
+    logger.info("Streaming LLM response")
+    parser = SectionParser()
+    async for chunk in stream_llm_response(prompt, system_role, model):
+        yield "token", {"text": chunk}
+        for name, content in parser.feed(chunk):
+            yield "section", {"name": name, "content": content}
+    for name, content in parser.close():
+        yield "section", {"name": name, "content": content}
+
+    if parser.start is None:
+        logger.warning(
+            "Could not extract clean structured response, returning full response"
+        )
+    response = parser.response
+    logger.info(f"Response length: {len(response)} characters")
+    await loop.run_in_executor(
+        None, _store_answer, processor, query, cache_key, response
+    )
+    yield "done", {"response": response, "sections": parser.to_dict()}
@@ -0,0 +1,330 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+
+# Set up logging
+logger = logging.getLogger("ai_fitness_api.loaders")
+
+# Load environment variables
+load_dotenv()
+
+# Rows parsed per chunk, which bounds the raw CSV the parser holds at once
+CSV_CHUNK_SIZE = int(os.getenv("CSV_CHUNK_SIZE", "50000"))
+# Worker processes used to parse export files; 0 uses every core
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "0")) or os.cpu_count() or 1
+# Exports smaller than this in total are parsed in this process, since starting
+# worker processes costs more than parsing them
+INGEST_PARALLEL_MIN_MB = float(os.getenv("INGEST_PARALLEL_MIN_MB", "64"))
+# Parsed exports are cached as Parquet here, relative to the data directory; an
+# empty value disables the cache
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", ".cache")
+
+# Parquet schema metadata key holding the source file's cache key
+CACHE_METADATA_KEY = b"ai_fitness_source"
+
+# Export layouts: the columns we read and their dtypes, plus the key columns that
+# identify a row across overlapping exports. A dtype of None is inferred, so
+# integer columns keep rendering as integers in the documents.
+NUTRITION_SPEC = {
+    "columns": {
+        "Date": str,
+        "Meal": str,
+        "Calories": "float64",
+        "Fat (g)": "float64",
+        "Carbohydrates (g)": "float64",
+        "Protein (g)": "float64",
+    },
+    "date_format": "%Y-%m-%d",
+    "keys": ["Date", "Meal"],
+}
+
+EXERCISE_SPEC = {
+    "columns": {
+        "Date": str,
+        "Exercise": str,
+        "Exercise Calories": None,
+        "Exercise Minutes": None,
+        "Steps": None,
+    },
+    "date_format": "%Y-%m-%d",
+    "keys": ["Date", "Exercise"],
+}
+
+MEASUREMENT_SPEC = {
+    "columns": {"Date": str, "Weight": None},
+    "date_format": "%Y-%m-%d",
+    "keys": ["Date"],
+}
+
+# Garmin values are read as text and normalized: "--" means missing, numbers may
+# carry thousands separators and durations are HH:MM:SS
+GARMIN_SPEC = {
+    "columns": {
+        "Activity Type": str,
+        "Date": str,
+        "Distance": str,
+        "Calories": str,
+        "Total Time": str,
+        "Time": str,
+        "Avg HR": str,
+        "Max HR": str,
+        "Steps": str,
+    },
+    "date_format": "%Y-%m-%d %H:%M:%S",
+    "keys": ["Date", "Activity Type"],
+    "numeric": ["Distance", "Calories", "Avg HR", "Max HR", "Steps"],
+    "durations": ["Total Time", "Time"],
+    # Older exports call the activity duration "Time"
+    "renames": {"Time": "Total Time"},
+}
+
+
+def _parse_dates(values, date_format):
+    """Parse dates with the export's known format, falling back to inference"""
+    try:
+        return pd.to_datetime(values, format=date_format)
+    except (ValueError, TypeError):
+        logger.warning(
+            f"Dates do not match format {date_format}, falling back to inference"
+        )
+        return pd.to_datetime(values)
+
+
+def _normalize_chunk(chunk, spec):
+    """Convert one parsed chunk to the spec's types in vectorized passes"""
+    chunk["Date"] = _parse_dates(chunk["Date"], spec["date_format"])
+
+    for column in spec.get("numeric", []):
+        if column in chunk:
+            chunk[column] = pd.to_numeric(
+                chunk[column].str.replace(",", "", regex=False), errors="coerce"
+            )
+
+    for column in spec.get("durations", []):
+        if column in chunk:
+            chunk[column] = pd.to_timedelta(chunk[column], errors="coerce")
+
+    return chunk
+
+
+def parse_export(path, spec):
+    """Parse an export CSV in chunks, keeping only the spec's columns
+
+    Chunking bounds the raw text and the intermediate objects of the parser, but
+    the normalized chunks are concatenated into one frame, so peak memory still
+    grows with the number of rows kept: about twice the parsed frame while the
+    chunks are joined.
+    """
+    logger.info(f"Parsing {path} in chunks of {CSV_CHUNK_SIZE} rows")
+    start_time = time.time()
+
+    columns = spec["columns"]
+    dtypes = {name: dtype for name, dtype in columns.items() if dtype is not None}
+    reader = pd.read_csv(
+        path,
+        usecols=lambda name: name in columns,
+        dtype=dtypes,
+        chunksize=CSV_CHUNK_SIZE,
+    )
+    chunks = [_normalize_chunk(chunk, spec) for chunk in reader]
+    data = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+
+    for old_name, new_name in spec.get("renames", {}).items():
+        if old_name in data and new_name not in data:
+            data = data.rename(columns={old_name: new_name})
+
+    logger.info(
+        f"Parsed {len(data)} rows from {path} in {time.time() - start_time:.2f} seconds"
+    )
+    return data
+
+
+def _file_hash(path):
+    """Return the SHA-256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _cache_path(path, spec, cache_dir):
+    """Return the cache file for an export, distinct per source path and spec"""
+    key = json.dumps([os.path.abspath(path), repr(spec)])
+    return os.path.join(
+        cache_dir, hashlib.sha256(key.encode()).hexdigest() + ".parquet"
+    )
+
+
+def _read_cached(path, stat, cache_file):
+    """Return the cached frame for an export if the source is unchanged, else None
+
+    Size and mtime are checked first; if only the mtime moved (a re-download of the
+    same export) the content hash decides.
+    """
+    if not os.path.exists(cache_file):
+        return None
+
+    metadata = pq.read_schema(cache_file).metadata or {}
+    source = json.loads(metadata.get(CACHE_METADATA_KEY, b"{}"))
+    if source.get("size") != stat.st_size:
+        return None
+    if source.get("mtime_ns") != stat.st_mtime_ns and source.get(
+        "sha256"
+    ) != _file_hash(path):
+        return None
+
+    # Memory-map the file so unchanged exports load without a parse or a copy
+    data = pd.read_parquet(cache_file, memory_map=True)
+
+    # Parquet gives None for missing strings where the CSV parser gives NaN; match
+    # the parse so documents do not depend on whether the cache was warm
+    for column in data.columns[data.dtypes == object]:
+        data[column] = data[column].replace({None: np.nan})
+    return data
+
+
+def _write_cache(data, path, stat, cache_file):
+    """Write a parsed export to the cache, tagged with its source file's key"""
+    source = {
+        "path": os.path.abspath(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": _file_hash(path),
+    }
+    table = pa.Table.from_pandas(data, preserve_index=False)
+    table = table.replace_schema_metadata(
+        {**(table.schema.metadata or {}), CACHE_METADATA_KEY: json.dumps(source)}
+    )
+
+    # Write to a temporary file and rename, so readers never see a partial file
+    cache_dir = os.path.dirname(cache_file)
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_file = f"{cache_file}.{os.getpid()}.tmp"
+    pq.write_table(table, temp_file)
+    os.replace(temp_file, cache_file)
+    logger.info(f"Cached parsed {path} in {cache_dir}")
+
+
+def read_export(path, spec, cache_dir=None):
+    """Read an export, using the Parquet cache in ``cache_dir`` when the file is unchanged"""
+    if not cache_dir:
+        return parse_export(path, spec)
+
+    stat = os.stat(path)
+    cache_file = _cache_path(path, spec, cache_dir)
+    try:
+        data = _read_cached(path, stat, cache_file)
+        if data is not None:
+            logger.info(f"Loaded {len(data)} cached rows for {path}")
+            return data
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable cache for {path}: {str(e)}")
+
+    data = parse_export(path, spec)
+    try:
+        _write_cache(data, path, stat, cache_file)
+    except Exception as e:
+        logger.warning(f"Error caching {path}: {str(e)}")
+    return data
+
+
+def _file_size(path):
+    """Return the size of a file in bytes, or 0 if it cannot be read"""
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def read_exports(jobs, cache_dir=None):
+    """Read many export files, in worker processes when they are large
+
+    ``jobs`` is a list of (source, path, spec) tuples; unchanged files are loaded
+    from the Parquet cache in ``cache_dir`` instead of being parsed again. Returns a dict mapping each
+    source to its parsed frames, in job order. Files that fail to parse are logged
+    and skipped.
+    """
+    frames = {source: [] for source, _, _ in jobs}
+    if not jobs:
+        return frames
+
+    total_bytes = sum(_file_size(path) for _, path, _ in jobs)
+    workers = min(INGEST_WORKERS, len(jobs))
+    if total_bytes < INGEST_PARALLEL_MIN_MB * 1024 * 1024:
+        workers = 1
+    logger.info(
+        f"Reading {len(jobs)} export files ({total_bytes / 1e6:.1f} MB) with {workers} workers"
+    )
+    start_time = time.time()
+
+    if workers == 1:
+        results = []
+        for _, path, spec in jobs:
+            try:
+                results.append(read_export(path, spec, cache_dir))
+            except Exception as e:
+                logger.error(f"Error reading {path}: {str(e)}")
+                results.append(None)
+    else:
+        # Spawn rather than fork, since the parent may hold torch and DB threads
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            futures = [
+                pool.submit(read_export, path, spec, cache_dir)
+                for _, path, spec in jobs
+            ]
+            results = []
+            for (_, path, _), future in zip(jobs, futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    logger.error(f"Error reading {path}: {str(e)}")
+                    results.append(None)
+
+    for (source, _, _), data in zip(jobs, results):
+        if data is not None:
+            frames[source].append(data)
+
+    logger.info(
+        f"Read {len(jobs)} export files in {time.time() - start_time:.2f} seconds"
+    )
+    return frames
+
+
+def merge_exports(frames, spec):
+    """Merge frames from overlapping exports, later files winning on duplicate keys
+
+    Rows are matched on the spec's key columns plus their occurrence within a file,
+    so repeated rows inside one export (two runs on the same day) are kept while
+    the same row seen in two exports is stored once. The result is sorted by date.
+    """
+    if not frames:
+        return None
+
+    keys = [key for key in spec["keys"] if key in frames[0]]
+    tagged = [
+        data.assign(_occurrence=data.groupby(keys, dropna=False, sort=False).cumcount())
+        for data in frames
+    ]
+    merged = pd.concat(tagged, ignore_index=True)
+    before = len(merged)
+    merged = merged.drop_duplicates(subset=keys + ["_occurrence"], keep="last")
+    if len(merged) < before:
+        logger.info(f"Dropped {before - len(merged)} duplicate rows across exports")
+
+    return (
+        merged.drop(columns="_occurrence")
+        .sort_values("Date", kind="stable")
+        .reset_index(drop=True)
+    )
@@ -1,12 +1,17 @@
-import os
 import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-import uvicorn
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 
-from .database import create_tables
+from .answer_cache import answer_cache
+from .context import context_stats
+from .embeddings import query_embedding_cache
+from .ingest import get_ingest_worker
+from .llm import close_async_client
 from .routers import router
+from .warmup import get_warmup
 
 # Set up logging
 logging.basicConfig(
@@ -43,12 +48,24 @@ app.include_router(router, prefix="/api")
 logger.info("Routers included")
 
 
-# Create database tables on startup
+# Create database tables and load the model in the background, so the app
+# answers health checks while it warms up
 @app.on_event("startup")
 async def startup_event():
-    logger.info("Application startup: Creating database tables")
-    create_tables()
-    logger.info("Database tables created successfully")
+    logger.info("Application startup: Starting warmup")
+    get_warmup().start()
+    logger.info("Application startup: Starting ingest worker")
+    get_ingest_worker().start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    logger.info("Application shutdown: Stopping warmup")
+    get_warmup().stop()
+    logger.info("Application shutdown: Stopping ingest worker")
+    get_ingest_worker().stop()
+    logger.info("Application shutdown: Closing LLM client")
+    await close_async_client()
 
 
 @app.get("/")
@@ -57,5 +74,36 @@ async def root():
     return {
         "message": "Welcome to AI Fitness API",
         "docs": "/docs",
-        "endpoints": {"query": "/api/query", "upload": "/api/upload"},
-    }
\ No newline at end of file
+        "endpoints": {
+            "query": "/api/query",
+            "upload": "/api/upload",
+            "analytics": "/api/analytics",
+            "search": "/api/search",
+        },
+    }
+
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "ok"}
+
+
+@app.get("/stats")
+async def stats():
+    """Hit rates of the query embedding and answer caches, and the prompt tokens saved by compacting contexts"""
+    return {
+        "query_embedding_cache": query_embedding_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "context": context_stats.stats(),
+    }
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness probe: 200 once the database, model and retrieval index are warm, 503 before"""
+    warmup = get_warmup()
+    return JSONResponse(
+        status_code=200 if warmup.ready else 503,
+        content=jsonable_encoder(warmup.to_dict()),
+    )
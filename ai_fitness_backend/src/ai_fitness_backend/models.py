@@ -1,16 +1,53 @@
 import logging
-from typing import List, Optional
+from datetime import date, datetime
+from typing import Dict, List, Optional
 from pydantic import BaseModel, validator
 
 # Set up logging
 logger = logging.getLogger("ai_fitness_api.models")
 
+DOCUMENT_TYPES = ["nutrition", "exercise", "measurement", "garmin", "summary"]
 
-class QueryRequest(BaseModel):
-    query: str
-    system_role: str = "You are a helpful fitness and nutrition assistant."
+
+# Most queries accepted by one batch request
+MAX_BATCH_QUERIES = 100
+
+
+class RetrievalFilters(BaseModel):
     top_k: int = 7
-    model: str = "mistralai/Mistral-7B-Instruct-v0.2"
+    # Optional prefilters; relative windows like "last 30 days" are also parsed from the query
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    types: Optional[List[str]] = None
+
+    @validator("top_k")
+    def top_k_must_be_positive(cls, v):
+        if v <= 0:
+            logger.warning(f"Invalid top_k value received: {v}")
+            raise ValueError("top_k must be positive")
+        logger.debug(f"top_k validated: {v}")
+        return v
+
+    @validator("date_to")
+    def date_range_must_be_ordered(cls, v, values):
+        date_from = values.get("date_from")
+        if v is not None and date_from is not None and v < date_from:
+            logger.warning(f"Invalid date range received: {date_from} to {v}")
+            raise ValueError("date_to must not be before date_from")
+        return v
+
+    @validator("types")
+    def types_must_be_known(cls, v):
+        if v is not None:
+            unknown = set(v) - set(DOCUMENT_TYPES)
+            if unknown:
+                logger.warning(f"Unknown document types received: {unknown}")
+                raise ValueError(f"types must be among {DOCUMENT_TYPES}")
+        return v
+
+
+class SearchRequest(RetrievalFilters):
+    query: str
 
     @validator("query")
     def query_must_not_be_empty(cls, v):
@@ -20,29 +57,110 @@ class QueryRequest(BaseModel):
         logger.debug(f"Query validated: {v[:50]}...")
         return v
 
-    @validator("top_k")
-    def top_k_must_be_positive(cls, v):
-        if v <= 0:
-            logger.warning(f"Invalid top_k value received: {v}")
-            raise ValueError("top_k must be positive")
-        logger.debug(f"top_k validated: {v}")
+
+class QueryRequest(SearchRequest):
+    system_role: str = "You are a helpful fitness and nutrition assistant."
+    model: str = "mistralai/Mistral-7B-Instruct-v0.2"
+
+
+class BatchSearchRequest(RetrievalFilters):
+    queries: List[str]
+
+    @validator("queries")
+    def queries_must_be_valid(cls, v):
+        if not v:
+            logger.warning("Empty batch received")
+            raise ValueError("queries cannot be empty")
+        if len(v) > MAX_BATCH_QUERIES:
+            logger.warning(f"Batch of {len(v)} queries received")
+            raise ValueError(f"At most {MAX_BATCH_QUERIES} queries per batch")
+        if any(not query.strip() for query in v):
+            logger.warning("Empty query received in batch")
+            raise ValueError("Queries cannot be empty")
+        logger.debug(f"Batch of {len(v)} queries validated")
         return v
 
 
+class ResponseSections(BaseModel):
+    observations: List[str] = []
+    dietary_suggestions: List[str] = []
+    summary: Optional[str] = None
+
+
 class QueryResponse(BaseModel):
     response: str
+    # Parsed OBSERVATIONS / DIETARY SUGGESTIONS / SUMMARY; None if the answer is unstructured
+    sections: Optional[ResponseSections] = None
 
     def __init__(self, **data):
         super().__init__(**data)
         logger.debug(f"Created QueryResponse with length: {len(self.response)} chars")
 
 
+class SearchResult(BaseModel):
+    text: str
+    type: str
+    date: str
+    # Cosine similarity of the document to the query, in [-1, 1]
+    similarity: float
+    # Ranking score: the similarity mixed with the BM25 keyword score, in [-1, 1]
+    score: float
+
+
+class SearchResponse(BaseModel):
+    query: str
+    results: List[SearchResult]
+
+
+class BatchSearchResponse(BaseModel):
+    # One entry per query, in request order
+    results: List[SearchResponse]
+
+
 class UploadResponse(BaseModel):
     message: str
     files_processed: List[str]
+    # Ingest job that will process the files; poll /api/upload/jobs/{job_id}
+    job_id: Optional[str] = None
 
     def __init__(self, **data):
         super().__init__(**data)
         logger.debug(
             f"Created UploadResponse with {len(data.get('files_processed', []))} files"
         )
+
+
+class IngestJobResponse(BaseModel):
+    job_id: str
+    user_id: str
+    status: str  # "queued", "running", "completed" or "failed"
+    files: List[str]
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+class MetricSummary(BaseModel):
+    days: int  # Days in the range with a value
+    mean: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    total: Optional[float] = None
+    first: Optional[float] = None
+    last: Optional[float] = None
+    change: Optional[float] = None  # last - first
+
+
+class TrendPoint(BaseModel):
+    date: date
+    value: Optional[float] = None
+    rolling_7: Optional[float] = None
+    rolling_30: Optional[float] = None
+
+
+class AnalyticsResponse(BaseModel):
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    metrics: Dict[str, MetricSummary]
+    trends: Dict[str, List[TrendPoint]] = {}
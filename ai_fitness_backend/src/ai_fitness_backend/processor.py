@@ -3,37 +3,138 @@ import time
 import logging
 import numpy as np
 import pandas as pd
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
+from sqlalchemy import select, update
 from sqlalchemy.orm import Session
 
-from .database import Document, Embedding
+from .ann import ann_enabled, build_ann_index, clear_ann_index, update_ann_index
+from .context import build_context
+from .database import (
+    Document,
+    Embedding,
+    insert_documents,
+    insert_embeddings,
+    text_hash,
+)
+from .embeddings import (
+    encode_documents,
+    encode_queries,
+    encode_query,
+    get_embedding_model,
+)
+from .filters import parse_relative_window
+from .loaders import (
+    EXERCISE_SPEC,
+    EXPORT_CACHE_DIR,
+    GARMIN_SPEC,
+    MEASUREMENT_SPEC,
+    NUTRITION_SPEC,
+    merge_exports,
+    read_exports,
+)
+from .index import (
+    DocumentMetadata,
+    bump_generation,
+    embeddings_from_bytes,
+    get_index_pool,
+    normalize_embeddings,
+    select_top_k,
+)
+from .lexical import (
+    LEXICAL_POOL_SIZE,
+    LexicalIndex,
+    delete_document_terms,
+    fuse_scores,
+    lexical_enabled,
+    store_document_terms,
+)
+from .rollups import build_daily_rollups, store_daily_rollups
+from .users import DEFAULT_USER_ID
 
 # Set up logging
 logger = logging.getLogger("ai_fitness_api.processor")
 
+# Export sources: (attribute, data subdirectory, file prefix, layout, label)
+DATA_SOURCES = [
+    ("nutrition_data", "mfp", "Nutrition-Summary", NUTRITION_SPEC, "nutrition"),
+    ("exercise_data", "mfp", "Exercise-Summary", EXERCISE_SPEC, "exercise"),
+    ("measurement_data", "mfp", "Measurement-Summary", MEASUREMENT_SPEC, "measurement"),
+    ("garmin_activities", "garmin", "Activities", GARMIN_SPEC, "Garmin"),
+]
+
+# Queries of a batch scored per matrix product, which bounds the score matrix
+BATCH_SCORE_BLOCK = 16
+
+# Nutrition columns summed per day
+NUTRITION_COLUMNS = ["Calories", "Protein (g)", "Carbohydrates (g)", "Fat (g)"]
+
+
+def _format_values(values, spec=""):
+    """Format every value of a column as a string, like an f-string field would"""
+    return values.map(("{:" + spec + "}").format)
+
+
+def _format_duration(values):
+    """Format a duration column as HH:MM:SS, passing through columns that are not timedeltas"""
+    if not pd.api.types.is_timedelta64_dtype(values):
+        return _format_values(values)
+
+    seconds = values.dt.total_seconds()
+    whole = seconds.fillna(0).round().astype("int64")
+    text = (
+        (whole // 3600).map("{:02d}".format)
+        + ":"
+        + (whole // 60 % 60).map("{:02d}".format)
+        + ":"
+        + (whole % 60).map("{:02d}".format)
+    )
+    return text.where(seconds.notna(), "nan")
+
+
+def _document_keys(type_dates):
+    """Return a stable (type, date, ordinal) key for each (type, date) pair
+
+    Documents sharing a type and date, like the period summaries, are told apart
+    by their order of appearance.
+    """
+    counts = {}
+    keys = []
+    for type_date in type_dates:
+        ordinal = counts.get(type_date, 0)
+        counts[type_date] = ordinal + 1
+        keys.append((*type_date, ordinal))
+    return keys
+
+
+def _make_documents(texts, dates, doc_type):
+    """Build document dicts from aligned text and date columns"""
+    return [
+        {"text": text, "type": doc_type, "date": date}
+        for text, date in zip(texts, dates)
+    ]
+
 
 class FitnessDataProcessor:
-    def __init__(self, data_dir="data", db: Session = None):
-        logger.info(f"Initializing FitnessDataProcessor with data_dir={data_dir}")
+    def __init__(self, data_dir="data", db: Session = None, user_id=DEFAULT_USER_ID):
+        logger.info(
+            f"Initializing FitnessDataProcessor with data_dir={data_dir}, user_id={user_id}"
+        )
         self.data_dir = data_dir
+        # Owner of the documents this processor reads and writes
+        self.user_id = user_id
         self.nutrition_data = None
         self.exercise_data = None
         self.measurement_data = None
         self.garmin_activities = None
-        logger.info("Loading SentenceTransformer model")
-        start_time = time.time()
-        try:
-            self.model = SentenceTransformer("all-MiniLM-L6-v2")
-            logger.info(
-                f"SentenceTransformer model loaded in {time.time() - start_time:.2f} seconds"
-            )
-        except Exception as e:
-            logger.error(f"Error loading SentenceTransformer model: {str(e)}")
-            raise
+        self.model = get_embedding_model()
 
         self.document_embeddings = None
+        self.ann_index = None
+        self.lexical_index = None
+        self.metadata = None
         self.documents = None
+        self.daily_rollups = None
+        # Fingerprint of the stored corpus, set when documents come from the database
+        self.corpus_version = None
         self.db = db
 
         # Create data directory if it doesn't exist
@@ -46,87 +147,40 @@ class FitnessDataProcessor:
             raise
 
     def load_data(self):
-        """Load all CSV data files"""
+        """Load, merge and deduplicate every CSV export file, parsing files in parallel"""
         logger.info("Loading data files")
 
-        # Load nutrition data
-        try:
-            nutrition_files = [
-                f
-                for f in os.listdir(os.path.join(self.data_dir, "mfp"))
-                if f.startswith("Nutrition-Summary")
-            ]
-            if nutrition_files:
-                nutrition_path = os.path.join(self.data_dir, "mfp", nutrition_files[0])
-                logger.info(f"Loading nutrition data from {nutrition_path}")
-                self.nutrition_data = pd.read_csv(nutrition_path)
-                self.nutrition_data["Date"] = pd.to_datetime(
-                    self.nutrition_data["Date"]
-                )
-                logger.info(f"Loaded {len(self.nutrition_data)} nutrition records")
-            else:
-                logger.warning("No nutrition files found")
-        except Exception as e:
-            logger.error(f"Error loading nutrition data: {str(e)}")
-
-        # Load exercise data
-        try:
-            exercise_files = [
-                f
-                for f in os.listdir(os.path.join(self.data_dir, "mfp"))
-                if f.startswith("Exercise-Summary")
-            ]
-            if exercise_files:
-                exercise_path = os.path.join(self.data_dir, "mfp", exercise_files[0])
-                logger.info(f"Loading exercise data from {exercise_path}")
-                self.exercise_data = pd.read_csv(exercise_path)
-                self.exercise_data["Date"] = pd.to_datetime(self.exercise_data["Date"])
-                logger.info(f"Loaded {len(self.exercise_data)} exercise records")
-            else:
-                logger.warning("No exercise files found")
-        except Exception as e:
-            logger.error(f"Error loading exercise data: {str(e)}")
-        # Load measurement data
-        try:
-            measurement_files = [
-                f
-                for f in os.listdir(os.path.join(self.data_dir, "mfp"))
-                if f.startswith("Measurement-Summary")
-            ]
-            if measurement_files:
-                measurement_path = os.path.join(
-                    self.data_dir, "mfp", measurement_files[0]
-                )
-                logger.info(f"Loading measurement data from {measurement_path}")
-                self.measurement_data = pd.read_csv(measurement_path)
-                self.measurement_data["Date"] = pd.to_datetime(
-                    self.measurement_data["Date"]
-                )
-                logger.info(f"Loaded {len(self.measurement_data)} measurement records")
-            else:
-                logger.warning("No measurement files found")
-        except Exception as e:
-            logger.error(f"Error loading measurement data: {str(e)}")
-
-        # Load Garmin activities
-        try:
-            garmin_files = [
-                f
-                for f in os.listdir(os.path.join(self.data_dir, "garmin"))
-                if f.startswith("Activities")
-            ]
-            if garmin_files:
-                garmin_path = os.path.join(self.data_dir, "garmin", garmin_files[0])
-                logger.info(f"Loading Garmin activities from {garmin_path}")
-                self.garmin_activities = pd.read_csv(garmin_path)
-                self.garmin_activities["Date"] = pd.to_datetime(
-                    self.garmin_activities["Date"]
+        jobs = []
+        for attribute, subdir, prefix, spec, label in DATA_SOURCES:
+            try:
+                files = sorted(
+                    f
+                    for f in os.listdir(os.path.join(self.data_dir, subdir))
+                    if f.startswith(prefix)
                 )
-                logger.info(f"Loaded {len(self.garmin_activities)} Garmin activities")
-            else:
-                logger.warning("No Garmin files found")
-        except Exception as e:
-            logger.error(f"Error loading Garmin data: {str(e)}")
+            except Exception as e:
+                logger.error(f"Error listing {label} files: {str(e)}")
+                continue
+            if not files:
+                logger.warning(f"No {label} files found")
+            for f in files:
+                path = os.path.join(self.data_dir, subdir, f)
+                logger.info(f"Loading {label} data from {path}")
+                jobs.append((attribute, path, spec))
+
+        cache_dir = None
+        if EXPORT_CACHE_DIR:
+            cache_dir = os.path.join(self.data_dir, EXPORT_CACHE_DIR)
+        frames = read_exports(jobs, cache_dir)
+
+        for attribute, _, _, spec, label in DATA_SOURCES:
+            try:
+                data = merge_exports(frames.get(attribute, []), spec)
+                if data is not None:
+                    setattr(self, attribute, data)
+                    logger.info(f"Loaded {len(data)} {label} records")
+            except Exception as e:
+                logger.error(f"Error loading {label} data: {str(e)}")
 
         logger.info("Data loading completed")
 
@@ -137,112 +191,133 @@ class FitnessDataProcessor:
         documents = []
 
         # Create nutrition documents
+        daily_nutrition = None
         if self.nutrition_data is not None:
             logger.info("Processing nutrition data into documents")
-            nutrition_docs_count = 0
-            for date, group in self.nutrition_data.groupby("Date"):
-                date_str = date.strftime("%Y-%m-%d")
-                daily_calories = group["Calories"].sum()
-                daily_protein = group["Protein (g)"].sum()
-                daily_carbs = group["Carbohydrates (g)"].sum()
-                daily_fat = group["Fat (g)"].sum()
-
-                doc = (
-                    f"Date: {date_str}. Nutrition summary: Total calories: {daily_calories:.1f}, "
-                    f"Protein: {daily_protein:.1f}g, Carbs: {daily_carbs:.1f}g, Fat: {daily_fat:.1f}g. "
-                )
-
-                # Add meal details
-                for _, row in group.iterrows():
-                    doc += (
-                        f"{row['Meal']}: Calories {row['Calories']:.1f}, Protein {row['Protein (g)']:.1f}g, "
-                        f"Carbs {row['Carbohydrates (g)']:.1f}g, Fat {row['Fat (g)']:.1f}g. "
-                    )
-
-                documents.append({"text": doc, "type": "nutrition", "date": date_str})
-                nutrition_docs_count += 1
-            logger.info(f"Created {nutrition_docs_count} nutrition documents")
+            nutrition = self.nutrition_data
+            daily_nutrition = nutrition.groupby("Date")[NUTRITION_COLUMNS].sum()
+
+            # Meal details, assembled column-wise and joined per day
+            meals = (
+                _format_values(nutrition["Meal"])
+                + ": Calories "
+                + _format_values(nutrition["Calories"], ".1f")
+                + ", Protein "
+                + _format_values(nutrition["Protein (g)"], ".1f")
+                + "g, Carbs "
+                + _format_values(nutrition["Carbohydrates (g)"], ".1f")
+                + "g, Fat "
+                + _format_values(nutrition["Fat (g)"], ".1f")
+                + "g. "
+            )
+            daily_meals = meals.groupby(nutrition["Date"]).agg("".join)
+
+            dates = daily_nutrition.index.strftime("%Y-%m-%d")
+            texts = (
+                "Date: "
+                + dates
+                + ". Nutrition summary: Total calories: "
+                + _format_values(daily_nutrition["Calories"], ".1f")
+                + ", Protein: "
+                + _format_values(daily_nutrition["Protein (g)"], ".1f")
+                + "g, Carbs: "
+                + _format_values(daily_nutrition["Carbohydrates (g)"], ".1f")
+                + "g, Fat: "
+                + _format_values(daily_nutrition["Fat (g)"], ".1f")
+                + "g. "
+                + daily_meals.reindex(daily_nutrition.index, fill_value="")
+            )
+            documents.extend(_make_documents(texts, dates, "nutrition"))
+            logger.info(f"Created {len(texts)} nutrition documents")
 
         # Create exercise documents
         if self.exercise_data is not None:
             logger.info("Processing exercise data into documents")
-            exercise_docs_count = 0
-            for date, group in self.exercise_data.groupby("Date"):
-                date_str = date.strftime("%Y-%m-%d")
-                total_calories = group["Exercise Calories"].sum()
-                total_minutes = group["Exercise Minutes"].sum()
-                steps = group["Steps"].sum()
-
-                doc = (
-                    f"Date: {date_str}. Exercise summary: Burned {total_calories:.1f} calories, "
-                    f"Exercised for {total_minutes} minutes, Steps: {steps}. "
-                )
-
-                # Add exercise details
-                for _, row in group.iterrows():
-                    if pd.notna(row["Exercise"]):
-                        doc += (
-                            f"Activity: {row['Exercise']}, Duration: {row['Exercise Minutes']} minutes, "
-                            f"Calories: {row['Exercise Calories']}. "
-                        )
-
-                documents.append({"text": doc, "type": "exercise", "date": date_str})
-                exercise_docs_count += 1
-            logger.info(f"Created {exercise_docs_count} exercise documents")
+            exercise = self.exercise_data
+            daily_exercise = exercise.groupby("Date")[
+                ["Exercise Calories", "Exercise Minutes", "Steps"]
+            ].sum()
+
+            # Exercise details, only for rows that name an exercise
+            named = exercise[exercise["Exercise"].notna()]
+            activities = (
+                "Activity: "
+                + _format_values(named["Exercise"])
+                + ", Duration: "
+                + _format_values(named["Exercise Minutes"])
+                + " minutes, Calories: "
+                + _format_values(named["Exercise Calories"])
+                + ". "
+            )
+            daily_activities = activities.groupby(named["Date"]).agg("".join)
+
+            dates = daily_exercise.index.strftime("%Y-%m-%d")
+            texts = (
+                "Date: "
+                + dates
+                + ". Exercise summary: Burned "
+                + _format_values(daily_exercise["Exercise Calories"], ".1f")
+                + " calories, Exercised for "
+                + _format_values(daily_exercise["Exercise Minutes"])
+                + " minutes, Steps: "
+                + _format_values(daily_exercise["Steps"])
+                + ". "
+                + daily_activities.reindex(daily_exercise.index, fill_value="")
+            )
+            documents.extend(_make_documents(texts, dates, "exercise"))
+            logger.info(f"Created {len(texts)} exercise documents")
 
         # Create measurement documents
         if self.measurement_data is not None:
             logger.info("Processing measurement data into documents")
-            measurement_docs_count = 0
-            for _, row in self.measurement_data.iterrows():
-                date_str = row["Date"].strftime("%Y-%m-%d")
-                doc = f"Date: {date_str}. Measurement: Weight {row['Weight']} kg."
-                documents.append({"text": doc, "type": "measurement", "date": date_str})
-                measurement_docs_count += 1
-            logger.info(f"Created {measurement_docs_count} measurement documents")
+            dates = self.measurement_data["Date"].dt.strftime("%Y-%m-%d")
+            texts = (
+                "Date: "
+                + dates
+                + ". Measurement: Weight "
+                + _format_values(self.measurement_data["Weight"])
+                + " kg."
+            )
+            documents.extend(_make_documents(texts, dates, "measurement"))
+            logger.info(f"Created {len(texts)} measurement documents")
 
         # Create Garmin activity documents
         if self.garmin_activities is not None:
             logger.info("Processing Garmin activities into documents")
-            garmin_docs_count = 0
-            for _, row in self.garmin_activities.iterrows():
-                date_str = row["Date"].strftime("%Y-%m-%d %H:%M:%S")
-                doc = (
-                    f"Date: {date_str}. Garmin activity: {row['Activity Type']}, "
-                    f"Duration: {row['Total Time']}, Calories: {row['Calories']}"
+            garmin = self.garmin_activities
+            dates = garmin["Date"].dt.strftime("%Y-%m-%d %H:%M:%S")
+            distance = pd.to_numeric(garmin["Distance"], errors="coerce")
+            texts = (
+                "Date: "
+                + dates
+                + ". Garmin activity: "
+                + _format_values(garmin["Activity Type"])
+                + ", Duration: "
+                + _format_duration(garmin["Total Time"])
+                + ", Calories: "
+                + _format_values(garmin["Calories"])
+                + (", Distance: " + _format_values(garmin["Distance"]) + " km").where(
+                    distance > 0, ""
                 )
-
-                if pd.notna(row["Distance"]) and float(row["Distance"]) > 0:
-                    doc += f", Distance: {row['Distance']} km"
-
-                if pd.notna(row["Avg HR"]):
-                    doc += f", Average HR: {row['Avg HR']}"
-
-                if pd.notna(row["Max HR"]):
-                    doc += f", Max HR: {row['Max HR']}"
-
-                documents.append({"text": doc, "type": "garmin", "date": date_str})
-                garmin_docs_count += 1
-            logger.info(f"Created {garmin_docs_count} Garmin activity documents")
+                + (", Average HR: " + _format_values(garmin["Avg HR"])).where(
+                    garmin["Avg HR"].notna(), ""
+                )
+                + (", Max HR: " + _format_values(garmin["Max HR"])).where(
+                    garmin["Max HR"].notna(), ""
+                )
+            )
+            documents.extend(_make_documents(texts, dates, "garmin"))
+            logger.info(f"Created {len(texts)} Garmin activity documents")
 
         # Add summary documents
-        if self.nutrition_data is not None:
+        if daily_nutrition is not None:
             logger.info("Creating nutrition summary document")
-            avg_daily_calories = (
-                self.nutrition_data.groupby("Date")["Calories"].sum().mean()
-            )
-            avg_daily_protein = (
-                self.nutrition_data.groupby("Date")["Protein (g)"].sum().mean()
-            )
-            avg_daily_carbs = (
-                self.nutrition_data.groupby("Date")["Carbohydrates (g)"].sum().mean()
-            )
-            avg_daily_fat = self.nutrition_data.groupby("Date")["Fat (g)"].sum().mean()
+            averages = daily_nutrition.mean()
 
             summary_doc = (
-                f"Nutrition summary for the entire period: Average daily calories: {avg_daily_calories:.1f}, "
-                f"Average daily protein: {avg_daily_protein:.1f}g, Average daily carbs: {avg_daily_carbs:.1f}g, "
-                f"Average daily fat: {avg_daily_fat:.1f}g."
+                f"Nutrition summary for the entire period: Average daily calories: {averages['Calories']:.1f}, "
+                f"Average daily protein: {averages['Protein (g)']:.1f}g, Average daily carbs: {averages['Carbohydrates (g)']:.1f}g, "
+                f"Average daily fat: {averages['Fat (g)']:.1f}g."
             )
             documents.append({"text": summary_doc, "type": "summary", "date": "all"})
 
@@ -260,6 +335,9 @@ class FitnessDataProcessor:
             documents.append({"text": weight_doc, "type": "summary", "date": "all"})
 
         self.documents = documents
+        self.metadata = None
+        self.lexical_index = None
+        self.corpus_version = None
         logger.info(
             f"Created {len(documents)} documents from the data in {time.time() - start_time:.2f} seconds"
         )
@@ -270,93 +348,312 @@ class FitnessDataProcessor:
 
         return documents
 
-    def store_documents_in_db(self):
-        """Store documents in the database"""
+    def create_daily_rollups(self):
+        """Aggregate the loaded data into daily totals, storing them if a db session is set"""
+        logger.info("Creating daily rollups from loaded data")
+        start_time = time.time()
+        self.daily_rollups = build_daily_rollups(
+            self.nutrition_data,
+            self.exercise_data,
+            self.measurement_data,
+            self.garmin_activities,
+        )
+        logger.info(
+            f"Created {len(self.daily_rollups)} daily rollups in {time.time() - start_time:.2f} seconds"
+        )
+
+        if self.db:
+            try:
+                store_daily_rollups(self.db, self.daily_rollups, self.user_id)
+                self.db.commit()
+                logger.info("Stored daily rollups in the database")
+            except Exception as e:
+                logger.error(f"Error storing daily rollups in database: {str(e)}")
+                self.db.rollback()
+                raise
+
+        return self.daily_rollups
+
+    def store_documents_in_db(self, incremental=True):
+        """Store documents in the database, only writing changed documents when incremental"""
         if not self.documents:
             logger.warning("No documents to store in database")
             return
 
+        if incremental:
+            self._store_changed_documents()
+        else:
+            self._store_all_documents()
+
+    def _user_documents(self):
+        """Query the ids of the user's stored documents"""
+        return select(Document.id).where(Document.user_id == self.user_id)
+
+    def _store_all_documents(self):
+        """Replace every stored document and embedding of the user"""
         logger.info(f"Storing {len(self.documents)} documents in database")
         start_time = time.time()
 
         try:
             # Clear existing documents and embeddings
             logger.info("Clearing existing documents and embeddings")
-            self.db.query(Embedding).delete()
-            self.db.query(Document).delete()
-            self.db.commit()
+            self.db.query(Embedding).filter(
+                Embedding.document_id.in_(self._user_documents())
+            ).delete(synchronize_session=False)
+            delete_document_terms(self.db, self._user_documents())
+            self.db.query(Document).filter(Document.user_id == self.user_id).delete(
+                synchronize_session=False
+            )
 
             # Add new documents
             logger.info("Adding new documents to database")
-            db_documents = []
-            for doc in self.documents:
-                db_doc = Document(text=doc["text"], type=doc["type"], date=doc["date"])
-                self.db.add(db_doc)
-                db_documents.append(db_doc)
+            document_ids = insert_documents(
+                self.db,
+                [
+                    {
+                        "user_id": self.user_id,
+                        "text": doc["text"],
+                        "type": doc["type"],
+                        "date": doc["date"],
+                        "content_hash": text_hash(doc["text"]),
+                    }
+                    for doc in self.documents
+                ],
+            )
+            logger.info(f"Added {len(document_ids)} documents to database")
 
-            self.db.commit()
-            logger.info(f"Added {len(db_documents)} documents to database")
-
-            # Create embeddings for documents
-            logger.info("Creating embeddings for documents")
-            texts = [doc["text"] for doc in self.documents]
-            embeddings = self.model.encode(texts)
-
-            # Store embeddings
-            logger.info("Storing embeddings in database")
-            for i, (doc, embedding) in enumerate(zip(db_documents, embeddings)):
-                db_embedding = Embedding(
-                    document_id=doc.id,
-                    embedding=embedding.tobytes(),  # Convert numpy array to bytes for storage
-                )
-                self.db.add(db_embedding)
+            # Index the documents' terms for lexical retrieval
+            store_document_terms(
+                self.db, document_ids, [doc["text"] for doc in self.documents]
+            )
+
+            # Create and store embeddings for documents, one block at a time
+            logger.info("Creating and storing embeddings for documents")
+            embeddings = self._encode_documents(
+                [doc["text"] for doc in self.documents], document_ids
+            )
+
+            # Build the approximate nearest-neighbour index alongside the embeddings
+            build_ann_index(
+                self.db, document_ids, normalize_embeddings(embeddings), self.user_id
+            )
 
+            bump_generation(self.db, self.user_id)
             self.db.commit()
             logger.info(
-                f"Stored {len(db_documents)} documents and embeddings in the database in {time.time() - start_time:.2f} seconds"
+                f"Stored {len(document_ids)} documents and embeddings in the database in {time.time() - start_time:.2f} seconds"
             )
         except Exception as e:
             logger.error(f"Error storing documents in database: {str(e)}")
             self.db.rollback()
             raise
 
-    def load_documents_from_db(self):
-        """Load documents from the database"""
-        if not self.db:
-            logger.warning("No database session available to load documents")
-            return
-
-        logger.info("Loading documents from database")
+    def _store_changed_documents(self):
+        """Insert, update or delete only the documents whose content changed"""
+        logger.info(
+            f"Incrementally storing {len(self.documents)} documents in database"
+        )
         start_time = time.time()
 
         try:
-            db_documents = self.db.query(Document).all()
-            self.documents = [
-                {"text": doc.text, "type": doc.type, "date": doc.date}
-                for doc in db_documents
+            existing = (
+                self.db.query(
+                    Document.id, Document.type, Document.date, Document.content_hash
+                )
+                .filter(Document.user_id == self.user_id)
+                .order_by(Document.id)
+                .all()
+            )
+            existing_by_key = {
+                key: (row.id, row.content_hash)
+                for key, row in zip(
+                    _document_keys((row.type, row.date) for row in existing),
+                    existing,
+                )
+            }
+
+            # Diff the new documents against the stored ones by key and content hash
+            to_insert = []
+            to_update = []
+            seen_keys = set()
+            new_keys = _document_keys(
+                (doc["type"], doc["date"]) for doc in self.documents
+            )
+            for key, doc in zip(new_keys, self.documents):
+                seen_keys.add(key)
+                content_hash = text_hash(doc["text"])
+                current = existing_by_key.get(key)
+                if current is None:
+                    to_insert.append((doc, content_hash))
+                elif current[1] != content_hash:
+                    to_update.append((current[0], doc, content_hash))
+            stale_ids = [
+                doc_id
+                for key, (doc_id, _) in existing_by_key.items()
+                if key not in seen_keys
             ]
-            logger.info(f"Loaded {len(self.documents)} documents from the database")
-
-            # Load embeddings
-            logger.info("Loading embeddings from database")
-            db_embeddings = self.db.query(Embedding).all()
-            if db_embeddings:
-                # Convert bytes back to numpy arrays
-                self.document_embeddings = np.array(
+            logger.info(
+                f"Document changes: {len(to_insert)} new, {len(to_update)} changed, "
+                f"{len(stale_ids)} removed, "
+                f"{len(self.documents) - len(to_insert) - len(to_update)} unchanged"
+            )
+
+            if not (to_insert or to_update or stale_ids):
+                logger.info("Stored documents are up to date")
+                return
+
+            if stale_ids:
+                logger.info(f"Removing {len(stale_ids)} stale documents")
+                self.db.query(Embedding).filter(
+                    Embedding.document_id.in_(stale_ids)
+                ).delete(synchronize_session=False)
+                delete_document_terms(self.db, stale_ids)
+                self.db.query(Document).filter(Document.id.in_(stale_ids)).delete(
+                    synchronize_session=False
+                )
+
+            if to_update:
+                logger.info(f"Updating {len(to_update)} changed documents")
+                self.db.execute(
+                    update(Document),
                     [
-                        np.frombuffer(emb.embedding, dtype=np.float32)
-                        for emb in db_embeddings
-                    ]
+                        {
+                            "id": doc_id,
+                            "text": doc["text"],
+                            "content_hash": content_hash,
+                        }
+                        for doc_id, doc, content_hash in to_update
+                    ],
                 )
-                logger.info(
-                    f"Loaded {len(self.document_embeddings)} embeddings from the database in {time.time() - start_time:.2f} seconds"
+                # Drop the embeddings and terms of changed documents; they are redone below
+                changed_ids = [doc_id for doc_id, _, _ in to_update]
+                self.db.query(Embedding).filter(
+                    Embedding.document_id.in_(changed_ids)
+                ).delete(synchronize_session=False)
+                delete_document_terms(self.db, changed_ids)
+
+            if to_insert:
+                logger.info(f"Adding {len(to_insert)} new documents")
+                document_ids = insert_documents(
+                    self.db,
+                    [
+                        {
+                            "user_id": self.user_id,
+                            "text": doc["text"],
+                            "type": doc["type"],
+                            "date": doc["date"],
+                            "content_hash": content_hash,
+                        }
+                        for doc, content_hash in to_insert
+                    ],
                 )
             else:
-                logger.warning("No embeddings found in database")
+                document_ids = []
+
+            # Only encode new and changed text
+            changed = [(doc_id, doc) for doc_id, doc, _ in to_update] + [
+                (doc_id, doc) for doc_id, (doc, _) in zip(document_ids, to_insert)
+            ]
+            changed_embeddings = None
+            if changed:
+                store_document_terms(
+                    self.db,
+                    [doc_id for doc_id, _ in changed],
+                    [doc["text"] for _, doc in changed],
+                )
+                logger.info(f"Creating embeddings for {len(changed)} documents")
+                changed_embeddings = self._encode_documents(
+                    [doc["text"] for _, doc in changed],
+                    [doc_id for doc_id, _ in changed],
+                )
+
+            self._refresh_ann_index(
+                [doc_id for doc_id, _ in changed], changed_embeddings
+            )
+            bump_generation(self.db, self.user_id)
+            self.db.commit()
+            logger.info(
+                f"Stored document changes in the database in {time.time() - start_time:.2f} seconds"
+            )
+        except Exception as e:
+            logger.error(f"Error storing documents in database: {str(e)}")
+            self.db.rollback()
+            raise
+
+    def _encode_documents(self, texts, document_ids=None):
+        """Encode texts into one matrix, inserting each block's embeddings as it is produced"""
+        embeddings = None
+        for positions, block in encode_documents(texts, self.model):
+            if embeddings is None:
+                embeddings = np.empty((len(texts), block.shape[1]), dtype=np.float32)
+            embeddings[positions] = block
+            if document_ids is not None:
+                insert_embeddings(self.db, [document_ids[i] for i in positions], block)
+        return embeddings
+
+    def _refresh_ann_index(self, changed_ids, changed_embeddings):
+        """Assign changed documents to the existing ANN index, rebuilding it when it is missing or due for retraining"""
+        self.db.flush()
+        embeddings = self.db.query(Embedding).filter(
+            Embedding.document_id.in_(self._user_documents())
+        )
+        document_ids = [
+            row.document_id
+            for row in embeddings.with_entities(Embedding.document_id).order_by(
+                Embedding.document_id
+            )
+        ]
+        if not ann_enabled(len(document_ids)):
+            clear_ann_index(self.db, self.user_id)
+            return
+
+        order = np.argsort(changed_ids, kind="stable")
+        if (
+            update_ann_index(
+                self.db,
+                document_ids,
+                np.asarray(changed_ids, dtype=np.int64)[order],
+                None if changed_embeddings is None else changed_embeddings[order],
+                self.user_id,
+            )
+            is not None
+        ):
+            return
+
+        rows = (
+            embeddings.with_entities(Embedding.document_id, Embedding.embedding)
+            .order_by(Embedding.document_id)
+            .all()
+        )
+        build_ann_index(
+            self.db,
+            [row.document_id for row in rows],
+            embeddings_from_bytes([row.embedding for row in rows]),
+            self.user_id,
+        )
+
+    def load_documents_from_db(self):
+        """Load documents from the resident retrieval index, refreshing it from the database if needed"""
+        if not self.db:
+            logger.warning("No database session available to load documents")
+            return
+
+        logger.info("Loading documents from retrieval index")
+        try:
+            # Take the snapshot once, so every field comes from the same load
+            snapshot = get_index_pool().refresh(self.db, self.user_id)
         except Exception as e:
             logger.error(f"Error loading documents from database: {str(e)}")
             raise
 
+        self.documents = snapshot.documents
+        self.document_embeddings = snapshot.embeddings
+        self.ann_index = snapshot.ann
+        self.lexical_index = snapshot.lexical
+        self.metadata = snapshot.metadata
+        self.corpus_version = snapshot.version
+        logger.info(f"Loaded {len(self.documents)} documents from the retrieval index")
+
         return self.documents
 
     def create_embeddings(self):
@@ -374,11 +671,19 @@ class FitnessDataProcessor:
             logger.info("Embeddings already exist, returning existing embeddings")
             return self.document_embeddings
 
+        if self.db:
+            # Stored documents were embedded when they were written, so reuse them
+            logger.info("Loading stored embeddings instead of re-encoding documents")
+            self.load_documents_from_db()
+            return self.document_embeddings
+
         logger.info(f"Creating embeddings for {len(self.documents)} documents")
         start_time = time.time()
         texts = [doc["text"] for doc in self.documents]
         try:
-            self.document_embeddings = self.model.encode(texts)
+            self.document_embeddings = normalize_embeddings(
+                self._encode_documents(texts)
+            )
             logger.info(
                 f"Created embeddings for all documents in {time.time() - start_time:.2f} seconds"
             )
@@ -388,42 +693,143 @@ class FitnessDataProcessor:
 
         return self.document_embeddings
 
-    def retrieve_relevant_documents(self, query, top_k=5):
-        """Retrieve the most relevant documents for a query"""
-        logger.info(f"Retrieving top {top_k} documents for query: {query}")
-        start_time = time.time()
-
+    def _prepare_retrieval(self):
+        """Make sure embeddings and the metadata index are available"""
         if self.document_embeddings is None:
             logger.info("No embeddings found, creating embeddings")
             self.create_embeddings()
 
+        if self.metadata is None:
+            self.metadata = DocumentMetadata(self.documents)
+
+    def _candidates(self, query, date_from=None, date_to=None, types=None):
+        """Return (candidates, date_from, date_to) for a query, applying any relative window it names
+
+        Candidates are the sorted indices of the documents to score, or None to
+        score every document.
+        """
+        parsed_window = False
+        if date_from is None and date_to is None:
+            date_from, date_to = parse_relative_window(query, self.metadata.latest_date)
+            parsed_window = date_from is not None
+        candidates = self.metadata.candidates(date_from, date_to, types)
+        if parsed_window and len(candidates) == 0:
+            logger.info("No documents in the parsed time window, ignoring it")
+            candidates = self.metadata.candidates(types=types)
+        return candidates, date_from, date_to
+
+    def _lexical_hits(self, query):
+        """Look the query's terms up in the inverted index, or return None if lexical scoring is off"""
+        if not lexical_enabled():
+            return None
+        if self.lexical_index is None:
+            self.lexical_index = LexicalIndex.from_texts(
+                [doc["text"] for doc in self.documents]
+            )
+        lexical_hits = self.lexical_index.search(query)
+        logger.info(f"Lexical index matched {len(lexical_hits[0])} documents")
+        return lexical_hits
+
+    def _rank(self, similarities, candidates, lexical_hits, top_k):
+        """Mix in lexical scores and return the (indices, similarities, scores) of the top_k documents
+
+        ``similarities`` are cosine similarities covering the candidates when there
+        are any, and every document otherwise. Documents are ranked by their score,
+        which is the similarity when lexical scoring is off.
+        """
+        scores = similarities
+        if lexical_hits is not None:
+            scores = fuse_scores(similarities, *lexical_hits, candidates)
+        top = select_top_k(scores, top_k)
+        if candidates is not None:
+            return candidates[top], similarities[top], scores[top]
+        return top, similarities[top], scores[top]
+
+    def _search_ann(self, query_embedding, lexical_hits, top_k):
+        """Rank the ANN index's neighbours of a query, together with its best lexical hits"""
+        neighbours, _ = self.ann_index.search(query_embedding, top_k)
+        pool = np.sort(neighbours)
+        if lexical_hits is not None and len(lexical_hits[0]):
+            positions, scores = lexical_hits
+            best = np.sort(select_top_k(scores, LEXICAL_POOL_SIZE))
+            pool = np.union1d(pool, positions[best])
+            lexical_hits = (positions[best], scores[best])
+        # Scored like the exact paths, so a document's score does not depend on
+        # which path found it
+        return self._rank(
+            self.document_embeddings[pool] @ query_embedding,
+            pool,
+            lexical_hits,
+            top_k,
+        )
+
+    def _results(self, top_indices, top_similarities, top_scores):
+        """Pair the top documents with their cosine similarities and ranking scores"""
+        return [
+            {
+                "document": self.documents[idx],
+                "similarity": float(similarity),
+                "score": float(score),
+            }
+            for idx, similarity, score in zip(top_indices, top_similarities, top_scores)
+        ]
+
+    def retrieve_relevant_documents(
+        self, query, top_k=5, date_from=None, date_to=None, types=None
+    ):
+        """Retrieve the most relevant documents for a query, optionally prefiltered by date and type"""
+        logger.info(f"Retrieving top {top_k} documents for query: {query}")
+        start_time = time.time()
+
+        self._prepare_retrieval()
+
+        # Narrow the documents to score using the metadata index
+        candidates, date_from, date_to = self._candidates(
+            query, date_from, date_to, types
+        )
+
+        # Look the query's terms up in the inverted index
+        lexical_hits = self._lexical_hits(query)
+
         # Encode the query
         logger.info("Encoding query")
         try:
-            query_embedding = self.model.encode([query])[0]
-
-            # Calculate similarities
-            logger.info("Calculating similarities")
-            similarities = cosine_similarity(
-                [query_embedding], self.document_embeddings
-            )[0]
-
-            # Get top k indices
-            top_indices = np.argsort(similarities)[-top_k:][::-1]
-
-            # Return top k documents and their similarity scores
-            results = []
-            for idx in top_indices:
-                results.append(
-                    {"document": self.documents[idx], "similarity": similarities[idx]}
+            query_embedding = encode_query(query)
+
+            if candidates is not None:
+                # Score only the candidate slice
+                logger.info(
+                    f"Calculating similarities for {len(candidates)} of {len(self.documents)} documents "
+                    f"(date_from={date_from}, date_to={date_to}, types={types})"
                 )
+                ranked = self._rank(
+                    self.document_embeddings[candidates] @ query_embedding,
+                    candidates,
+                    lexical_hits,
+                    top_k,
+                )
+            elif self.ann_index is not None:
+                logger.info("Searching approximate nearest-neighbour index")
+                ranked = self._search_ann(query_embedding, lexical_hits, top_k)
+            else:
+                # Document rows are pre-normalized, so one dot product gives cosine similarity
+                logger.info("Calculating similarities")
+                ranked = self._rank(
+                    self.document_embeddings @ query_embedding,
+                    None,
+                    lexical_hits,
+                    top_k,
+                )
+
+            # Return top k documents with their similarities and scores
+            results = self._results(*ranked)
 
             logger.info(
                 f"Retrieved {len(results)} relevant documents in {time.time() - start_time:.2f} seconds"
             )
             for i, result in enumerate(results):
                 logger.info(
-                    f"Document {i+1}: similarity={result['similarity']:.4f}, type={result['document']['type']}, date={result['document']['date']}"
+                    f"Document {i+1}: score={result['score']:.4f}, similarity={result['similarity']:.4f}, type={result['document']['type']}, date={result['document']['date']}"
                 )
 
             return results
@@ -431,16 +837,84 @@ class FitnessDataProcessor:
             logger.error(f"Error retrieving relevant documents: {str(e)}")
             raise
 
-    def generate_context_from_query(self, query, top_k=5):
+    def retrieve_relevant_documents_batch(
+        self, queries, top_k=5, date_from=None, date_to=None, types=None
+    ):
+        """Retrieve the most relevant documents for many queries at once
+
+        The queries are encoded in one model call. Queries with the same candidate
+        documents are scored together with one matrix product over just those
+        documents, BATCH_SCORE_BLOCK queries at a time so memory stays that many
+        rows of scores. Unfiltered queries use the ANN index when one is loaded,
+        like single queries do. Returns one result list per query, in order.
+        """
+        logger.info(f"Retrieving top {top_k} documents for {len(queries)} queries")
+        start_time = time.time()
+
+        self._prepare_retrieval()
+
+        try:
+            query_embeddings = encode_queries(queries)
+
+            # Group the queries by their candidates, which differ only when the
+            # queries name different relative windows
+            candidates_of = [
+                self._candidates(query, date_from, date_to, types)[0]
+                for query in queries
+            ]
+            groups = {}
+            for i, candidates in enumerate(candidates_of):
+                key = None if candidates is None else candidates.tobytes()
+                groups.setdefault(key, []).append(i)
+
+            batch_results = [None] * len(queries)
+            for members in groups.values():
+                candidates = candidates_of[members[0]]
+                if candidates is None and self.ann_index is not None:
+                    for i in members:
+                        ranked = self._search_ann(
+                            query_embeddings[i], self._lexical_hits(queries[i]), top_k
+                        )
+                        batch_results[i] = self._results(*ranked)
+                    continue
+
+                rows = self.document_embeddings
+                if candidates is not None:
+                    rows = rows[candidates]
+                for block_start in range(0, len(members), BATCH_SCORE_BLOCK):
+                    block = members[block_start : block_start + BATCH_SCORE_BLOCK]
+                    similarities = query_embeddings[block] @ rows.T
+                    for i, row in zip(block, similarities):
+                        ranked = self._rank(
+                            row, candidates, self._lexical_hits(queries[i]), top_k
+                        )
+                        batch_results[i] = self._results(*ranked)
+
+            logger.info(
+                f"Retrieved documents for {len(queries)} queries in {len(groups)} groups "
+                f"in {time.time() - start_time:.2f} seconds"
+            )
+            return batch_results
+        except Exception as e:
+            logger.error(f"Error retrieving relevant documents: {str(e)}")
+            raise
+
+    def format_context(self, relevant_docs, model=None):
+        """Format retrieved documents as the context block of a prompt, within the token budget"""
+        context, _ = build_context(relevant_docs, model=model)
+        return context
+
+    def generate_context_from_query(
+        self, query, top_k=5, date_from=None, date_to=None, types=None, model=None
+    ):
         """Generate a context string from relevant documents for a query"""
         logger.info(f"Generating context for query: {query} with top_k={top_k}")
         start_time = time.time()
 
-        relevant_docs = self.retrieve_relevant_documents(query, top_k)
-
-        context = f"Based on the following fitness and nutrition data:\n\n"
-        for i, doc in enumerate(relevant_docs):
-            context += f"{i+1}. {doc['document']['text']}\n"
+        relevant_docs = self.retrieve_relevant_documents(
+            query, top_k, date_from=date_from, date_to=date_to, types=types
+        )
+        context = self.format_context(relevant_docs, model=model)
 
         logger.info(
             f"Generated context with {len(relevant_docs)} documents in {time.time() - start_time:.2f} seconds"
@@ -0,0 +1,180 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+from dotenv import load_dotenv
+
+# Set up logging
+logger = logging.getLogger("ai_fitness_api.resilience")
+
+# Load environment variables
+load_dotenv()
+
+# Retries for responses that are expected to clear up, like 503 "model loading"
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_STATUS_CODES = {
+    int(code) for code in os.getenv("LLM_RETRY_STATUS_CODES", "503").split(",") if code
+}
+LLM_RETRY_BACKOFF_SECONDS = float(os.getenv("LLM_RETRY_BACKOFF_SECONDS", "1"))
+LLM_RETRY_MAX_BACKOFF_SECONDS = float(os.getenv("LLM_RETRY_MAX_BACKOFF_SECONDS", "20"))
+
+# Secondary model used for hedged requests and when a model's circuit is open;
+# empty disables both
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", "")
+# Seconds after which a request that has not answered is hedged to the fallback
+# model; 0 disables hedging
+LLM_HEDGE_AFTER_SECONDS = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "20"))
+
+# Circuit breaker configuration
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+LLM_BREAKER_MIN_REQUESTS = int(os.getenv("LLM_BREAKER_MIN_REQUESTS", "5"))
+LLM_BREAKER_ERROR_RATE = float(os.getenv("LLM_BREAKER_ERROR_RATE", "0.5"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+
+def retry_delay(attempt, estimated_time=None):
+    """Seconds to wait before retry number ``attempt`` (0-based), with exponential backoff
+
+    The inference API reports how long a loading model still needs; that estimate
+    is used instead when it is given, within the same cap.
+    """
+    if estimated_time:
+        return min(float(estimated_time), LLM_RETRY_MAX_BACKOFF_SECONDS)
+    return min(LLM_RETRY_BACKOFF_SECONDS * 2**attempt, LLM_RETRY_MAX_BACKOFF_SECONDS)
+
+
+class CircuitBreaker:
+    """Tracks a model's recent failures and stops sending it requests when they spike
+
+    The breaker opens once at least ``min_requests`` of the last ``window``
+    requests have been seen and the share of failures reaches ``error_rate``.
+    After ``cooldown`` seconds it lets a single trial request through: success
+    closes it again, failure re-opens it. A breaker that cannot open only tracks
+    outcomes.
+    """
+
+    def __init__(
+        self,
+        name,
+        window=LLM_BREAKER_WINDOW,
+        min_requests=LLM_BREAKER_MIN_REQUESTS,
+        error_rate=LLM_BREAKER_ERROR_RATE,
+        cooldown=LLM_BREAKER_COOLDOWN_SECONDS,
+        can_open=True,
+    ):
+        self.name = name
+        self.can_open = can_open
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self.state = "closed"
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def is_closed(self):
+        """Whether requests currently flow normally"""
+        with self._lock:
+            return self.state == "closed"
+
+    def allow_request(self):
+        """Whether a request may be sent now, claiming the trial slot when half-open"""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                logger.info(
+                    f"Circuit for {self.name} half-open, sending a trial request"
+                )
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        """Record a successful request"""
+        with self._lock:
+            if self.state == "half_open":
+                logger.info(f"Trial request succeeded, closing circuit for {self.name}")
+                self.state = "closed"
+                self._outcomes.clear()
+                self._trial_in_flight = False
+            self._outcomes.append(True)
+
+    def record_failure(self):
+        """Record a failed request, opening the circuit if failures spiked"""
+        with self._lock:
+            if self.state == "half_open":
+                self._open("trial request failed")
+                return
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if (
+                self.can_open
+                and self.state == "closed"
+                and len(self._outcomes) >= self.min_requests
+                and failures / len(self._outcomes) >= self.error_rate
+            ):
+                self._open(
+                    f"{failures} of the last {len(self._outcomes)} requests failed"
+                )
+
+    def record_cancelled(self):
+        """Record a request abandoned before it finished, freeing the trial slot"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def _open(self, reason):
+        """Stop requests for the cooldown period"""
+        logger.warning(
+            f"Opening circuit for {self.name} for {self.cooldown:g} seconds: {reason}"
+        )
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+
+# Process-wide circuit breakers, one per model
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(model):
+    """Return the circuit breaker for a model, creating it on first use"""
+    with _breakers_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            # Without a fallback model an open circuit would only turn requests
+            # that might still succeed into errors, so it never opens
+            breaker = _breakers[model] = CircuitBreaker(
+                model, can_open=bool(LLM_FALLBACK_MODEL)
+            )
+        return breaker
+
+
+def route_model(model):
+    """Return (model to call, secondary model or None), honouring the circuit breakers
+
+    Raises if the model's circuit is open and no fallback model can take over.
+    """
+    fallback = LLM_FALLBACK_MODEL if LLM_FALLBACK_MODEL != model else ""
+
+    if get_circuit_breaker(model).allow_request():
+        if fallback and get_circuit_breaker(fallback).is_closed():
+            return model, fallback
+        return model, None
+
+    if fallback and get_circuit_breaker(fallback).allow_request():
+        logger.warning(
+            f"Circuit open for {model}, routing to fallback model {fallback}"
+        )
+        return fallback, None
+
+    logger.error(f"Circuit open for {model} and no fallback model is available")
+    raise Exception(f"Error: {model} is unavailable, try again later")
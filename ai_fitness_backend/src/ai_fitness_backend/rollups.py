@@ -0,0 +1,211 @@
+import time
+import logging
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy import func, insert
+from sqlalchemy.orm import Session
+
+from .database import DailyRollup
+from .users import DEFAULT_USER_ID
+
+# Set up logging
+logger = logging.getLogger("ai_fitness_api.rollups")
+
+# Daily rollup metrics, in table column order
+ROLLUP_METRICS = [
+    "calories",
+    "protein_g",
+    "carbs_g",
+    "fat_g",
+    "exercise_calories",
+    "exercise_minutes",
+    "steps",
+    "weight_kg",
+    "garmin_activities",
+    "garmin_calories",
+    "garmin_distance_km",
+    "garmin_minutes",
+]
+
+# Windows, in days, of the rolling averages reported as trends
+ROLLING_WINDOWS = [7, 30]
+
+# Export columns summed per day, and the rollup metric they become
+NUTRITION_ROLLUPS = {
+    "Calories": "calories",
+    "Protein (g)": "protein_g",
+    "Carbohydrates (g)": "carbs_g",
+    "Fat (g)": "fat_g",
+}
+EXERCISE_ROLLUPS = {
+    "Exercise Calories": "exercise_calories",
+    "Exercise Minutes": "exercise_minutes",
+    "Steps": "steps",
+}
+
+
+def _daily_sums(data, columns):
+    """Sum numeric columns per calendar day, keeping days without values as NaN"""
+    values = data[list(columns)].apply(pd.to_numeric, errors="coerce")
+    daily = values.groupby(data["Date"].dt.normalize()).sum(min_count=1)
+    return daily.rename(columns=columns)
+
+
+def build_daily_rollups(
+    nutrition_data=None, exercise_data=None, measurement_data=None, garmin_data=None
+):
+    """Aggregate the loaded exports into one row of typed daily totals per date"""
+    parts = []
+
+    if nutrition_data is not None and not nutrition_data.empty:
+        parts.append(_daily_sums(nutrition_data, NUTRITION_ROLLUPS))
+
+    if exercise_data is not None and not exercise_data.empty:
+        parts.append(_daily_sums(exercise_data, EXERCISE_ROLLUPS))
+
+    if measurement_data is not None and not measurement_data.empty:
+        weight = pd.to_numeric(measurement_data["Weight"], errors="coerce")
+        parts.append(
+            weight.groupby(measurement_data["Date"].dt.normalize())
+            .last()
+            .rename("weight_kg")
+            .to_frame()
+        )
+
+    if garmin_data is not None and not garmin_data.empty:
+        days = garmin_data["Date"].dt.normalize()
+        minutes = garmin_data["Total Time"]
+        if pd.api.types.is_timedelta64_dtype(minutes):
+            minutes = minutes.dt.total_seconds() / 60
+        else:
+            minutes = pd.Series(np.nan, index=garmin_data.index)
+        garmin = pd.DataFrame(
+            {
+                "garmin_activities": garmin_data["Activity Type"].groupby(days).size(),
+                "garmin_calories": garmin_data["Calories"]
+                .groupby(days)
+                .sum(min_count=1),
+                "garmin_distance_km": garmin_data["Distance"]
+                .groupby(days)
+                .sum(min_count=1),
+                "garmin_minutes": minutes.groupby(days).sum(min_count=1),
+            }
+        )
+        parts.append(garmin)
+
+    if not parts:
+        return pd.DataFrame(columns=ROLLUP_METRICS, index=pd.DatetimeIndex([]))
+
+    rollups = pd.concat(parts, axis=1).sort_index()
+    rollups.index.name = "date"
+    return rollups.reindex(columns=ROLLUP_METRICS).astype("float64")
+
+
+def store_daily_rollups(db: Session, rollups, user_id=DEFAULT_USER_ID):
+    """Replace a user's stored daily rollups in a couple of bulk statements"""
+    db.query(DailyRollup).filter(DailyRollup.user_id == user_id).delete()
+    if rollups.empty:
+        return
+    # NaN marks a metric that was not recorded that day; store it as NULL
+    values = rollups.astype(object).where(rollups.notna(), None)
+    db.execute(
+        insert(DailyRollup),
+        [
+            {"user_id": user_id, "date": day.date(), **row}
+            for day, row in zip(values.index, values.to_dict("records"))
+        ],
+    )
+
+
+def load_daily_rollups(
+    db: Session, date_from=None, date_to=None, user_id=DEFAULT_USER_ID
+):
+    """Load a user's daily rollups between two dates (inclusive) as a frame indexed by date"""
+    query = db.query(
+        DailyRollup.date, *(getattr(DailyRollup, m) for m in ROLLUP_METRICS)
+    ).filter(DailyRollup.user_id == user_id)
+    if date_from is not None:
+        query = query.filter(DailyRollup.date >= date_from)
+    if date_to is not None:
+        query = query.filter(DailyRollup.date <= date_to)
+    rows = query.order_by(DailyRollup.date).all()
+
+    rollups = pd.DataFrame(rows, columns=["date"] + ROLLUP_METRICS)
+    rollups["date"] = pd.to_datetime(rollups["date"])
+    return rollups.set_index("date").astype("float64")
+
+
+def rollup_date_range(db: Session, user_id=DEFAULT_USER_ID):
+    """Return the (first, last) dates with a daily rollup of a user, or (None, None)"""
+    first, last = (
+        db.query(func.min(DailyRollup.date), func.max(DailyRollup.date))
+        .filter(DailyRollup.user_id == user_id)
+        .one()
+    )
+    return first, last
+
+
+def rollup_window_start(date_from):
+    """First date to load so rolling averages starting at ``date_from`` cover full windows"""
+    return date_from - timedelta(days=max(ROLLING_WINDOWS) - 1)
+
+
+def _value(value):
+    """Convert a numpy scalar to a JSON-friendly float rounded to 2 decimals, with NaN as None"""
+    return None if pd.isna(value) else round(float(value), 2)
+
+
+def summarize_rollups(rollups, date_from, date_to, metrics=None, trends=True):
+    """Compute range aggregates and rolling averages of daily rollups
+
+    ``rollups`` must start ``max(ROLLING_WINDOWS) - 1`` days before ``date_from`` so
+    the rolling averages at the start of the range cover full windows. Rolling
+    averages are taken over calendar days, skipping days without a value.
+    """
+    start_time = time.time()
+    metrics = metrics or ROLLUP_METRICS
+    start, end = pd.Timestamp(date_from), pd.Timestamp(date_to)
+    in_range = rollups.loc[start:end, metrics]
+
+    summary = {}
+    for metric in metrics:
+        values = in_range[metric].dropna()
+        summary[metric] = {
+            "days": int(len(values)),
+            "mean": _value(values.mean()),
+            "min": _value(values.min()),
+            "max": _value(values.max()),
+            "total": _value(values.sum()) if len(values) else None,
+            "first": _value(values.iloc[0]) if len(values) else None,
+            "last": _value(values.iloc[-1]) if len(values) else None,
+            "change": (
+                _value(values.iloc[-1] - values.iloc[0]) if len(values) else None
+            ),
+        }
+
+    trend_points = {}
+    if trends:
+        calendar = rollups[metrics].asfreq("D") if not rollups.empty else rollups
+        rolling = {
+            window: calendar.rolling(window, min_periods=1).mean()
+            for window in ROLLING_WINDOWS
+        }
+        days = calendar.loc[start:end].index
+        for metric in metrics:
+            trend_points[metric] = [
+                {
+                    "date": day.date(),
+                    "value": _value(calendar.at[day, metric]),
+                    **{
+                        f"rolling_{window}": _value(rolling[window].at[day, metric])
+                        for window in ROLLING_WINDOWS
+                    },
+                }
+                for day in days
+            ]
+
+    logger.info(
+        f"Summarized {len(in_range)} days of rollups in {(time.time() - start_time) * 1000:.1f} ms"
+    )
+    return summary, trend_points
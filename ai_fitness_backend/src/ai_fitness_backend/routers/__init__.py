@@ -1,7 +1,11 @@
 from fastapi import APIRouter
+from .analytics import router as analytics_router
 from .query import router as query_router
+from .search import router as search_router
 from .upload import router as upload_router
 
 router = APIRouter()
 router.include_router(query_router)
 router.include_router(upload_router)
+router.include_router(analytics_router)
+router.include_router(search_router)
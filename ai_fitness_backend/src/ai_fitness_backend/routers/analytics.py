@@ -0,0 +1,127 @@
+import logging
+import time
+from datetime import date
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..filters import parse_relative_window
+from ..models import AnalyticsResponse
+from ..users import get_user_id, user_data_dir
+
+# Set up logging
+logger = logging.getLogger("ai_fitness_api.routers.analytics")
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["analytics"],
+    responses={404: {"description": "Not found"}},
+)
+
+
+def compute_analytics(
+    db: Session, date_from, date_to, period, metrics, trends, user_id
+):
+    """Answer range aggregates and rolling trends from a user's daily rollups"""
+    # Imported here so that importing the app does not load pandas
+    from ..processor import FitnessDataProcessor
+    from ..rollups import (
+        load_daily_rollups,
+        rollup_date_range,
+        rollup_window_start,
+        summarize_rollups,
+    )
+
+    first, latest = rollup_date_range(db, user_id)
+    if latest is None:
+        # Rollups are written by ingest; build them from the files if none exist yet
+        logger.warning(
+            f"No daily rollups found in database for user {user_id}, building them from files"
+        )
+        processor = FitnessDataProcessor(
+            data_dir=user_data_dir(user_id), db=db, user_id=user_id
+        )
+        processor.load_data()
+        processor.create_daily_rollups()
+        first, latest = rollup_date_range(db, user_id)
+        if latest is None:
+            raise HTTPException(status_code=404, detail="No fitness data available")
+
+    if period:
+        window_from, window_to = parse_relative_window(period, latest)
+        if window_from is None:
+            raise HTTPException(
+                status_code=422, detail=f"Could not parse period: {period}"
+            )
+        date_from = date_from or window_from
+        date_to = date_to or window_to
+
+    date_from = date_from or first
+    date_to = date_to or latest
+
+    rollups = load_daily_rollups(db, rollup_window_start(date_from), date_to, user_id)
+    summary, trend_points = summarize_rollups(
+        rollups, date_from, date_to, metrics, trends
+    )
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "metrics": summary,
+        "trends": trend_points,
+    }
+
+
+@router.get("/", response_model=AnalyticsResponse)
+async def get_analytics(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    period: Optional[str] = None,
+    metrics: Optional[List[str]] = Query(None),
+    trends: bool = True,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_user_id),
+):
+    """
+    Aggregate daily totals over a date range without calling the LLM.
+
+    - period: Relative window like "last month" or "this year", anchored at the latest data
+    - metrics: Metrics to report; all by default
+    - trends: Whether to include daily values with 7 and 30 day rolling averages
+    """
+    start_time = time.time()
+    logger.info(
+        f"Received analytics request: date_from={date_from}, date_to={date_to}, period={period}, metrics={metrics}"
+    )
+
+    # Imported on first request rather than with the app, like compute_analytics
+    from ..rollups import ROLLUP_METRICS
+
+    if metrics:
+        unknown = set(metrics) - set(ROLLUP_METRICS)
+        if unknown:
+            logger.warning(f"Unknown metrics received: {unknown}")
+            raise HTTPException(
+                status_code=422, detail=f"metrics must be among {ROLLUP_METRICS}"
+            )
+    if date_from is not None and date_to is not None and date_to < date_from:
+        logger.warning(f"Invalid date range received: {date_from} to {date_to}")
+        raise HTTPException(
+            status_code=422, detail="date_to must not be before date_from"
+        )
+
+    try:
+        result = await run_in_threadpool(
+            compute_analytics, db, date_from, date_to, period, metrics, trends, user_id
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error computing analytics: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500, detail=f"Error computing analytics: {str(e)}"
+        )
+
+    logger.info(f"Analytics computed in {(time.time() - start_time) * 1000:.1f} ms")
+    return result
@@ -1,12 +1,22 @@
+import json
 import logging
 import time
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from ..database import get_db
-from ..models import QueryRequest, QueryResponse
-from ..processor import FitnessDataProcessor
-from ..llm import analyze_fitness_data
+from ..models import (
+    BatchSearchRequest,
+    BatchSearchResponse,
+    QueryRequest,
+    QueryResponse,
+    SearchResponse,
+)
+from ..llm import analyze_fitness_data_async, analyze_fitness_data_stream
+from ..sections import parse_response
+from ..users import get_user_id, user_data_dir
 
 # Set up logging
 logger = logging.getLogger("ai_fitness_api.routers.query")
@@ -18,42 +28,93 @@ router = APIRouter(
 )
 
 
+def load_processor(db: Session, user_id):
+    """Return a processor with a user's stored documents loaded, falling back to their data files"""
+    # Imported here so that importing the app does not load pandas
+    from ..processor import FitnessDataProcessor
+
+    # Initialize processor with database session
+    logger.info(f"Initializing FitnessDataProcessor for user {user_id}")
+    processor = FitnessDataProcessor(
+        data_dir=user_data_dir(user_id), db=db, user_id=user_id
+    )
+
+    # Load documents from database
+    logger.info("Loading documents from database")
+    processor.load_documents_from_db()
+
+    # If no documents found, try loading from files
+    if not processor.documents:
+        logger.warning("No documents found in database, loading from files")
+        processor.load_data()
+        processor.create_documents()
+
+    return processor
+
+
+def search_response(query, results):
+    """Convert retrieved documents into a search response"""
+    return SearchResponse(
+        query=query,
+        results=[
+            {
+                **result["document"],
+                "similarity": result["similarity"],
+                "score": result["score"],
+            }
+            for result in results
+        ],
+    )
+
+
+def search_documents_batch(db: Session, user_id, request: BatchSearchRequest):
+    """Load a user's documents and retrieve the top matches for every query in one pass"""
+    processor = load_processor(db, user_id)
+    return processor.retrieve_relevant_documents_batch(
+        request.queries,
+        request.top_k,
+        date_from=request.date_from,
+        date_to=request.date_to,
+        types=request.types,
+    )
+
+
 @router.post("/", response_model=QueryResponse)
-async def query_fitness_data(request: QueryRequest, db: Session = Depends(get_db)):
+async def query_fitness_data(
+    request: QueryRequest,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_user_id),
+):
     """
     Query the fitness data using natural language.
     The system will retrieve relevant information and generate a response.
+    Data is read from the corpus of the user named by the X-User-Id header.
     """
     start_time = time.time()
     logger.info(f"Received query request: '{request.query[:50]}...'")
     logger.info(f"System role: '{request.system_role[:50]}...'")
     logger.info(f"Top_k: {request.top_k}")
     logger.info(f"Model: {request.model}")
+    logger.info(
+        f"Filters: date_from={request.date_from}, date_to={request.date_to}, types={request.types}"
+    )
 
     try:
-        # Initialize processor with database session
-        logger.info("Initializing FitnessDataProcessor")
-        processor = FitnessDataProcessor(db=db)
-
-        # Load documents from database
-        logger.info("Loading documents from database")
-        processor.load_documents_from_db()
-
-        # If no documents found, try loading from files
-        if not processor.documents:
-            logger.warning("No documents found in database, loading from files")
-            processor.load_data()
-            processor.create_documents()
+        # Loading documents may hit the database or parse files, so keep it off the event loop
+        processor = await run_in_threadpool(load_processor, db, user_id)
 
         # Get response from LLM
         logger.info("Getting response from LLM")
         llm_start_time = time.time()
-        response = analyze_fitness_data(
+        response = await analyze_fitness_data_async(
             processor,
             request.query,
             system_role=request.system_role,
             top_k=request.top_k,
             model=request.model,
+            date_from=request.date_from,
+            date_to=request.date_to,
+            types=request.types,
         )
         logger.info(
             f"LLM response received in {time.time() - llm_start_time:.2f} seconds"
@@ -63,8 +124,105 @@ async def query_fitness_data(request: QueryRequest, db: Session = Depends(get_db
         total_time = time.time() - start_time
         logger.info(f"Total query processing time: {total_time:.2f} seconds")
 
-        return QueryResponse(response=response)
+        parser = parse_response(response)
+        sections = parser.to_dict() if parser.start is not None else None
+        return QueryResponse(response=response, sections=sections)
 
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+
+
+@router.post("/batch", response_model=BatchSearchResponse)
+async def batch_query_fitness_data(
+    request: BatchSearchRequest,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_user_id),
+):
+    """
+    Retrieve the most relevant documents for many queries at once, without calling the LLM.
+    The queries are embedded together and scored with a single matrix product,
+    and share the date and type filters; each query's relative window is still applied.
+    """
+    start_time = time.time()
+    logger.info(f"Received batch query request with {len(request.queries)} queries")
+    logger.info(
+        f"Filters: top_k={request.top_k}, date_from={request.date_from}, date_to={request.date_to}, types={request.types}"
+    )
+
+    try:
+        batch_results = await run_in_threadpool(
+            search_documents_batch, db, user_id, request
+        )
+    except Exception as e:
+        logger.error(f"Error processing batch query: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500, detail=f"Error processing batch query: {str(e)}"
+        )
+
+    logger.info(
+        f"Batch of {len(request.queries)} queries completed in {(time.time() - start_time) * 1000:.1f} ms"
+    )
+    return BatchSearchResponse(
+        results=[
+            search_response(query, results)
+            for query, results in zip(request.queries, batch_results)
+        ]
+    )
+
+
+async def _server_sent_events(events):
+    """Format (event, data) pairs as server-sent events, reporting errors as an event"""
+    start_time = time.time()
+    try:
+        async for event, data in events:
+            yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        logger.info(
+            f"Streamed query completed in {time.time() - start_time:.2f} seconds"
+        )
+    except Exception as e:
+        logger.error(f"Error streaming query: {str(e)}", exc_info=True)
+        detail = json.dumps({"detail": f"Error processing query: {str(e)}"})
+        yield f"event: error\ndata: {detail}\n\n"
+
+
+@router.post("/stream")
+async def stream_query_fitness_data(
+    request: QueryRequest,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_user_id),
+):
+    """
+    Query the fitness data and stream the answer as server-sent events.
+    Emits the retrieved documents first, then "token" events as the LLM generates,
+    a "section" event as each OBSERVATIONS / DIETARY SUGGESTIONS / SUMMARY section
+    completes and a final "done" event with the full response and its parsed sections.
+    """
+    logger.info(f"Received streaming query request: '{request.query[:50]}...'")
+    logger.info(
+        f"Filters: date_from={request.date_from}, date_to={request.date_to}, types={request.types}"
+    )
+
+    try:
+        # Load documents before streaming starts, while the session is still open
+        processor = await run_in_threadpool(load_processor, db, user_id)
+    except Exception as e:
+        logger.error(f"Error processing query: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+
+    events = analyze_fitness_data_stream(
+        processor,
+        request.query,
+        system_role=request.system_role,
+        top_k=request.top_k,
+        model=request.model,
+        date_from=request.date_from,
+        date_to=request.date_to,
+        types=request.types,
+    )
+    return StreamingResponse(
+        _server_sent_events(events),
+        media_type="text/event-stream",
+        # Ask proxies not to buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
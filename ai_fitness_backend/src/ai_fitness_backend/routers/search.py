@@ -0,0 +1,59 @@
+import logging
+import time
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from ..database import get_db
+from ..models import SearchRequest, SearchResponse
+from ..users import get_user_id
+from .query import load_processor, search_response
+
+# Set up logging
+logger = logging.getLogger("ai_fitness_api.routers.search")
+
+router = APIRouter(
+    prefix="/search",
+    tags=["search"],
+    responses={404: {"description": "Not found"}},
+)
+
+
+def search_documents(db: Session, user_id, request: SearchRequest):
+    """Load a user's documents and retrieve the top matches for a query"""
+    processor = load_processor(db, user_id)
+    return processor.retrieve_relevant_documents(
+        request.query,
+        request.top_k,
+        date_from=request.date_from,
+        date_to=request.date_to,
+        types=request.types,
+    )
+
+
+@router.post("/", response_model=SearchResponse)
+async def search_fitness_data(
+    request: SearchRequest,
+    db: Session = Depends(get_db),
+    user_id: str = Depends(get_user_id),
+):
+    """
+    Return the documents most relevant to a query with their scores, without calling the LLM.
+    Takes the same filters as /api/query.
+    """
+    start_time = time.time()
+    logger.info(f"Received search request: '{request.query[:50]}...'")
+    logger.info(
+        f"Filters: top_k={request.top_k}, date_from={request.date_from}, date_to={request.date_to}, types={request.types}"
+    )
+
+    try:
+        results = await run_in_threadpool(search_documents, db, user_id, request)
+    except Exception as e:
+        logger.error(f"Error searching documents: {str(e)}", exc_info=True)
+        raise HTTPException(
+            status_code=500, detail=f"Error searching documents: {str(e)}"
+        )
+
+    logger.info(f"Search completed in {(time.time() - start_time) * 1000:.1f} ms")
+    return search_response(request.query, results)
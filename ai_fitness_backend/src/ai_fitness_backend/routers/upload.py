@@ -5,18 +5,16 @@ import time
 from typing import List
 from fastapi import (
     APIRouter,
+    Depends,
     UploadFile,
     File,
     Form,
     HTTPException,
-    Depends,
-    BackgroundTasks,
 )
-from sqlalchemy.orm import Session
 
-from ..database import get_db
-from ..models import UploadResponse
-from ..processor import FitnessDataProcessor
+from ..ingest import get_ingest_worker
+from ..models import IngestJobResponse, UploadResponse
+from ..users import get_user_id, user_data_dir
 
 # Set up logging
 logger = logging.getLogger("ai_fitness_api.routers.upload")
@@ -30,18 +28,20 @@ router = APIRouter(
 
 @router.post("/", response_model=UploadResponse)
 async def upload_fitness_data(
-    background_tasks: BackgroundTasks,
     files: List[UploadFile] = File(...),
     file_type: str = Form(...),  # "mfp" or "garmin"
-    db: Session = Depends(get_db),
+    user_id: str = Depends(get_user_id),
 ):
     """
     Upload fitness data files (CSV format).
 
     - file_type: Type of file being uploaded ("mfp" for MyFitnessPal or "garmin" for Garmin data)
+    - X-User-Id header: User whose data this is; the default user if omitted
     """
     start_time = time.time()
-    logger.info(f"Received upload request for {len(files)} files of type '{file_type}'")
+    logger.info(
+        f"Received upload request for {len(files)} files of type '{file_type}' from user {user_id}"
+    )
 
     if file_type not in ["mfp", "garmin"]:
         logger.warning(f"Invalid file_type: {file_type}")
@@ -50,7 +50,7 @@ async def upload_fitness_data(
         )
 
     # Create data directory if it doesn't exist
-    data_dir = "data"
+    data_dir = user_data_dir(user_id)
     try:
         os.makedirs(os.path.join(data_dir, file_type), exist_ok=True)
         logger.info(f"Created/verified directory: {os.path.join(data_dir, file_type)}")
@@ -74,9 +74,9 @@ async def upload_fitness_data(
             processed_files.append(file.filename)
             logger.info(f"Successfully saved file: {file.filename}")
 
-        # Process data in background to create embeddings
-        logger.info("Adding background task to process uploaded data")
-        background_tasks.add_task(process_uploaded_data, db)
+        # Queue the files for the ingest worker, which coalesces bursts of uploads
+        logger.info("Queueing ingest job to process uploaded data")
+        job = get_ingest_worker().submit(processed_files, user_id)
 
         total_time = time.time() - start_time
         logger.info(
@@ -84,8 +84,9 @@ async def upload_fitness_data(
         )
 
         return UploadResponse(
-            message="Files uploaded successfully. Data processing started in background.",
+            message="Files uploaded successfully. Data processing queued.",
             files_processed=processed_files,
+            job_id=job.id,
         )
 
     except Exception as e:
@@ -93,25 +94,12 @@ async def upload_fitness_data(
         raise HTTPException(status_code=500, detail=f"Error uploading files: {str(e)}")
 
 
-def process_uploaded_data(db: Session):
-    """Process uploaded data in background to create documents and embeddings"""
-    logger.info("Starting background processing of uploaded data")
-    start_time = time.time()
-
-    try:
-        logger.info("Initializing FitnessDataProcessor")
-        processor = FitnessDataProcessor(db=db)
-
-        logger.info("Loading data from files")
-        processor.load_data()
-
-        logger.info("Creating documents")
-        processor.create_documents()
-
-        logger.info("Creating embeddings")
-        processor.create_embeddings()
-
-        total_time = time.time() - start_time
-        logger.info(f"Background processing completed in {total_time:.2f} seconds")
-    except Exception as e:
-        logger.error(f"Error processing uploaded data: {str(e)}", exc_info=True)
+@router.get("/jobs/{job_id}", response_model=IngestJobResponse)
+async def get_ingest_job(job_id: str, user_id: str = Depends(get_user_id)):
+    """Return the status of an ingest job created by an upload of the user"""
+    job = get_ingest_worker().get_job(job_id)
+    # Other users' jobs are reported as unknown
+    if job is None or job.user_id != user_id:
+        logger.warning(f"Unknown ingest job requested: {job_id}")
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return IngestJobResponse(**job.to_dict())
@@ -0,0 +1,143 @@
+import re
+import logging
+
+# Set up logging
+logger = logging.getLogger("ai_fitness_api.sections")
+
+# Section headers of the structured response, in prompt order
+SECTION_NAMES = ("OBSERVATIONS", "DIETARY SUGGESTIONS", "SUMMARY")
+# Headers start a line, optionally bolded, in any case; "Nutrition summary:" in
+# the retrieved context is mid-line, so it is not taken for a section
+SECTION_PATTERN = re.compile(
+    r"^[ \t]*\**(OBSERVATIONS|DIETARY SUGGESTIONS|SUMMARY):",
+    re.MULTILINE | re.IGNORECASE,
+)
+# Last line of the prompt; a model that echoes the prompt answers after it
+PROMPT_END = "Make sure each section is clearly labeled and separated."
+# Phrases showing a section is the model repeating the prompt's instructions
+INSTRUCTION_MARKERS = (
+    "list key observations",
+    "provide specific dietary",
+    "brief conclusion summarizing",
+)
+# Bold markers left around content when the headers are bolded in markdown
+BOLD_PATTERN = re.compile(r"^\s*\*\*|\*\*\s*$")
+# Leading "-", "•", "*" or "1." of a list item
+BULLET_PATTERN = re.compile(r"(?:[-•*]|\d+[.)])\s+")
+
+
+def _items(content):
+    """Split section content into list items, joining wrapped lines to their bullet"""
+    items = []
+    bulleted = False
+    for line in content.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        match = BULLET_PATTERN.match(line)
+        if match:
+            items.append(line[match.end() :].strip())
+            bulleted = True
+        elif items and bulleted:
+            items[-1] += " " + line
+        else:
+            items.append(line)
+    return items
+
+
+class SectionParser:
+    """Split LLM output into its structured sections in a single pass
+
+    Text can be fed incrementally as it streams in; a section is complete once the
+    next section header arrives, or when the parser is closed. Sections that
+    repeat the prompt's instructions are skipped, and if the whole prompt is
+    echoed, everything up to its end is.
+    """
+
+    def __init__(self):
+        self.text = ""
+        # Offset of the first section that is not an instruction echo
+        self.start = None
+        # Whether the model repeated the prompt's instructions
+        self.echoed = False
+        # Section name -> content of its first occurrence
+        self.sections = {}
+        # Position from which to look for the next header
+        self._scan_from = 0
+        # (name, header start, content start) of the section being received
+        self._current = None
+        # Position from which to look for the end of an echoed prompt; None once found
+        self._prompt_from = 0
+
+    def feed(self, chunk):
+        """Add text, returning the (name, content) sections it completed"""
+        self.text += chunk
+        self._skip_prompt()
+        completed = []
+        for match in SECTION_PATTERN.finditer(self.text, self._scan_from):
+            if self._current is not None:
+                completed.append(self._finish(match.start()))
+            self._current = (match.group(1).upper(), match.start(), match.end())
+            self._scan_from = match.end()
+        # Rescan only the last line, which could hold the start of a split header
+        self._scan_from = max(self._scan_from, self.text.rfind("\n") + 1)
+        return [section for section in completed if section is not None]
+
+    def close(self):
+        """Finish the text, returning the last section if there is one"""
+        if self._current is None:
+            return []
+        section = self._finish(len(self.text))
+        self._current = None
+        return [section] if section is not None else []
+
+    @property
+    def response(self):
+        """The text from the first real section on, or all of it if none was found"""
+        return self.text if self.start is None else self.text[self.start :]
+
+    def to_dict(self):
+        """Return the parsed sections, with observations and suggestions as lists"""
+        return {
+            "observations": _items(self.sections.get("OBSERVATIONS", "")),
+            "dietary_suggestions": _items(self.sections.get("DIETARY SUGGESTIONS", "")),
+            "summary": self.sections.get("SUMMARY"),
+        }
+
+    def _skip_prompt(self):
+        """Drop everything parsed so far once the end of an echoed prompt arrives"""
+        if self._prompt_from is None:
+            return
+        end = self.text.find(PROMPT_END, self._prompt_from)
+        if end < 0:
+            # Rescan only the tail that could hold the start of a split marker
+            self._prompt_from = max(0, len(self.text) - len(PROMPT_END) + 1)
+            return
+        logger.debug("Skipping the echoed prompt")
+        self._prompt_from = None
+        self.echoed = True
+        self.start = None
+        self.sections = {}
+        self._current = None
+        self._scan_from = end + len(PROMPT_END)
+
+    def _finish(self, end):
+        """Return the current section ending at ``end``, or None if it is an instruction echo"""
+        name, header_start, start = self._current
+        content = BOLD_PATTERN.sub("", self.text[start:end]).strip()
+        if any(marker in content.lower() for marker in INSTRUCTION_MARKERS):
+            logger.debug(f"Skipping repeated instructions for section {name}")
+            self.echoed = True
+            return None
+        if self.start is None:
+            self.start = header_start
+        self.sections.setdefault(name, content)
+        return name, content
+
+
+def parse_response(text):
+    """Parse a complete LLM response, returning the closed parser"""
+    parser = SectionParser()
+    parser.feed(text)
+    parser.close()
+    return parser
@@ -0,0 +1,38 @@
+import os
+import re
+import logging
+from typing import Optional
+from fastapi import Header, HTTPException
+
+# Set up logging
+logger = logging.getLogger("ai_fitness_api.users")
+
+# Owner of requests that name no user, and of data ingested before corpora were
+# partitioned by user, which create_tables assigns to it
+DEFAULT_USER_ID = "default"
+USER_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def user_data_dir(user_id, data_dir="data"):
+    """Return the directory holding a user's uploaded exports"""
+    if user_id == DEFAULT_USER_ID:
+        return data_dir
+    return os.path.join(data_dir, "users", user_id)
+
+
+def get_user_id(x_user_id: Optional[str] = Header(None)):
+    """Dependency returning the user named by the X-User-Id header, or the default user
+
+    The header is not authenticated: any caller can name any user, so it only
+    separates corpora and must sit behind a proxy that sets it for the
+    authenticated user when the API is exposed.
+    """
+    if x_user_id is None:
+        return DEFAULT_USER_ID
+    if not USER_ID_PATTERN.fullmatch(x_user_id):
+        logger.warning(f"Invalid user id received: {x_user_id[:64]}")
+        raise HTTPException(
+            status_code=400,
+            detail="X-User-Id must be 1-64 letters, digits, '-' or '_'",
+        )
+    return x_user_id
@@ -0,0 +1,153 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+
+from .database import SessionLocal, create_tables
+from .embeddings import encode_queries, get_embedding_model
+from .users import DEFAULT_USER_ID
+
+# Set up logging
+logger = logging.getLogger("ai_fitness_api.warmup")
+
+# Load environment variables
+load_dotenv()
+
+# Whether startup loads the model and the default user's index before reporting
+# ready; when false they are loaded by the first request instead
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "true").lower() == "true"
+# Delay before retrying a failed warmup, e.g. while the database is unreachable
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "5"))
+
+# Queries run through retrieval once the index is loaded, so the first real
+# requests do not pay for the model's first inference
+WARMUP_QUERIES = [
+    "How many calories did I eat last week?",
+    "What was my protein intake this month?",
+    "How has my weight changed?",
+    "What workouts did I do recently?",
+]
+
+
+class Warmup:
+    """Startup work run on a background thread, which readiness waits for
+
+    Creates the database tables, then loads the embedding model and the default
+    user's retrieval index and runs the warmup queries through retrieval. A
+    failed step is retried until it succeeds or the app shuts down.
+    """
+
+    def __init__(self, enabled=STARTUP_WARMUP, retry_seconds=WARMUP_RETRY_SECONDS):
+        self.enabled = enabled
+        self.retry_seconds = retry_seconds
+        self.status = "pending"
+        self.error = None
+        self.attempts = 0
+        # Step name -> seconds taken by its last successful run
+        self.steps = {}
+        self.started_at = None
+        self.finished_at = None
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        """Whether the app can serve traffic without cold-start delays"""
+        return self.status == "ready"
+
+    def start(self):
+        """Start the warmup thread if it has not been started"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.started_at = datetime.utcnow()
+            self._thread = threading.Thread(
+                target=self._run, name="warmup", daemon=True
+            )
+            self._thread.start()
+            logger.info("Warmup started")
+
+    def stop(self, timeout=None):
+        """Stop retrying and wait for the current step to finish"""
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def to_dict(self):
+        """Return the warmup state for the readiness probe"""
+        return {
+            "status": self.status,
+            "error": self.error,
+            "attempts": self.attempts,
+            "steps": dict(self.steps),
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self.status = "running"
+            self.attempts += 1
+            try:
+                self._step("database", create_tables)
+                if self.enabled:
+                    self._step("model", get_embedding_model)
+                    self._step("retrieval", self._warm_retrieval)
+                else:
+                    logger.info("Startup warmup disabled, loading on first request")
+            except Exception as e:
+                logger.error(
+                    f"Error during warmup (attempt {self.attempts}): {str(e)}",
+                    exc_info=True,
+                )
+                self.status = "failed"
+                self.error = str(e)
+                self._stopping.wait(self.retry_seconds)
+                continue
+
+            self.status = "ready"
+            self.error = None
+            self.finished_at = datetime.utcnow()
+            logger.info(
+                f"Warmup completed in {(self.finished_at - self.started_at).total_seconds():.2f} seconds"
+            )
+            return
+
+    def _step(self, name, fn):
+        """Run one warmup step, recording how long it took"""
+        logger.info(f"Warmup: {name}")
+        start_time = time.time()
+        fn()
+        self.steps[name] = round(time.time() - start_time, 3)
+        logger.info(f"Warmup: {name} done in {self.steps[name]:.2f} seconds")
+
+    def _warm_retrieval(self):
+        """Load the default user's index and run the warmup queries against it"""
+        # Imported here, like the request path, so pandas loads on this thread
+        from .processor import FitnessDataProcessor
+
+        db = SessionLocal()
+        try:
+            processor = FitnessDataProcessor(db=db, user_id=DEFAULT_USER_ID)
+            processor.load_documents_from_db()
+            if not processor.documents:
+                logger.info("No stored documents yet, warming the model only")
+                encode_queries(WARMUP_QUERIES)
+                return
+            for query in WARMUP_QUERIES:
+                processor.retrieve_relevant_documents(query)
+        finally:
+            db.close()
+
+
+# Process-wide warmup
+_warmup = Warmup()
+
+
+def get_warmup():
+    """Return the process-wide warmup"""
+    return _warmup
@@ -0,0 +1,29 @@
+import os
+import shutil
+import pytest
+
+# Tests never need the PostgreSQL server; sessions, if any, use in-memory SQLite
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+FIXTURE_DATA = os.path.join(os.path.dirname(__file__), "data")
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """A copy of the fixture exports, so tests can write caches next to them"""
+    path = tmp_path / "data"
+    shutil.copytree(FIXTURE_DATA, path)
+    return str(path)
+
+
+@pytest.fixture
+def make_processor(monkeypatch):
+    """Build processors without loading the embedding model"""
+    from ai_fitness_backend import processor
+
+    monkeypatch.setattr(processor, "get_embedding_model", lambda: None)
+
+    def make(data_dir):
+        return processor.FitnessDataProcessor(data_dir=data_dir)
+
+    return make
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from ai_fitness_backend import ann
+from ai_fitness_backend.ann import IVFIndex, build_ann_index, update_ann_index
+from ai_fitness_backend.database import AnnIndex, Base
+
+USER_ID = "ann-test"
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(ann, "RETRIEVAL_INDEX_BACKEND", "ivf")
+    monkeypatch.setattr(ann, "ANN_MIN_DOCUMENTS", 1)
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    session = Session(bind=engine)
+    yield session
+    session.close()
+
+
+def _embeddings(count, seed):
+    embeddings = np.random.default_rng(seed).standard_normal((count, 16))
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings.astype(np.float32)
+
+
+def _lists(index):
+    """Map each document id to the list it is bucketed in"""
+    lists = {}
+    for p in range(len(index.centroids)):
+        members = index.list_members[index.list_offsets[p] : index.list_offsets[p + 1]]
+        for member in members:
+            lists[int(index.document_ids[member])] = p
+    return lists
+
+
+def test_update_assigns_new_documents_to_existing_centroids(db):
+    built = build_ann_index(db, np.arange(1, 101), _embeddings(100, 0), USER_ID)
+    new_embeddings = _embeddings(5, 1)
+    # Document 7 was re-embedded, 3 was removed and 101-104 are new
+    changed_ids = np.array([7, 101, 102, 103, 104])
+    document_ids = np.concatenate(([1, 2], np.arange(4, 105)))
+
+    updated = update_ann_index(db, document_ids, changed_ids, new_embeddings, USER_ID)
+
+    assert updated is not None
+    np.testing.assert_array_equal(updated.centroids, built.centroids)
+    np.testing.assert_array_equal(updated.document_ids, document_ids)
+    assert updated.recall == built.recall
+    assert updated.assigned_count == 5
+    lists = _lists(updated)
+    before = _lists(built)
+    assert all(lists[i] == before[i] for i in document_ids if i not in changed_ids)
+    expected = np.argmax(new_embeddings @ built.centroids.T, axis=1)
+    assert [lists[i] for i in changed_ids] == list(expected)
+
+    row = db.query(AnnIndex).filter(AnnIndex.user_id == USER_ID).one()
+    assert row.document_count == len(document_ids)
+    assert _lists(IVFIndex.from_bytes(row.data)) == lists
+
+
+def test_update_asks_for_retraining_past_the_growth_threshold(db):
+    build_ann_index(db, np.arange(1, 101), _embeddings(100, 0), USER_ID)
+    changed_ids = np.arange(101, 101 + int(ann.ANN_RETRAIN_FRACTION * 100) + 1)
+
+    updated = update_ann_index(
+        db,
+        np.arange(1, changed_ids[-1] + 1),
+        changed_ids,
+        _embeddings(len(changed_ids), 1),
+        USER_ID,
+    )
+
+    assert updated is None
+
+
+def test_update_without_a_persisted_index_asks_for_a_build(db):
+    assert update_ann_index(db, [1, 2], [2], _embeddings(1, 0), USER_ID) is None
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from ai_fitness_backend import llm
+from ai_fitness_backend.answer_cache import AnswerCache
+from ai_fitness_backend.filters import query_literals
+from ai_fitness_backend.index import DocumentMetadata
+from ai_fitness_backend.users import DEFAULT_USER_ID
+
+
+class StoredCorpus:
+    """The processor fields the answer cache reads"""
+
+    user_id = DEFAULT_USER_ID
+    corpus_version = "test-corpus"
+    metadata = DocumentMetadata(
+        [{"text": "", "type": "nutrition", "date": "2024-01-31"}]
+    )
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = AnswerCache(max_size=10, persist=False)
+    monkeypatch.setattr(llm, "answer_cache", cache)
+    # Every query embeds identically, as near-duplicate phrasings nearly do
+    embedding = np.ones(4, dtype=np.float32) / 2
+    monkeypatch.setattr(llm, "encode_query", lambda query: embedding)
+    return cache
+
+
+def _lookup(query):
+    return llm._get_cached_answer(
+        StoredCorpus(), query, "coach", 5, "model", None, None, None
+    )
+
+
+def _store(query, answer):
+    _, key = _lookup(query)
+    llm._store_answer(StoredCorpus(), query, key, answer)
+
+
+def test_query_literals():
+    assert query_literals("Calories on 2024-01-05 vs 1/6, over 1,200 kcal?") == [
+        "2024-01-05",
+        "1/6",
+        "1200",
+    ]
+    assert query_literals("My weight in March over the last two weeks") == [
+        "march",
+        "2",
+    ]
+    assert query_literals("How has my weight changed?") == []
+
+
+def test_semantic_tier_reuses_rephrased_queries(cache):
+    _store("How many calories did I eat on 2024-01-05?", "1800 kcal")
+
+    answer, _ = _lookup("How many calories did I eat on 2024-01-05 ?")
+
+    assert answer == "1800 kcal"
+    assert cache.semantic_hits == 1
+
+
+@pytest.mark.parametrize(
+    "query",
+    [
+        "How many calories did I eat on 2024-01-06?",
+        "How many calories did I eat in the last 3 days?",
+        "How many calories did I eat on Monday?",
+    ],
+)
+def test_semantic_tier_keeps_dates_and_numbers_apart(cache, query):
+    _store("How many calories did I eat on 2024-01-05?", "1800 kcal")
+    _store("How many calories did I eat in the last 7 days?", "12600 kcal")
+
+    answer, _ = _lookup(query)
+
+    assert answer is None
+    assert cache.semantic_hits == 0
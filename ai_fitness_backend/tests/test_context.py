@@ -0,0 +1,110 @@
+import sys
+import types
+
+import pytest
+
+from ai_fitness_backend import context
+from ai_fitness_backend.context import (
+    ContextStats,
+    build_context,
+    format_documents,
+    get_tokenizer,
+)
+
+
+def _nutrition_day(day, score=0.5):
+    text = (
+        f"Date: 2024-01-{day:02d}. Nutrition summary: Total calories: 1800.0, "
+        f"Protein: 90.0g, Carbs: 200.0g, Fat: 60.0g. Breakfast: Calories 400.0, "
+        f"Protein 20.0g, Carbs 50.0g, Fat 12.0g. Lunch: Calories 700.0, "
+        f"Protein 35.0g, Carbs 80.0g, Fat 24.0g. "
+    )
+    return {
+        "document": {"text": text, "type": "nutrition", "date": f"2024-01-{day:02d}"},
+        "similarity": score,
+        "score": score,
+    }
+
+
+def test_documents_within_budget_are_not_compacted():
+    docs = [_nutrition_day(day) for day in (1, 2, 3)]
+
+    text, stats = build_context(docs + docs[:1], budget=10_000)
+
+    assert text == format_documents(docs)
+    assert stats["tokens_saved"] > 0
+
+
+def test_saved_tokens_are_added_to_the_running_totals(monkeypatch):
+    monkeypatch.setattr(context, "context_stats", ContextStats())
+    docs = [_nutrition_day(day) for day in range(1, 8)]
+    full_tokens = build_context(docs, budget=10_000)[1]["tokens"]
+
+    _, stats = build_context(docs, budget=full_tokens - 1)
+
+    totals = context.context_stats.stats()
+    assert totals["contexts"] == 2
+    assert totals["compacted"] == 1
+    assert totals["tokens_saved"] == stats["tokens_saved"] > 0
+    assert 0 < totals["saved_rate"] < 1
+
+
+def test_documents_over_budget_are_compacted_into_tables():
+    docs = [_nutrition_day(day) for day in range(1, 8)]
+    full_tokens = build_context(docs, budget=10_000)[1]["tokens"]
+
+    text, stats = build_context(docs, budget=full_tokens - 1)
+
+    assert "Nutrition by day (Date | Calories" in text
+    assert "2024-01-01 | 1800.0 | 90.0 | 200.0 | 60.0" in text
+    assert "Breakfast" not in text
+    assert stats["tokens"] < full_tokens
+
+
+def test_table_shrunk_to_one_day_keeps_its_document():
+    docs = [
+        {
+            "document": {
+                "text": f"Date: 2024-01-0{day}. Measurement: Weight 8{day}.0 kg.",
+                "type": "measurement",
+                "date": f"2024-01-0{day}",
+            },
+            "similarity": 0.5,
+            "score": 0.5,
+        }
+        for day in (1, 2)
+    ]
+    one_day = build_context(docs[1:], budget=10_000)[1]["tokens"]
+
+    # Room for the latest day's document, but not for a two-day table
+    text, _ = build_context(docs, budget=one_day)
+
+    assert text == format_documents(docs[1:])
+
+
+@pytest.fixture
+def tokenizers(monkeypatch):
+    loads = []
+
+    def from_pretrained(model):
+        loads.append(model)
+        raise OSError(f"{model} is not available offline")
+
+    transformers = types.ModuleType("transformers")
+    transformers.AutoTokenizer = types.SimpleNamespace(from_pretrained=from_pretrained)
+    monkeypatch.setitem(sys.modules, "transformers", transformers)
+    monkeypatch.setattr(context, "TOKENIZER_MODELS", ["configured/model"])
+    monkeypatch.setattr(context, "_tokenizers", {})
+    return loads
+
+
+def test_tokenizer_is_only_loaded_for_configured_models(tokenizers):
+    assert get_tokenizer("someone/else") is None
+    assert tokenizers == []
+    assert "someone/else" not in context._tokenizers
+
+
+def test_tokenizer_load_failures_are_cached(tokenizers):
+    assert get_tokenizer("configured/model") is None
+    assert get_tokenizer("configured/model") is None
+    assert tokenizers == ["configured/model"]
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+from ai_fitness_backend.database import create_tables, text_hash
+from ai_fitness_backend.index import RetrievalIndex
+from ai_fitness_backend.users import DEFAULT_USER_ID
+
+# Tables as the first release created them, before incremental ingest and users
+LEGACY_SCHEMA = [
+    "CREATE TABLE documents (id INTEGER PRIMARY KEY, text TEXT, type VARCHAR, "
+    "date VARCHAR, created_at DATETIME)",
+    "CREATE TABLE embeddings (id INTEGER PRIMARY KEY, "
+    "document_id INTEGER REFERENCES documents(id), embedding BLOB, created_at DATETIME)",
+]
+LEGACY_DOCUMENTS = [
+    (1, "Date: 2024-01-01. Measurement: Weight 79.6 kg.", "measurement", "2024-01-01"),
+    (2, "Date: 2024-01-04. Measurement: Weight 80.1 kg.", "measurement", "2024-01-04"),
+]
+
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(text(statement))
+        for doc_id, doc_text, doc_type, doc_date in LEGACY_DOCUMENTS:
+            conn.execute(
+                text(
+                    "INSERT INTO documents (id, text, type, date) VALUES (:i, :t, :y, :d)"
+                ),
+                {"i": doc_id, "t": doc_text, "y": doc_type, "d": doc_date},
+            )
+            conn.execute(
+                text("INSERT INTO embeddings (document_id, embedding) VALUES (:i, :e)"),
+                {"i": doc_id, "e": np.ones(8, dtype=np.float32).tobytes()},
+            )
+    yield engine
+    engine.dispose()
+
+
+def test_create_tables_adds_and_backfills_content_hash(legacy_engine):
+    create_tables(legacy_engine)
+
+    columns = {c["name"] for c in inspect(legacy_engine).get_columns("documents")}
+    assert "content_hash" in columns
+    with legacy_engine.connect() as conn:
+        rows = conn.execute(
+            text("SELECT text, content_hash FROM documents ORDER BY id")
+        ).all()
+    assert [content_hash for _, content_hash in rows] == [
+        text_hash(doc_text) for doc_text, _ in rows
+    ]
+
+
+def test_create_tables_is_idempotent(legacy_engine):
+    create_tables(legacy_engine)
+    create_tables(legacy_engine)
+
+    assert "document_terms" in inspect(legacy_engine).get_table_names()
+
+
+def test_legacy_documents_belong_to_the_default_user(legacy_engine):
+    create_tables(legacy_engine)
+
+    with Session(bind=legacy_engine) as db:
+        snapshot = RetrievalIndex(DEFAULT_USER_ID).load(db)
+        other = RetrievalIndex("someone-else").load(db)
+
+    assert [doc["text"] for doc in snapshot.documents] == [
+        doc_text for _, doc_text, _, _ in LEGACY_DOCUMENTS
+    ]
+    assert other.documents == ()
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from ai_fitness_backend.database import Base, Document, Embedding
+from ai_fitness_backend.index import (
+    RetrievalIndex,
+    bump_generation,
+    current_generation,
+)
+
+USER_ID = "index-test"
+
+
+@pytest.fixture
+def db():
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    session = Session(bind=engine)
+    yield session
+    session.close()
+
+
+def _add_document(db, text, date):
+    document = Document(user_id=USER_ID, text=text, type="nutrition", date=date)
+    db.add(document)
+    db.flush()
+    embedding = np.random.default_rng(document.id).standard_normal(8)
+    db.add(
+        Embedding(
+            document_id=document.id, embedding=embedding.astype(np.float32).tobytes()
+        )
+    )
+    db.commit()
+
+
+def test_reload_publishes_a_new_snapshot(db):
+    _add_document(db, "Date: 2024-01-01. Total calories: 1800.", "2024-01-01")
+    _add_document(db, "Date: 2024-01-02. Total calories: 2100.", "2024-01-02")
+    bump_generation(db, USER_ID)
+    db.commit()
+    index = RetrievalIndex(USER_ID)
+
+    first = index.refresh(db)
+    assert len(first.documents) == 2
+    assert first.embeddings.shape == (2, 8)
+    assert not first.embeddings.flags.writeable
+    assert index.refresh(db) is first
+
+    _add_document(db, "Date: 2024-01-03. Total calories: 1950.", "2024-01-03")
+    bump_generation(db, USER_ID)
+    db.commit()
+    second = index.refresh(db)
+
+    assert second is not first
+    assert index.snapshot is second
+    assert len(second.documents) == 3
+    assert second.embeddings.shape == (3, 8)
+    assert second.version != first.version
+    # A reader still holding the old snapshot sees it unchanged
+    assert len(first.documents) == 2
+    assert first.embeddings.shape == (2, 8)
+    assert first.metadata.latest_date.isoformat() == "2024-01-02"
+
+
+def test_reload_follows_a_generation_bumped_by_another_worker(db):
+    _add_document(db, "Date: 2024-01-01. Total calories: 1800.", "2024-01-01")
+    bump_generation(db, USER_ID)
+    db.commit()
+    index = RetrievalIndex(USER_ID)
+    first = index.refresh(db)
+
+    # Another worker process stores a document and bumps the stored generation
+    other = Session(bind=db.get_bind())
+    _add_document(other, "Date: 2024-01-02. Total calories: 2100.", "2024-01-02")
+    bump_generation(other, USER_ID)
+    other.commit()
+    other.close()
+
+    assert current_generation(db, USER_ID) == 2
+    second = index.refresh(db)
+    assert second is not first
+    assert len(second.documents) == 2
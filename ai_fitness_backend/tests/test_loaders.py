@@ -0,0 +1,85 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from ai_fitness_backend import loaders
+from ai_fitness_backend.loaders import (
+    EXPORT_CACHE_DIR,
+    EXERCISE_SPEC,
+    GARMIN_SPEC,
+    NUTRITION_SPEC,
+)
+
+
+def _documents(make_processor, data_dir):
+    processor = make_processor(data_dir)
+    processor.load_data()
+    return processor.create_documents()
+
+
+def _jobs(data_dir):
+    return [
+        (
+            "nutrition",
+            os.path.join(
+                data_dir, "mfp", "Nutrition-Summary-2024-01-01-to-2024-01-04.csv"
+            ),
+            NUTRITION_SPEC,
+        ),
+        (
+            "exercise",
+            os.path.join(
+                data_dir, "mfp", "Exercise-Summary-2024-01-01-to-2024-01-04.csv"
+            ),
+            EXERCISE_SPEC,
+        ),
+        ("garmin", os.path.join(data_dir, "garmin", "Activities.csv"), GARMIN_SPEC),
+    ]
+
+
+class RecordingPool(ThreadPoolExecutor):
+    """Stands in for the process pool, recording that it was started"""
+
+    started = 0
+
+    def __init__(self, max_workers, mp_context=None):
+        RecordingPool.started += 1
+        super().__init__(max_workers=max_workers)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    RecordingPool.started = 0
+    monkeypatch.setattr(loaders, "ProcessPoolExecutor", RecordingPool)
+    monkeypatch.setattr(loaders, "INGEST_WORKERS", 4)
+    return RecordingPool
+
+
+def test_cached_exports_produce_identical_documents(make_processor, data_dir):
+    cold = _documents(make_processor, data_dir)
+    assert os.listdir(os.path.join(data_dir, EXPORT_CACHE_DIR))
+
+    warm = _documents(make_processor, data_dir)
+
+    assert warm == cold
+    # The meal left blank in the export renders the same way on both paths
+    assert any("nan: Calories 210.0" in doc["text"] for doc in cold)
+
+
+def test_small_exports_are_read_without_worker_processes(pool, data_dir):
+    frames = loaders.read_exports(_jobs(data_dir))
+
+    assert pool.started == 0
+    assert [len(frames[source]) for source in frames] == [1, 1, 1]
+
+
+def test_large_exports_are_read_in_worker_processes(pool, monkeypatch, data_dir):
+    sequential = loaders.read_exports(_jobs(data_dir))
+    monkeypatch.setattr(loaders, "INGEST_PARALLEL_MIN_MB", 0)
+
+    parallel = loaders.read_exports(_jobs(data_dir))
+
+    assert pool.started == 1
+    for source, frames in sequential.items():
+        assert frames[0].equals(parallel[source][0])
@@ -0,0 +1,91 @@
+import os
+import shutil
+
+# Documents the fixture exports in tests/data turn into, in order
+EXPECTED_DOCUMENTS = [
+    {
+        "text": "Date: 2024-01-01. Nutrition summary: Total calories: 1790.0, Protein: 73.8g, Carbs: 78.1g, Fat: 47.8g. Breakfast: Calories 420.0, Protein 24.1g, Carbs 48.0g, Fat 12.5g. Lunch: Calories 882.0, Protein 46.1g, Carbs 16.2g, Fat 3.5g. Dinner: Calories 488.0, Protein 3.6g, Carbs 13.9g, Fat 31.8g. ",
+        "type": "nutrition",
+        "date": "2024-01-01",
+    },
+    {
+        "text": "Date: 2024-01-02. Nutrition summary: Total calories: 1200.0, Protein: 70.0g, Carbs: 117.6g, Fat: 39.6g. Breakfast: Calories 350.0, Protein 20.0g, Carbs 40.5g, Fat 10.0g. nan: Calories 210.0, Protein 8.3g, Carbs 22.0g, Fat 7.2g. Dinner: Calories 640.0, Protein 41.7g, Carbs 55.1g, Fat 22.4g. ",
+        "type": "nutrition",
+        "date": "2024-01-02",
+    },
+    {
+        "text": "Date: 2024-01-04. Nutrition summary: Total calories: 675.0, Protein: 38.7g, Carbs: 65.1g, Fat: 27.9g. Lunch: Calories 515.0, Protein 33.2g, Carbs 50.3g, Fat 18.9g. Snacks: Calories 160.0, Protein 5.5g, Carbs 14.8g, Fat 9.0g. ",
+        "type": "nutrition",
+        "date": "2024-01-04",
+    },
+    {
+        "text": "Date: 2024-01-01. Exercise summary: Burned 416.0 calories, Exercised for 71.0 minutes, Steps: 6407.0. Activity: MFP iOS calorie adjustment, Duration: nan minutes, Calories: 64. Activity: Running, Duration: 71.0 minutes, Calories: 352. ",
+        "type": "exercise",
+        "date": "2024-01-01",
+    },
+    {
+        "text": "Date: 2024-01-02. Exercise summary: Burned 120.0 calories, Exercised for 30.0 minutes, Steps: 3200.0. Activity: Walking, Duration: 30.0 minutes, Calories: 120. ",
+        "type": "exercise",
+        "date": "2024-01-02",
+    },
+    {
+        "text": "Date: 2024-01-04. Exercise summary: Burned 188.0 calories, Exercised for 0.0 minutes, Steps: 0.0. Activity: MFP iOS calorie adjustment, Duration: nan minutes, Calories: 188. ",
+        "type": "exercise",
+        "date": "2024-01-04",
+    },
+    {
+        "text": "Date: 2024-01-01. Measurement: Weight 79.6 kg.",
+        "type": "measurement",
+        "date": "2024-01-01",
+    },
+    {
+        "text": "Date: 2024-01-04. Measurement: Weight 80.1 kg.",
+        "type": "measurement",
+        "date": "2024-01-04",
+    },
+    {
+        "text": "Date: 2024-01-02 07:16:00. Garmin activity: Cycling, Duration: 01:11:29, Calories: 1281, Distance: 16.06 km, Average HR: 109.0, Max HR: 176.0",
+        "type": "garmin",
+        "date": "2024-01-02 07:16:00",
+    },
+    {
+        "text": "Date: 2024-01-04 07:44:00. Garmin activity: Strength Training, Duration: 00:21:24, Calories: 1079",
+        "type": "garmin",
+        "date": "2024-01-04 07:44:00",
+    },
+    {
+        "text": "Nutrition summary for the entire period: Average daily calories: 1221.7, Average daily protein: 60.8g, Average daily carbs: 86.9g, Average daily fat: 38.4g.",
+        "type": "summary",
+        "date": "all",
+    },
+    {
+        "text": "Weight trend: Started at 79.6 kg and ended at 80.1 kg. Total change: 0.5 kg over the period.",
+        "type": "summary",
+        "date": "all",
+    },
+]
+
+
+def test_create_documents_from_exports(make_processor, data_dir):
+    processor = make_processor(data_dir)
+    processor.load_data()
+
+    assert processor.create_documents() == EXPECTED_DOCUMENTS
+
+
+def test_create_documents_with_missing_sources(make_processor, data_dir):
+    shutil.rmtree(os.path.join(data_dir, "garmin"))
+    os.remove(
+        os.path.join(
+            data_dir, "mfp", "Measurement-Summary-2024-01-01-to-2024-01-04.csv"
+        )
+    )
+    processor = make_processor(data_dir)
+    processor.load_data()
+
+    assert processor.create_documents() == [
+        doc
+        for doc in EXPECTED_DOCUMENTS
+        if doc["type"] not in ("garmin", "measurement")
+        and not doc["text"].startswith("Weight trend")
+    ]
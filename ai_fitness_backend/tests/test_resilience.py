@@ -0,0 +1,74 @@
+import pytest
+
+from ai_fitness_backend import llm, resilience
+from ai_fitness_backend.llm import LLMResponseError
+from ai_fitness_backend.resilience import CircuitBreaker
+
+
+@pytest.fixture
+def breakers(monkeypatch):
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(llm.time, "sleep", lambda seconds: None)
+    return resilience._breakers
+
+
+def _flaky(failures, status_code=503):
+    """A request that fails ``failures`` times before answering"""
+    calls = []
+
+    def send():
+        calls.append(None)
+        if len(calls) <= failures:
+            raise LLMResponseError(status_code, "Model is loading")
+        return "answer"
+
+    return send
+
+
+def test_retried_503s_that_succeed_are_not_failures(breakers, monkeypatch):
+    monkeypatch.setattr(resilience, "LLM_FALLBACK_MODEL", "fallback/model")
+    breaker = resilience.get_circuit_breaker("primary/model")
+
+    for _ in range(breaker.min_requests * 2):
+        assert llm._with_retries("primary/model", _flaky(2)) == "answer"
+
+    assert breaker.is_closed()
+    assert list(breaker._outcomes) == [True] * breaker.min_requests * 2
+
+
+def test_requests_failing_after_retries_open_the_circuit(breakers, monkeypatch):
+    monkeypatch.setattr(resilience, "LLM_FALLBACK_MODEL", "fallback/model")
+    breaker = resilience.get_circuit_breaker("primary/model")
+
+    for _ in range(breaker.min_requests):
+        with pytest.raises(LLMResponseError):
+            llm._with_retries("primary/model", _flaky(100, status_code=500))
+
+    assert breaker.state == "open"
+    assert resilience.route_model("primary/model") == ("fallback/model", None)
+
+
+def test_circuit_never_opens_without_a_fallback(breakers, monkeypatch):
+    monkeypatch.setattr(resilience, "LLM_FALLBACK_MODEL", "")
+    breaker = resilience.get_circuit_breaker("primary/model")
+
+    for _ in range(breaker.min_requests * 2):
+        with pytest.raises(LLMResponseError):
+            llm._with_retries("primary/model", _flaky(100))
+
+    assert breaker.is_closed()
+    assert resilience.route_model("primary/model") == ("primary/model", None)
+
+
+def test_half_open_trial_failure_reopens():
+    breaker = CircuitBreaker("model", min_requests=2, error_rate=0.5, cooldown=0)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    assert breaker.allow_request()
+    assert breaker.state == "half_open"
+    assert not breaker.allow_request()
+    breaker.record_failure()
+
+    assert breaker.state == "open"
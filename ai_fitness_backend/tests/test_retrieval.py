@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+from ai_fitness_backend import processor as processor_module
+from ai_fitness_backend.ann import IVFIndex
+from ai_fitness_backend.index import normalize_embeddings
+
+ACTIVITIES = ["Running", "Cycling", "Walking", "Swimming", "Strength Training"]
+
+
+@pytest.fixture
+def corpus_processor(make_processor, data_dir, monkeypatch):
+    """A processor holding a synthetic corpus, with queries embedded from a fixed table"""
+    rng = np.random.default_rng(0)
+    processor = make_processor(data_dir)
+    processor.documents = [
+        {
+            "text": f"Date: 2024-0{1 + i // 28}-{1 + i % 28:02d}. "
+            f"Garmin activity: {ACTIVITIES[i % len(ACTIVITIES)]}",
+            "type": "garmin" if i % 2 else "exercise",
+            "date": f"2024-0{1 + i // 28}-{1 + i % 28:02d}",
+        }
+        for i in range(200)
+    ]
+    processor.document_embeddings = normalize_embeddings(rng.standard_normal((200, 16)))
+
+    embeddings = {}
+
+    def encode_query(query):
+        if query not in embeddings:
+            embeddings[query] = normalize_embeddings(rng.standard_normal(16))
+        return embeddings[query]
+
+    monkeypatch.setattr(processor_module, "encode_query", encode_query)
+    monkeypatch.setattr(
+        processor_module,
+        "encode_queries",
+        lambda queries: np.stack([encode_query(query) for query in queries]),
+    )
+    return processor
+
+
+def test_results_report_cosine_similarity_and_fused_score(corpus_processor):
+    results = corpus_processor.retrieve_relevant_documents(
+        "How far did I go Cycling?", top_k=10
+    )
+    query_embedding = processor_module.encode_query("How far did I go Cycling?")
+
+    for result in results:
+        position = corpus_processor.documents.index(result["document"])
+        cosine = float(corpus_processor.document_embeddings[position] @ query_embedding)
+        assert result["similarity"] == pytest.approx(cosine, abs=1e-6)
+        assert -1 <= result["score"] <= 1
+    assert [r["score"] for r in results] == sorted(
+        (r["score"] for r in results), reverse=True
+    )
+    assert any(r["score"] != r["similarity"] for r in results)
+
+
+@pytest.mark.parametrize("query", ["How far did I go Cycling?", "Morning stretch"])
+def test_ann_path_scores_like_the_exact_path(corpus_processor, query):
+    exact = corpus_processor.retrieve_relevant_documents(query, top_k=5)
+
+    # A single list probed in full makes the ANN search exhaustive
+    ann = IVFIndex.build(
+        corpus_processor.document_embeddings, list(range(200)), nlist=1, nprobe=1
+    )
+    ann.embeddings = corpus_processor.document_embeddings
+    corpus_processor.ann_index = ann
+    approximate = corpus_processor.retrieve_relevant_documents(query, top_k=5)
+
+    assert approximate == exact
+
+
+BATCH_QUERIES = [
+    "How far did I go Cycling?",
+    "Strength Training last week",
+    "Walking in the last 10 days",
+    "Morning stretch",
+    "Swimming this month",
+    "Running",
+] * 4
+
+
+def _assert_same_results(batch, single):
+    assert len(batch) == len(single)
+    for batch_results, single_results in zip(batch, single):
+        assert [r["document"] for r in batch_results] == [
+            r["document"] for r in single_results
+        ]
+        for b, s in zip(batch_results, single_results):
+            assert b["similarity"] == pytest.approx(s["similarity"], abs=1e-5)
+            assert b["score"] == pytest.approx(s["score"], abs=1e-5)
+
+
+@pytest.mark.parametrize("types", [None, ["garmin"]])
+def test_batch_matches_single_queries(corpus_processor, types):
+    batch = corpus_processor.retrieve_relevant_documents_batch(
+        BATCH_QUERIES, top_k=5, types=types
+    )
+    single = [
+        corpus_processor.retrieve_relevant_documents(query, top_k=5, types=types)
+        for query in BATCH_QUERIES
+    ]
+
+    _assert_same_results(batch, single)
+
+
+def test_batch_matches_single_queries_with_ann(corpus_processor):
+    ann = IVFIndex.build(
+        corpus_processor.document_embeddings, list(range(200)), nlist=8, nprobe=2
+    )
+    ann.embeddings = corpus_processor.document_embeddings
+    corpus_processor.ann_index = ann
+
+    batch = corpus_processor.retrieve_relevant_documents_batch(BATCH_QUERIES, top_k=5)
+    single = [
+        corpus_processor.retrieve_relevant_documents(query, top_k=5)
+        for query in BATCH_QUERIES
+    ]
+
+    _assert_same_results(batch, single)
@@ -0,0 +1,89 @@
+from ai_fitness_backend.llm import extract_structured_response, format_prompt
+from ai_fitness_backend.sections import SectionParser, parse_response
+
+CONTEXT = (
+    "Based on the following fitness and nutrition data:\n\n"
+    "1. Date: 2024-01-15. Nutrition summary: Total calories: 1416.0, "
+    "Protein: 152.3g, Carbs: 196.9g, Fat: 86.5g.\n"
+    "2. Date: 2024-01-15. Exercise summary: Burned 339.0 calories, "
+    "Exercised for 45.0 minutes, Steps: 1130.0.\n"
+)
+
+ANSWER = """OBSERVATIONS:
+- Protein was high on 2024-01-15
+- You ran for 45 minutes
+
+DIETARY SUGGESTIONS:
+- Keep protein around 150g
+
+SUMMARY:
+A solid day of eating and training.
+"""
+
+
+def test_sections_of_a_plain_answer():
+    parser = parse_response(ANSWER)
+
+    assert parser.to_dict() == {
+        "observations": ["Protein was high on 2024-01-15", "You ran for 45 minutes"],
+        "dietary_suggestions": ["Keep protein around 150g"],
+        "summary": "A solid day of eating and training.",
+    }
+    assert not parser.echoed
+
+
+def test_echoed_prompt_with_summary_context_is_skipped():
+    text = format_prompt(CONTEXT, "How did I do on 2024-01-15?") + "\n" + ANSWER
+
+    parser = parse_response(text)
+
+    assert parser.echoed
+    assert parser.to_dict()["summary"] == "A solid day of eating and training."
+    assert parser.to_dict()["observations"][0] == "Protein was high on 2024-01-15"
+    assert extract_structured_response(text) == ANSWER
+
+
+def test_context_summaries_are_not_headers():
+    text = CONTEXT + "\n" + ANSWER
+
+    parser = parse_response(text)
+
+    assert parser.response == ANSWER
+    assert "Nutrition summary" not in parser.sections["SUMMARY"]
+
+
+def test_streamed_chunks_match_a_single_pass():
+    text = format_prompt(CONTEXT, "How did I do on 2024-01-15?") + "\n" + ANSWER
+    parser = SectionParser()
+    streamed = []
+    for start in range(0, len(text), 7):
+        streamed += parser.feed(text[start : start + 7])
+    streamed += parser.close()
+
+    assert [name for name, _ in streamed] == [
+        "OBSERVATIONS",
+        "DIETARY SUGGESTIONS",
+        "SUMMARY",
+    ]
+    assert parser.to_dict() == parse_response(text).to_dict()
+    assert parser.response == ANSWER
+
+
+def test_bold_headers():
+    parser = parse_response("**OBSERVATIONS:**\n- Ate well\n**SUMMARY:**\nGood")
+
+    assert parser.to_dict()["observations"] == ["Ate well"]
+    assert parser.to_dict()["summary"] == "Good"
+
+
+def test_title_case_headers():
+    parser = parse_response(
+        "Observations:\n- Ate well\n\n**Dietary Suggestions:**\n- More fibre\n\n"
+        "**Summary:**\nGood"
+    )
+
+    assert parser.to_dict() == {
+        "observations": ["Ate well"],
+        "dietary_suggestions": ["More fibre"],
+        "summary": "Good",
+    }